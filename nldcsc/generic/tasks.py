@@ -0,0 +1,98 @@
+import asyncio
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    TypeVar,
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def _aiter(items: Iterable[T] | AsyncIterable[T]) -> AsyncIterator[T]:
+    if isinstance(items, AsyncIterable):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def _anext(items: AsyncIterator[T]) -> tuple[bool, T | None]:
+    try:
+        return True, await anext(items)
+    except StopAsyncIteration:
+        return False, None
+
+
+async def _call(func: Callable[[T], Awaitable[R]], item: T) -> tuple[T, R | Exception]:
+    try:
+        return item, await func(item)
+    except Exception as err:
+        return item, err
+
+
+async def iter_completed(
+    items: Iterable[T] | AsyncIterable[T],
+    func: Callable[[T], Awaitable[R]],
+    concurrency: int,
+) -> AsyncIterator[tuple[T, R | Exception]]:
+    """
+    Await func for every item with at most concurrency calls in flight, yielding the results as they complete.
+
+    Items are taken as slots free up, so large (or async) iterables are never materialised. The next item
+    is awaited alongside the calls in flight, so an async iterable that is fed from the results (e.g. a
+    queue) does not stall them. Calls still in flight are cancelled when the iterator is closed.
+
+    Args:
+        items (Iterable[T] | AsyncIterable[T]): items to call func with.
+        func (Callable[[T], Awaitable[R]]): coroutine function to await per item.
+        concurrency (int): calls in flight.
+
+    Yields:
+        tuple[T, R | Exception]: the item and the result of func, or the exception it raised.
+    """
+    concurrency = max(concurrency, 1)
+    source = _aiter(items)
+    in_flight: set[asyncio.Future] = set()
+    next_item: asyncio.Future | None = None
+    exhausted = False
+
+    try:
+        while True:
+            if next_item is None and not exhausted and len(in_flight) < concurrency:
+                next_item = asyncio.ensure_future(_anext(source))
+
+            waiting = in_flight if next_item is None else in_flight | {next_item}
+
+            if not waiting:
+                return
+
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+            if next_item in done:
+                done.discard(next_item)
+                found, item = next_item.result()
+                next_item = None
+
+                if found:
+                    in_flight.add(asyncio.ensure_future(_call(func, item)))
+                else:
+                    exhausted = True
+
+            for task in done:
+                in_flight.discard(task)
+                yield task.result()
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+        if next_item is not None:
+            next_item.cancel()
+            # the source can only be closed once the pending read stopped
+            await asyncio.wait([next_item])
+
+        await source.aclose()
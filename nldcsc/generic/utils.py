@@ -1,10 +1,13 @@
 import ast
 import collections
+import functools
 import json
 import os
 import secrets
 import string
 from json import JSONDecodeError
+from types import MappingProxyType
+from typing import Mapping
 
 __MANDATORY_VALUE__ = "<<MANDATORY_VALUE>>"
 
@@ -118,21 +121,46 @@ def generate_random_password():
     return pwd
 
 
+@functools.lru_cache(maxsize=256)
+def _reverse_index(
+    n_type: type, n_tuple: tuple, lowercase_output: bool
+) -> MappingProxyType:
+    # keyed on the type as well; namedtuples with equal values compare equal
+    return MappingProxyType(
+        {
+            value: name.lower() if lowercase_output else name
+            for name, value in zip(n_tuple._fields, n_tuple)
+        }
+    )
+
+
+def reverse_index(
+    n_tuple: collections.namedtuple, lowercase_output: bool = False
+) -> Mapping:
+    """
+    Read only map of the values of a namedtuple to their field names; built once per namedtuple.
+
+    Args:
+        n_tuple: namedtuple instance, e.g. a tuple of constants.
+        lowercase_output: return the field names in lowercase.
+
+    Returns:
+        The map of values to field names
+    """
+    return _reverse_index(type(n_tuple), n_tuple, lowercase_output)
+
+
 def reverse_from_named_tuple(
     n_tuple: collections.namedtuple, index: int | str, lowercase_output: bool = False
 ) -> str:
-    n_list = [
-        x.lower() if lowercase_output else x
-        for x in n_tuple.__dir__()
-        if not x.startswith("_") and x not in ["index", "count"]
-    ]
-
-    n_rev_types = {getattr(n_tuple, x.upper()): x for x in n_list}
+    n_rev_types = reverse_index(n_tuple, lowercase_output)
 
     try:
         return n_rev_types[index]
     except KeyError:
-        raise KeyError(f"The requested index does not exist! Choices are {n_rev_types}")
+        raise KeyError(
+            f"The requested index does not exist! Choices are {dict(n_rev_types)}"
+        )
 
 
 def exclude_optional_dict(value):
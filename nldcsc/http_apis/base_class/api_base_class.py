@@ -1,14 +1,59 @@
 import io
 import json
+import os
+import threading
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from contextvars import ContextVar, copy_context
 from json import JSONDecodeError
-from typing import Any
+from typing import Any, BinaryIO, Callable, Iterable, Iterator
+from urllib.parse import urlparse
 
 import requests
+import urllib3
 from requests import Response
 from requests.adapters import HTTPAdapter, Retry
 from requests_toolbelt import MultipartEncoder
 
+from nldcsc.http_apis.base_class.rate_limit import RateLimiter
+from nldcsc.http_apis.base_class.transfer import (
+    DEFAULT_CHUNK_SIZE,
+    StreamReader,
+    TransferHasher,
+    TransferResult,
+    iter_hashed,
+)
+
+
+class HostSlots:
+    def __init__(self, limits: int | dict[str, int]):
+        """
+        Per host semaphores capping the amount of concurrent requests.
+
+        Args:
+            limits (int | dict[str, int]): limit for every host or a mapping of host (netloc) to limit; hosts
+                missing from the mapping are not limited.
+        """
+        self.limits = limits
+        self.semaphores: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, host: str):
+        limit = self.limits if isinstance(self.limits, int) else self.limits.get(host)
+
+        if limit is None:
+            return nullcontext()
+
+        with self._lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(limit)
+
+            return self.semaphores[host]
+
+
+_host_slots: ContextVar[HostSlots | None] = ContextVar("host_slots", default=None)
+
 
 class ApiBaseClass(object):
     """
@@ -21,10 +66,23 @@ class ApiBaseClass(object):
         api_path: str = None,
         proxies: dict = None,
         user_agent: str = "ApiBaseClass",
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        rate_limiter: RateLimiter = None,
+        rate_limit_retries: int = 3,
         **kwargs,
     ):
         """
         The Generic api caller handles all communication towards an api resource.
+
+        Every thread lazily creates its own session, as a requests.Session is not thread safe, and reuses it
+        for its calls; the sessions share one adapter and so its connection pools, which keep connections
+        alive between requests. pool_connections and pool_maxsize configure these pools. Cookies are kept
+        per thread. Call close() or use the instance as context manager to release the connections.
+
+        When a rate_limiter is given every request first takes a token from the bucket returned by
+        rate_limit_key (the host by default) and the limiter adapts to the rate limit headers of the
+        responses; 429 responses are retried up to rate_limit_retries times once the bucket allows it.
         """
 
         if "verify" not in kwargs:
@@ -44,6 +102,19 @@ class ApiBaseClass(object):
 
         self.myheaders = self.__default_headers
 
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._local = threading.local()
+        self._adapters: dict[str, HTTPAdapter] | None = None
+        self._sessions: list[requests.Session] = []
+        self._session_lock = threading.Lock()
+
+        self.rate_limiter = rate_limiter
+        self.rate_limit_retries = rate_limit_retries
+
+        if self.verify is False:
+            urllib3.disable_warnings(category=urllib3.exceptions.InsecureRequestWarning)
+
     def __repr__(self) -> str:
         """return a string representation of the obj GenericApi"""
         return f"<<{self.__class__.__name__}: {self.baseurl}>>"
@@ -57,29 +128,88 @@ class ApiBaseClass(object):
         else:
             return f"{self.baseurl}/{self.api_path}/{resource}"
 
+    def rate_limit_key(self, url: str) -> str:
+        """
+        Method returning the rate limiter bucket key for a url; override to limit per api key instead of per host
+        """
+        return urlparse(url).netloc
+
+    def _send(
+        self, session: requests.Session, method: str, url: str, **kwargs
+    ) -> Response:
+        """
+        Internal method to send a request, holding a per host slot when running in call_batch
+        """
+        if (slots := _host_slots.get()) is not None:
+            with slots(urlparse(url).netloc):
+                return self._send_limited(session, method, url, **kwargs)
+
+        return self._send_limited(session, method, url, **kwargs)
+
+    def _send_limited(
+        self, session: requests.Session, method: str, url: str, **kwargs
+    ) -> Response:
+        """
+        Internal method to send a request through the rate limiter, if any
+        """
+        if self.rate_limiter is None:
+            return getattr(session, method.lower())(url, **kwargs)
+
+        key = self.rate_limit_key(url)
+        # streamed bodies can only be sent once
+        replayable = not isinstance(
+            kwargs.get("data"), (io.IOBase, MultipartEncoder, StreamReader, Iterator)
+        )
+
+        for attempt in range(self.rate_limit_retries + 1):
+            self.rate_limiter.acquire(key)
+
+            r = getattr(session, method.lower())(url, **kwargs)
+
+            self.rate_limiter.observe(key, r)
+
+            if (
+                r.status_code != 429
+                or not replayable
+                or attempt == self.rate_limit_retries
+            ):
+                return r
+
+            r.close()
+
     def _connect(
         self,
         method: str,
         resource: str,
         session: requests.Session,
-        data: dict | list | str | bytes | io.TextIOBase = None,
+        data: dict | list | str | bytes | io.IOBase | Iterator[bytes] = None,
         timeout: int = 60,
         return_response_object: bool = False,
         stream: bool = False,
         ignore_api_path: bool = False,
         files: dict = None,
+        headers: dict = None,
     ) -> Response | str | Any:
         """
         Send a request
 
         Send a request to api host based on the specified data. Specify the content type as JSON and
-        convert the data to JSON format.
+        convert the data to JSON format. When files are given the data is sent as multipart form fields
+        instead; headers are merged over the default headers for this request only.
         """
+        request_headers = self.myheaders
+
+        if files is not None and request_headers is not None:
+            # requests sets the multipart content type with its boundary
+            request_headers = {
+                k: v for k, v in request_headers.items() if k.lower() != "content-type"
+            }
 
-        requests.packages.urllib3.disable_warnings()
+        if headers:
+            request_headers = {**(request_headers or {}), **headers}
 
         request_api_resource = {
-            "headers": self.myheaders,
+            "headers": request_headers,
             "verify": self.verify,
             "timeout": timeout,
             "proxies": self.proxies,
@@ -92,6 +222,12 @@ class ApiBaseClass(object):
                         f"'data' type for {method} must be dict, bytes or a list of tuples."
                     )
                 request_api_resource["params"] = data
+            elif files is not None:
+                if not isinstance(data, (dict, list)):
+                    raise TypeError(
+                        "'data' type with 'files' must be a dict or a list of tuples."
+                    )
+                request_api_resource["data"] = data
             else:
                 if isinstance(data, dict):
                     try:
@@ -108,10 +244,10 @@ class ApiBaseClass(object):
                             raise TypeError(
                                 "Dict provided to list in 'data' is not json serializable."
                             )
-                elif isinstance(data, MultipartEncoder):
-                    # Passing form silently....
+                elif isinstance(data, (MultipartEncoder, StreamReader, Iterator)):
+                    # Passing streamed bodies silently....
                     pass
-                elif not isinstance(data, (str, list, bytes, io.TextIOBase)):
+                elif not isinstance(data, (str, list, bytes, io.IOBase)):
                     raise TypeError(
                         f"'data' type for {method} must be str, dict, bytes, file-like or a list of tuples."
                     )
@@ -122,10 +258,11 @@ class ApiBaseClass(object):
 
         if files is not None:
             request_api_resource["files"] = files
-            request_api_resource["data"] = json.loads(request_api_resource["data"])
 
         try:
-            r = getattr(session, method.lower())(
+            r = self._send(
+                session,
+                method,
                 self._build_url(resource, ignore_api_path),
                 stream=stream,
                 **request_api_resource,
@@ -172,8 +309,12 @@ class ApiBaseClass(object):
         session=None,
     ) -> requests.Session:
         """
-        Method for returning a session object per every requesting thread
+        Method for creating a new session object; calls reuse the session returned by the session property
         """
+        if self.rate_limiter is not None:
+            # throttled requests are retried by _send which honours the rate limit headers
+            status_forcelist = tuple(c for c in status_forcelist if c != 429)
+
         session = session or requests.Session()
         retry = Retry(
             total=retries,
@@ -182,12 +323,65 @@ class ApiBaseClass(object):
             backoff_factor=backoff_factor,
             status_forcelist=status_forcelist,
         )
-        adapter = HTTPAdapter(max_retries=retry)
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=retry,
+        )
         session.mount("http://", adapter)
         session.mount("https://", adapter)
 
         return session
 
+    @property
+    def session(self) -> requests.Session:
+        """
+        Property returning the persistent session of the current thread; created on first use with the
+        adapters (and connection pools) of the first session
+        """
+        session = getattr(self._local, "session", None)
+
+        if session is None:
+            with self._session_lock:
+                if self._adapters is None:
+                    session = self.get_session()
+                    self._adapters = dict(session.adapters)
+                else:
+                    session = requests.Session()
+
+                    for prefix, adapter in self._adapters.items():
+                        session.mount(prefix, adapter)
+
+                self._sessions.append(session)
+                self._local.session = session
+
+        return session
+
+    def close(self):
+        """
+        Method to close the persistent sessions and their connection pools
+        """
+        with self._session_lock:
+            for session in self._sessions:
+                session.close()
+
+            self._sessions = []
+            self._adapters = None
+            self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            # a partially initialised instance or interpreter shutdown
+            pass
+
     def call(
         self,
         method: str = None,
@@ -203,24 +397,267 @@ class ApiBaseClass(object):
         Method for requesting free format api resources
         """
         try:
-            with self.get_session() as session:
-                result = self._connect(
-                    method=method,
-                    resource=resource,
-                    session=session,
-                    data=data,
-                    timeout=timeout,
-                    return_response_object=return_response_object,
-                    stream=stream,
-                    ignore_api_path=ignore_api_path,
-                    files=files,
-                )
-                return result
+            result = self._connect(
+                method=method,
+                resource=resource,
+                session=self.session,
+                data=data,
+                timeout=timeout,
+                return_response_object=return_response_object,
+                stream=stream,
+                ignore_api_path=ignore_api_path,
+                files=files,
+            )
+            return result
         except requests.ConnectionError:
             raise
         except Exception:
             raise
 
+    def _batch_item(self, item: dict | tuple | Callable) -> Any:
+        if callable(item):
+            return item()
+
+        if isinstance(item, dict):
+            return self.call(**item)
+
+        return self.call(*item)
+
+    def call_batch(
+        self,
+        calls: Iterable[dict | tuple | Callable],
+        concurrency: int = 8,
+        per_host: int | dict[str, int] = None,
+        return_exceptions: bool = True,
+    ) -> list[Any]:
+        """
+        Run many calls concurrently on a thread pool; the threads share the connection pools.
+
+        Every item is either a dict of keyword arguments or a tuple of positional arguments for call, or a
+        callable without arguments (e.g. functools.partial(client.get_ticket, ticket_id)) so methods of
+        subclasses can be batched as well. Keep concurrency at or below pool_maxsize, extra connections
+        are not kept alive.
+
+        Args:
+            calls (Iterable[dict | tuple | Callable]): calls to run.
+            concurrency (int, optional): amount of calls running at the same time. Defaults to 8.
+            per_host (int | dict[str, int], optional): maximum amount of concurrent requests per host, or per
+                host (netloc) in a mapping. Defaults to None.
+            return_exceptions (bool, optional): return exceptions in place of their results instead of raising
+                the first one. Defaults to True.
+
+        Returns:
+            list[Any]: results (or exceptions) in the order of the calls.
+        """
+        calls = list(calls)
+
+        if not calls:
+            return []
+
+        token = _host_slots.set(HostSlots(per_host)) if per_host else None
+
+        try:
+            with ThreadPoolExecutor(
+                max_workers=max(min(concurrency, len(calls)), 1),
+                thread_name_prefix=self.__class__.__name__,
+            ) as pool:
+                # every item needs its own copy of the context to run in
+                futures = [
+                    pool.submit(copy_context().run, self._batch_item, item)
+                    for item in calls
+                ]
+
+                results = []
+
+                for future in futures:
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        if not return_exceptions:
+                            for f in futures:
+                                f.cancel()
+                            raise
+
+                        results.append(e)
+
+                return results
+        finally:
+            if token is not None:
+                _host_slots.reset(token)
+
+    def download_to(
+        self,
+        resource: str,
+        destination: str | os.PathLike | BinaryIO,
+        method: str = "GET",
+        data: dict = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        progress: Callable[[int, int | None], Any] = None,
+        algorithms: Iterable[str] = ("sha256",),
+        timeout: int = 60,
+        ignore_api_path: bool = False,
+    ) -> TransferResult:
+        """
+        Stream a response body to a file without holding it in memory.
+
+        A path is written to '<path>.part' first and moved in place once the download is complete.
+
+        Args:
+            resource (str): resource to download.
+            destination (str | os.PathLike | BinaryIO): path or binary file object to write to.
+            method (str, optional): http method. Defaults to "GET".
+            data (dict, optional): query parameters. Defaults to None.
+            chunk_size (int, optional): size of the chunks to read. Defaults to DEFAULT_CHUNK_SIZE.
+            progress (Callable[[int, int | None], Any], optional): called with the written and total bytes after every chunk. Defaults to None.
+            algorithms (Iterable[str], optional): hashlib algorithms to compute while writing. Defaults to ("sha256",).
+            timeout (int, optional): request timeout. Defaults to 60.
+            ignore_api_path (bool, optional): do not prefix the resource with the api path. Defaults to False.
+
+        Raises:
+            requests.exceptions.ConnectionError: when the server returns an error status.
+
+        Returns:
+            TransferResult: amount of bytes written and their digests.
+        """
+        r = self._connect(
+            method=method,
+            resource=resource,
+            session=self.session,
+            data=data,
+            timeout=timeout,
+            stream=True,
+            ignore_api_path=ignore_api_path,
+        )
+
+        with r:
+            if r.status_code >= 400:
+                raise requests.exceptions.ConnectionError(r.text, response=r)
+
+            total = r.headers.get("Content-Length")
+            # iter_content decodes compressed bodies, the content length is that of the encoded body
+            if total is not None and "Content-Encoding" not in r.headers:
+                total = int(total)
+            else:
+                total = None
+
+            hasher = TransferHasher(algorithms, progress, total)
+
+            if hasattr(destination, "write"):
+                for chunk in r.iter_content(chunk_size):
+                    hasher.update(chunk)
+                    destination.write(chunk)
+
+                return hasher.result()
+
+            part = f"{os.fspath(destination)}.part"
+
+            try:
+                with open(part, "wb") as f:
+                    for chunk in r.iter_content(chunk_size):
+                        hasher.update(chunk)
+                        f.write(chunk)
+
+                os.replace(part, destination)
+            except BaseException:
+                if os.path.exists(part):
+                    os.remove(part)
+                raise
+
+        return hasher.result()
+
+    def upload_stream(
+        self,
+        resource: str,
+        body: str | os.PathLike | BinaryIO | Iterable[bytes],
+        method: str = "POST",
+        fields: dict = None,
+        file_field: str = "file",
+        filename: str = None,
+        content_type: str = "application/octet-stream",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        progress: Callable[[int, int | None], Any] = None,
+        algorithms: Iterable[str] = ("sha256",),
+        timeout: int = 60,
+        ignore_api_path: bool = False,
+    ) -> TransferResult:
+        """
+        Upload a body in chunks without reading it into memory.
+
+        When fields or a filename are given the body is sent as a file in a streamed multipart form,
+        otherwise as raw request body (for paths and file objects alike). Iterables of chunks are sent
+        with chunked transfer encoding and can not be used for multipart uploads.
+
+        Args:
+            resource (str): resource to upload to.
+            body (str | os.PathLike | BinaryIO | Iterable[bytes]): path, binary file object or iterable of chunks.
+            method (str, optional): http method. Defaults to "POST".
+            fields (dict, optional): additional multipart form fields. Defaults to None.
+            file_field (str, optional): form field of the file in a multipart upload. Defaults to "file".
+            filename (str, optional): filename in a multipart upload. Defaults to the name of the file.
+            content_type (str, optional): content type of the body. Defaults to "application/octet-stream".
+            chunk_size (int, optional): size of the chunks to send. Defaults to DEFAULT_CHUNK_SIZE.
+            progress (Callable[[int, int | None], Any], optional): called with the sent and total bytes after every chunk. Defaults to None.
+            algorithms (Iterable[str], optional): hashlib algorithms to compute while sending. Defaults to ("sha256",).
+            timeout (int, optional): request timeout. Defaults to 60.
+            ignore_api_path (bool, optional): do not prefix the resource with the api path. Defaults to False.
+
+        Raises:
+            TypeError: when an iterable is used for a multipart upload.
+
+        Returns:
+            TransferResult: amount of bytes sent, their digests and the response as returned by call.
+        """
+        if isinstance(body, (str, os.PathLike)):
+            with open(body, "rb") as f:
+                return self.upload_stream(
+                    resource,
+                    f,
+                    method,
+                    fields,
+                    file_field,
+                    filename,
+                    content_type,
+                    chunk_size,
+                    progress,
+                    algorithms,
+                    timeout,
+                    ignore_api_path,
+                )
+
+        hasher = TransferHasher(algorithms, progress)
+
+        if hasattr(body, "read"):
+            data = StreamReader(body, hasher, chunk_size)
+        elif fields is not None or filename is not None:
+            raise TypeError("Multipart uploads require a path or file object as body.")
+        else:
+            data = iter_hashed(body, hasher)
+
+        if fields is not None or filename is not None:
+            data = MultipartEncoder(
+                fields={
+                    **(fields or {}),
+                    file_field: (
+                        filename or os.path.basename(getattr(body, "name", file_field)),
+                        data,
+                        content_type,
+                    ),
+                }
+            )
+            content_type = data.content_type
+
+        result = self._connect(
+            method=method,
+            resource=resource,
+            session=self.session,
+            data=data,
+            timeout=timeout,
+            ignore_api_path=ignore_api_path,
+            headers={"Content-Type": content_type},
+        )
+
+        return hasher.result(result)
+
     @property
     def __default_headers(self):
         """
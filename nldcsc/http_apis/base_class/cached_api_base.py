@@ -0,0 +1,208 @@
+import logging
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Generic, TypeVar
+
+S = TypeVar("S")
+
+
+class CachedAPIBase(Generic[S]):
+    """
+    Headers, request options, urls and the lru session store shared by CachedAPI (requests) and
+    AsyncCachedAPI (httpx); subclasses create, close and call the sessions.
+
+    Subclasses set baseurl, api_path, user_agent, max_sessions, sessions, headers and logger, and define
+    their own _request_kwargs context variable.
+    """
+
+    methods = namedtuple("methods", ("GET", "POST", "DELETE", "PUT", "PATCH"))(
+        "get", "post", "delete", "put", "patch"
+    )
+    _request_kwargs: ContextVar[dict]
+
+    baseurl: str
+    api_path: str | None
+    user_agent: str
+    max_sessions: int
+    sessions: OrderedDict[str, S]
+    headers: dict
+    logger: logging.Logger
+
+    @property
+    def default_headers(self):
+        """
+        Default headers of this class.
+
+        Returns:
+            dict: dict containing http headers
+        """
+        return {
+            "User-Agent": f"{self.user_agent}",
+        }
+
+    def set_header(self, key: str, value: str):
+        """
+        Set a header key to a value.
+
+        Args:
+            key (str): http header to set.
+            value (str): value of http header.
+        """
+        self.headers[key] = value
+
+    def del_header(self, key: str):
+        """
+        Remove a header.
+
+        Args:
+            key (str): http header to remove.
+        """
+        self.headers.pop(key, None)
+
+    def reset_headers(self):
+        """
+        Reset headers to the default defined in default_headers.
+        """
+        self.headers = self.default_headers
+
+    def clear_headers(self):
+        """
+        Clear all headers.
+        """
+        self.headers = {}
+
+    @contextmanager
+    def override_request_options(self, **kwargs):
+        """
+        Context manager to override the default kwargs handed to the request.
+
+        Priority order (low->high) in case of duplicate kwargs:
+            1. self.request_kwargs
+            2. this override
+            3. kwargs handed to self.call
+        """
+        try:
+            t = self._request_kwargs.set(kwargs)
+            yield
+        finally:
+            self._request_kwargs.reset(t)
+
+    @contextmanager
+    def bypass_cache(self):
+        """
+        Context manager to bypass the cache for every request made.
+        """
+        with self.override_request_options(headers={"Cache-Control": "no-cache"}):
+            yield
+
+    def request_options(self, defaults: dict, kwargs: dict) -> dict:
+        """
+        Merge the kwargs of a request in the priority order of override_request_options; headers are merged
+        on top of the headers of this object.
+
+        Args:
+            defaults (dict): kwargs passed to every request.
+            kwargs (dict): kwargs handed to self.call.
+
+        Returns:
+            dict: kwargs of the request.
+        """
+        options = {
+            **defaults,
+            **self._request_kwargs.get({}),
+            **kwargs,
+        }
+        options["headers"] = {
+            **self.headers,
+            **(options.get("headers") or {}),
+        }
+
+        return options
+
+    @staticmethod
+    def create_session_key(backend, **kwargs):
+        """
+        Creates a unique key that describes a session and its kwargs.
+
+        The unique consists of the backend (or storage) settings and session kwargs.
+
+        Args:
+            backend (Any): cache backend or storage that is used.
+
+        Returns:
+            str: unique key describing this session
+        """
+
+        return f"{backend}:{kwargs}"
+
+    def stored_session(self, key: str) -> S | None:
+        """
+        Get a session from the session store, marking it as most recently used.
+
+        Args:
+            key (str): session key.
+
+        Returns:
+            S | None: the stored session, if any.
+        """
+        try:
+            self.sessions.move_to_end(key)
+        except KeyError:
+            return None
+
+        return self.sessions.get(key)
+
+    def store_session(self, key: str, session: S) -> list[S]:
+        """
+        Store a session in the session store, evicting the least recently used ones if max_sessions is exceeded.
+
+        Args:
+            key (str): session key.
+            session (S): session to store.
+
+        Returns:
+            list[S]: the replaced and evicted sessions, which the caller closes.
+        """
+        self.logger.debug(f"Persisting session {session=} for {key=}")
+
+        closing = []
+
+        if current := self.sessions.pop(key, None):
+            self.logger.debug(f"Closing session {current=} due to replacement")
+            closing.append(current)
+
+        self.sessions[key] = session
+
+        while len(self.sessions) > self.max_sessions:
+            oldest_key, oldest = self.sessions.popitem(False)
+            self.logger.debug(
+                f"Closing session {oldest=} for {oldest_key=} due to exceeding {self.max_sessions=}"
+            )
+            closing.append(oldest)
+
+        return closing
+
+    def build_url(self, resource: str | None, ignore_api_path: bool = False):
+        """
+        Build a resource url using the baseurl, api path and resource.
+
+        Args:
+            resource (str | None): resource to create an url for.
+            ignore_api_path (bool, optional): ignore the default api path set. Defaults to False.
+
+        Returns:
+            str: complete api path to call.
+        """
+        if resource:
+            resource = resource.removeprefix("/")
+
+        url = self.baseurl
+
+        if self.api_path and not ignore_api_path:
+            url += f"/{self.api_path}"
+
+        if resource:
+            url += f"/{resource}"
+
+        return url
@@ -1,17 +1,17 @@
 import logging
-from collections import OrderedDict, namedtuple
+from collections import OrderedDict
 from contextlib import contextmanager
 from contextvars import ContextVar
 from functools import partial
+from threading import RLock
 from typing import (
-    TYPE_CHECKING,
     Any,
     Callable,
     Concatenate,
     ParamSpec,
     TypeVar,
+    Iterator,
     Optional,
-    Unpack,
 )
 from uuid import uuid4
 
@@ -19,11 +19,11 @@ from uuid import uuid4
 import urllib3
 from requests import JSONDecodeError, Response
 from requests.adapters import HTTPAdapter, Retry
-from requests_cache import CachedSession
+from requests_cache import DO_NOT_CACHE, CachedSession
 from requests_cache.backends import BaseCache, SQLiteCache
 
-if TYPE_CHECKING:
-    from requests._types import RequestKwargs
+from nldcsc.http_apis.base_class.cached_api_base import CachedAPIBase
+from nldcsc.http_apis.base_class.json_stream import iter_json_array
 
 P = ParamSpec("P")
 R = TypeVar("R")
@@ -37,10 +37,7 @@ def signature_of(_: Callable[P, Any]):
     return wrapper
 
 
-class CachedAPI:
-    methods = namedtuple("methods", ("GET", "POST", "DELETE", "PUT", "PATCH"))(
-        "get", "post", "delete", "put", "patch"
-    )
+class CachedAPI(CachedAPIBase[CachedSession]):
     _session_kwargs = ContextVar("session_kwargs")
     _request_kwargs = ContextVar("requests_kwargs")
 
@@ -121,55 +118,13 @@ class CachedAPI:
         }
         self.requests_kwargs = requests_kwargs
         self.sessions: OrderedDict[str, CachedSession] = OrderedDict()
+        self._sessions_lock = RLock()
         self.headers = self.default_headers
         self.logger = logging.getLogger(self.__class__.__name__)
 
         if self.verify is False:
             urllib3.disable_warnings(category=urllib3.exceptions.InsecureRequestWarning)
 
-    @property
-    def default_headers(self):
-        """
-        Default headers of this class.
-
-        Returns:
-            dict: dict containing http headers
-        """
-        return {
-            "User-Agent": f"{self.user_agent}",
-        }
-
-    def set_header(self, key: str, value: str):
-        """
-        Set a header key to a value.
-
-        Args:
-            key (str): http header to set.
-            value (str): value of http header.
-        """
-        self.headers[key] = value
-
-    def del_header(self, key: str):
-        """
-        Remove a header.
-
-        Args:
-            key (str): http header to remove.
-        """
-        self.headers.pop(key, None)
-
-    def reset_headers(self):
-        """
-        Reset headers to the default defined in default_headers.
-        """
-        self.headers = self.default_headers
-
-    def clear_headers(self):
-        """
-        Clear all headers.
-        """
-        self.headers = {}
-
     @contextmanager
     @signature_of(CachedSession)
     def override_session_options(self, **kwargs):
@@ -182,30 +137,6 @@ class CachedAPI:
         finally:
             self._session_kwargs.reset(t)
 
-    @contextmanager
-    def override_request_options(self, **kwargs: Unpack["RequestKwargs"]):
-        """
-        Context manager to override the default kwargs handed to the request.
-
-        Priority order (low->high) in case of duplicate kwargs:
-            1. self.request_kwargs
-            2. this override
-            3. kwargs handed to self.call
-        """
-        try:
-            t = self._request_kwargs.set(kwargs)
-            yield
-        finally:
-            self._request_kwargs.reset(t)
-
-    @contextmanager
-    def bypass_cache(self):
-        """
-        Context manager to bypass the cache for every request made.
-        """
-        with self.override_request_options(headers={"Cache-Control": "no-cache"}):
-            yield
-
     def persist_session(self, key: str, session: CachedSession):
         """
         Persist a session to this objects session store.
@@ -216,45 +147,17 @@ class CachedAPI:
             key (str): session key.
             session (CachedSession): session to store.
         """
-        self.logger.debug(f"Persisting session {session=} for {key=}")
-
-        if current := self.sessions.pop(key, None):
-            self.logger.debug(f"Closing session {current=} due to replacement")
-            current.close()
-
-        self.sessions[key] = session
-
-        if len(self.sessions) > self.max_sessions:
-            oldest_key, session = self.sessions.popitem(False)
-            self.logger.debug(
-                f"Closing session {session=} for {oldest_key=} due to exceeding {self.max_sessions=}"
-            )
-
-            session.close()
-
-    @staticmethod
-    def create_session_key(backend, **kwargs):
-        """
-        Creates a unique key that describes a session and its kwargs.
-
-        The unique consists of the backend settings and session kwargs.
-
-        Args:
-            backend (BaseCache): backend cache that is used.
-
-        Returns:
-            str: unique key describing this session
-        """
-
-        return f"{backend}:{kwargs}"
+        for evicted in self.store_session(key, session):
+            evicted.close()
 
     def close(self):
         """
         Close and evict all sessions managed by this object.
         """
-        while self.sessions:
-            _, session = self.sessions.popitem()
-            session.close()
+        with self._sessions_lock:
+            while self.sessions:
+                _, session = self.sessions.popitem()
+                session.close()
 
     def update_session(self, session: CachedSession):
         """
@@ -297,66 +200,39 @@ class CachedAPI:
 
         key = self.create_session_key(backend, **kwargs)
 
-        try:
-            self.sessions.move_to_end(key)
-        except KeyError:
-            s = None
-        else:
-            s = self.sessions.get(key)
-
-        if s and not force_recreate:
-            self.logger.debug(f"Reusing existing session {s=}")
-
-            return self.update_session(s)
-        elif s:
-            s.close()
-
-        s = (
-            CachedSession(backend=backend, **kwargs)
-            if backend
-            else CachedSession(**kwargs)
-        )
-
-        if self.retry:
-            adapter = HTTPAdapter(max_retries=self.retry)
-
-            s.mount("http://", adapter)
-            s.mount("https://", adapter)
-
-        if self.persist and allow_persist:
-            self.persist_session(key, s)
+        # the session store may be shared by threads, e.g. when prefetching pages
+        with self._sessions_lock:
+            s = self.stored_session(key)
 
-        return self.update_session(s)
+            if s and not force_recreate:
+                self.logger.debug(f"Reusing existing session {s=}")
 
-    def build_url(self, resource: str | None, ignore_api_path: bool = False):
-        """
-        Build a resource url using the baseurl, api path and resource.
-
-        Args:
-            resource (str | None): resource to create an url for.
-            ignore_api_path (bool, optional): ignore the default api path set. Defaults to False.
+                return self.update_session(s)
+            elif s:
+                s.close()
 
-        Returns:
-            str: complete api path to call.
-        """
-        if resource:
-            resource = resource.removeprefix("/")
+            s = (
+                CachedSession(backend=backend, **kwargs)
+                if backend
+                else CachedSession(**kwargs)
+            )
 
-        url = self.baseurl
+            if self.retry:
+                adapter = HTTPAdapter(max_retries=self.retry)
 
-        if self.api_path and not ignore_api_path:
-            url += f"/{self.api_path}"
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
 
-        if resource:
-            url += f"/{resource}"
+            if self.persist and allow_persist:
+                self.persist_session(key, s)
 
-        return url
+            return self.update_session(s)
 
     def __del__(self):
         """
         Attempts to close all existing session when this object is deleted.
         """
-        if hasattr(self, "sessions"):
+        if hasattr(self, "_sessions_lock"):
             self.close()
 
     def call(
@@ -408,15 +284,7 @@ class CachedAPI:
 
         method = getattr(s, method)
 
-        requests_kwargs = {
-            **self.requests_kwargs,
-            **self._request_kwargs.get({}),
-            **kwargs,
-        }
-        requests_kwargs["headers"] = {
-            **self.headers,
-            **requests_kwargs.get("headers", {}),
-        }
+        requests_kwargs = self.request_options(self.requests_kwargs, kwargs)
 
         try:
             response = self.request(
@@ -476,3 +344,63 @@ class CachedAPI:
         if unpack:
             return self.unpack_response(r)
         return r
+
+    def stream_items(
+        self,
+        method: str,
+        resource: str = None,
+        key: str = "resources",
+        transform: Callable[[Any], R] = None,
+        meta: dict = None,
+        chunk_size: int = 64 * 1024,
+        use_cache: bool = False,
+        ignore_api_path: bool = False,
+        **kwargs,
+    ) -> Iterator[R]:
+        """
+        Call an endpoint and incrementally decode the array found under key in the json response.
+
+        Opposed to self.call the response is never fully decoded; only one item is held in memory at a time.
+        Streamed responses are not stored in the cache unless use_cache is set, as that would buffer the complete body.
+
+        Args:
+            method (str): http method to use.
+            resource (str, optional): resource to call. Defaults to None.
+            key (str, optional): top level key of the array to stream. Defaults to "resources".
+            transform (Callable[[Any], R], optional): transforms each item, e.g. a from_dict method. Defaults to None.
+            meta (dict, optional): dict in which the other top level values are stored. Defaults to None.
+            chunk_size (int, optional): size of the chunks read from the response. Defaults to 64 KiB.
+            use_cache (bool, optional): store the response in the cache. Defaults to False.
+            ignore_api_path (bool, optional): if the default api path should be ignored. Defaults to False.
+
+        Kwargs:
+            **kwargs: additional kwargs to pass to the request call.
+
+        Yields:
+            Any | R: array item, transformed if transform is set.
+        """
+        if not use_cache:
+            kwargs.setdefault("expire_after", DO_NOT_CACHE)
+
+        response: Response = self.call(
+            method,
+            resource,
+            unpack_response=False,
+            ignore_api_path=ignore_api_path,
+            stream=True,
+            **kwargs,
+        )
+
+        try:
+            if not response.ok:
+                response.raise_for_status()
+
+            for item in iter_json_array(
+                response.iter_content(chunk_size),
+                key,
+                meta,
+                response.encoding or "utf-8",
+            ):
+                yield transform(item) if transform else item
+        finally:
+            response.close()
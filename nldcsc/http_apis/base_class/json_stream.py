@@ -0,0 +1,156 @@
+import codecs
+import json
+import re
+from json import JSONDecodeError
+from typing import Any, Iterable, Iterator
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class ChunkBuffer:
+    def __init__(self, chunks: Iterable[bytes], encoding: str = "utf-8"):
+        """
+        Text buffer over an iterable of byte chunks which only holds the part that is not yet consumed.
+
+        Args:
+            chunks (Iterable[bytes]): chunks to read, e.g. response.iter_content().
+            encoding (str, optional): encoding of the chunks. Defaults to "utf-8".
+        """
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.json_decoder = json.JSONDecoder()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """
+        Read the next chunk into the buffer, dropping the consumed part.
+
+        Returns:
+            bool: False if there was nothing left to read.
+        """
+        if self.eof:
+            return False
+
+        for chunk in self.chunks:
+            if data := self.decoder.decode(chunk):
+                self.text = self.text[self.pos :] + data
+                self.pos = 0
+                return True
+
+        self.eof = True
+
+        if data := self.decoder.decode(b"", final=True):
+            self.text = self.text[self.pos :] + data
+            self.pos = 0
+            return True
+
+        return False
+
+    def peek(self) -> str:
+        """
+        Skip whitespace and return the next character without consuming it.
+
+        Returns:
+            str: next character or an empty string at the end of the stream.
+        """
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+
+            if self.pos < len(self.text) or not self.fill():
+                return self.text[self.pos : self.pos + 1]
+
+    def expect(self, char: str):
+        """
+        Consume the next character which should be char.
+
+        Raises:
+            JSONDecodeError: when the next character is something else.
+        """
+        if self.peek() != char:
+            raise JSONDecodeError(f"Expecting '{char}'", self.text, self.pos)
+
+        self.pos += 1
+
+    def decode(self) -> Any:
+        """
+        Decode the next json value; reading chunks until the value is complete.
+
+        Returns:
+            Any: decoded value.
+        """
+        self.peek()
+
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.text, self.pos)
+            except JSONDecodeError:
+                if self.eof:
+                    raise
+            else:
+                # numbers and literals ending on the buffer boundary may continue in the next chunk
+                if end < len(self.text) or self.eof:
+                    self.pos = end
+                    return value
+
+            self.fill()
+
+
+def iter_json_array(
+    chunks: Iterable[bytes], key: str, meta: dict = None, encoding: str = "utf-8"
+) -> Iterator[Any]:
+    """
+    Incrementally decode the array stored under key in a json object.
+
+    Only a single item of the array is held in memory at a time. All other top level values are decoded
+    as a whole and stored in meta; meta is complete once the iterator is exhausted.
+
+    Args:
+        chunks (Iterable[bytes]): chunks of the json document.
+        key (str): top level key of the array to iterate.
+        meta (dict, optional): dict to store the other top level values in. Defaults to None.
+        encoding (str, optional): encoding of the chunks. Defaults to "utf-8".
+
+    Raises:
+        JSONDecodeError: when the document is not a json object or is malformed.
+
+    Yields:
+        Any: decoded array items
+    """
+    buffer = ChunkBuffer(chunks, encoding)
+
+    buffer.expect("{")
+
+    if buffer.peek() == "}":
+        return
+
+    while True:
+        name = buffer.decode()
+        buffer.expect(":")
+
+        if name == key and buffer.peek() == "[":
+            buffer.expect("[")
+
+            if buffer.peek() == "]":
+                buffer.expect("]")
+            else:
+                while True:
+                    yield buffer.decode()
+
+                    if buffer.peek() == "]":
+                        buffer.expect("]")
+                        break
+
+                    buffer.expect(",")
+        else:
+            value = buffer.decode()
+
+            if meta is not None:
+                meta[name] = value
+
+        if buffer.peek() == "}":
+            buffer.expect("}")
+            return
+
+        buffer.expect(",")
@@ -0,0 +1,278 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Callable
+
+if TYPE_CHECKING:
+    from requests import Response
+
+RETRY_STATUS_CODES = (429, 503)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Parse a Retry-After header value which is either an amount of seconds or a http-date.
+
+    Args:
+        value (str | None): header value.
+
+    Returns:
+        float | None: seconds to wait or None if the value could not be parsed.
+    """
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+
+    return max((moment - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def _header(response: "Response", *names: str) -> float | None:
+    for name in names:
+        value = response.headers.get(name)
+
+        if value is None:
+            continue
+
+        try:
+            # the ietf draft allows lists like '10;w=60'; only the first value is relevant
+            return float(value.split(",")[0].split(";")[0])
+        except ValueError:
+            continue
+
+    return None
+
+
+class RateLimiter(ABC):
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        Base class for token bucket rate limiters; every key (e.g. a host or api key) has its own bucket.
+
+        Tokens are reserved up front so concurrent callers are spaced out evenly instead of all waking up
+        at the same time. Subclasses implement _reserve to store the buckets.
+
+        Args:
+            rate (float): tokens (requests) added per second; the maximum sustained request rate.
+            capacity (float, optional): maximum amount of tokens in a bucket (the allowed burst). Defaults to rate.
+        """
+        if rate <= 0:
+            raise ValueError("rate should be larger than 0")
+
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+
+    @abstractmethod
+    def _reserve(
+        self, key: str, tokens: float, block: float = 0, rate: float = None
+    ) -> float:
+        """
+        Reserve tokens from the bucket of key.
+
+        Args:
+            key (str): bucket key.
+            tokens (float): amount of tokens to take.
+            block (float, optional): seconds for which no tokens are handed out from now. Defaults to 0.
+            rate (float, optional): new rate for the bucket; a negative value resets it to the default rate. Defaults to None.
+
+        Returns:
+            float: seconds to wait before the tokens may be used.
+        """
+
+    def acquire(self, key: str, tokens: float = 1, sleep: Callable = time.sleep):
+        """
+        Take tokens from the bucket of key, waiting until they are available.
+
+        Args:
+            key (str): bucket key.
+            tokens (float, optional): amount of tokens to take. Defaults to 1.
+            sleep (Callable, optional): function to wait with. Defaults to time.sleep.
+
+        Returns:
+            float: seconds waited.
+        """
+        wait = self._reserve(key, tokens)
+
+        if wait > 0:
+            sleep(wait)
+
+        return wait
+
+    def block(self, key: str, seconds: float):
+        """
+        Hand out no tokens for key during the given amount of seconds.
+        """
+        self._reserve(key, 0, block=seconds)
+
+    def set_rate(self, key: str, rate: float = None):
+        """
+        Change the rate of the bucket of key; None resets it to the default rate.
+        """
+        self._reserve(key, 0, rate=-1 if rate is None else min(rate, self.rate))
+
+    def observe(self, key: str, response: "Response"):
+        """
+        Adapt the bucket of key to the rate limit information returned by the server.
+
+        Retry-After on a 429 or 503 blocks the bucket for that duration. The X-RateLimit-Remaining and
+        X-RateLimit-Reset headers (or their RateLimit-* equivalents) lower the rate so the remaining quota
+        is spread over the rest of the window instead of being used in a burst.
+
+        Args:
+            key (str): bucket key.
+            response (Response): response to inspect.
+        """
+        if response.status_code in RETRY_STATUS_CODES:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+            if retry_after is None and response.status_code == 429:
+                retry_after = 1 / self.rate
+
+            if retry_after:
+                self.block(key, retry_after)
+
+        remaining = _header(response, "X-RateLimit-Remaining", "RateLimit-Remaining")
+        reset = _header(response, "X-RateLimit-Reset", "RateLimit-Reset")
+
+        if remaining is None or reset is None:
+            return
+
+        # some apis return an epoch timestamp instead of a delta
+        if reset > 1e9:
+            reset -= time.time()
+
+        if reset <= 0:
+            self.set_rate(key)
+        elif remaining < 1:
+            self.block(key, reset)
+        else:
+            self.set_rate(key, remaining / reset)
+
+
+class _Bucket:
+    __slots__ = ("rate", "tokens", "updated")
+
+    def __init__(self, rate: float, tokens: float, updated: float):
+        self.rate = rate
+        self.tokens = tokens
+        self.updated = updated
+
+
+class MemoryRateLimiter(RateLimiter):
+    def __init__(
+        self, rate: float, capacity: float = None, clock: Callable = time.monotonic
+    ):
+        """
+        Thread safe in process token bucket rate limiter.
+
+        Args:
+            rate (float): tokens (requests) added per second.
+            capacity (float, optional): maximum amount of tokens in a bucket. Defaults to rate.
+            clock (Callable, optional): monotonic clock in seconds. Defaults to time.monotonic.
+        """
+        super().__init__(rate, capacity)
+
+        self.clock = clock
+        self.buckets: dict[str, _Bucket] = {}
+        self._lock = threading.Lock()
+
+    def _reserve(
+        self, key: str, tokens: float, block: float = 0, rate: float = None
+    ) -> float:
+        with self._lock:
+            now = self.clock()
+
+            if (bucket := self.buckets.get(key)) is None:
+                bucket = self.buckets[key] = _Bucket(self.rate, self.capacity, now)
+
+            # updated lies in the future while the bucket is blocked
+            if (elapsed := now - bucket.updated) > 0:
+                bucket.tokens = min(
+                    self.capacity, bucket.tokens + elapsed * bucket.rate
+                )
+                bucket.updated = now
+
+            if rate is not None:
+                bucket.rate = self.rate if rate < 0 else rate
+
+            if block > 0:
+                bucket.tokens = min(bucket.tokens, 0)
+                bucket.updated = max(bucket.updated, now + block)
+
+            bucket.tokens -= tokens
+
+            return max(bucket.updated - now, 0) + max(-bucket.tokens, 0) / bucket.rate
+
+
+class RedisRateLimiter(RateLimiter):
+    _script = """
+        local time_parts = redis.call('TIME')
+        local now = tonumber(time_parts[1]) + tonumber(time_parts[2]) / 1000000
+        local default_rate = tonumber(ARGV[1])
+        local capacity = tonumber(ARGV[2])
+        local take = tonumber(ARGV[3])
+        local block = tonumber(ARGV[4])
+        local new_rate = tonumber(ARGV[5])
+        local state = redis.call('HMGET', KEYS[1], 'rate', 'tokens', 'updated')
+        local rate = tonumber(state[1]) or default_rate
+        local tokens = tonumber(state[2]) or capacity
+        local updated = tonumber(state[3]) or now
+        if now > updated then
+          tokens = math.min(capacity, tokens + (now - updated) * rate)
+          updated = now
+        end
+        if new_rate < 0 then
+          rate = default_rate
+        elseif new_rate > 0 then
+          rate = new_rate
+        end
+        if block > 0 then
+          tokens = math.min(tokens, 0)
+          updated = math.max(updated, now + block)
+        end
+        tokens = tokens - take
+        redis.call('HSET', KEYS[1], 'rate', tostring(rate), 'tokens', tostring(tokens), 'updated', tostring(updated))
+        local wait = math.max(updated - now, 0) + math.max(-tokens, 0) / rate
+        redis.call('EXPIRE', KEYS[1], math.ceil(wait + capacity / rate) + 60)
+        return tostring(wait)
+        """
+
+    def __init__(
+        self, redis_client, rate: float, capacity: float = None, prefix: str = "rl"
+    ):
+        """
+        Token bucket rate limiter stored in redis so the limit is shared between processes.
+
+        Args:
+            redis_client (Redis): redis client to store the buckets with.
+            rate (float): tokens (requests) added per second.
+            capacity (float, optional): maximum amount of tokens in a bucket. Defaults to rate.
+            prefix (str, optional): prefix of the redis keys. Defaults to "rl".
+        """
+        super().__init__(rate, capacity)
+
+        self.client = redis_client
+        self.prefix = prefix
+        self._fn = redis_client.register_script(self._script)
+
+    def _reserve(
+        self, key: str, tokens: float, block: float = 0, rate: float = None
+    ) -> float:
+        wait = self._fn(
+            keys=[f"{self.prefix}:{key}"],
+            args=[self.rate, self.capacity, tokens, block, rate or 0],
+        )
+
+        return float(wait.decode() if isinstance(wait, bytes) else wait)
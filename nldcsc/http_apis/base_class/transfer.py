@@ -0,0 +1,139 @@
+import hashlib
+import io
+import os
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Callable, Iterable, Iterator
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class TransferResult:
+    size: int
+    digests: dict[str, str] = field(default_factory=dict)
+    result: Any = None
+
+
+class TransferHasher:
+    def __init__(
+        self,
+        algorithms: Iterable[str] = ("sha256",),
+        progress: Callable[[int, int | None], Any] = None,
+        total: int = None,
+    ):
+        """
+        Keeps track of the size and checksums of the chunks of a transfer.
+
+        Args:
+            algorithms (Iterable[str], optional): hashlib algorithms to compute. Defaults to ("sha256",).
+            progress (Callable[[int, int | None], Any], optional): called with the transferred and total bytes after every chunk. Defaults to None.
+            total (int, optional): expected size of the transfer, if known. Defaults to None.
+        """
+        self.hashes = {name: hashlib.new(name) for name in algorithms or ()}
+        self.progress = progress
+        self.total = total
+        self.size = 0
+
+    def update(self, chunk: bytes):
+        self.size += len(chunk)
+
+        for h in self.hashes.values():
+            h.update(chunk)
+
+        if self.progress is not None:
+            self.progress(self.size, self.total)
+
+    def result(self, result: Any = None) -> TransferResult:
+        return TransferResult(
+            self.size,
+            {name: h.hexdigest() for name, h in self.hashes.items()},
+            result,
+        )
+
+
+def remaining_length(fileobj: BinaryIO) -> int | None:
+    """
+    Determine the amount of bytes left in a file object without reading it.
+
+    Returns:
+        int | None: remaining bytes or None if the object is not seekable.
+    """
+    try:
+        position = fileobj.tell()
+    except (AttributeError, OSError):
+        return None
+
+    try:
+        return max(os.fstat(fileobj.fileno()).st_size - position, 0)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        pass
+
+    try:
+        end = fileobj.seek(0, io.SEEK_END)
+        fileobj.seek(position)
+    except (AttributeError, OSError):
+        return None
+
+    return max(end - position, 0)
+
+
+class StreamReader:
+    def __init__(
+        self,
+        fileobj: BinaryIO,
+        hasher: TransferHasher,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ):
+        """
+        File like wrapper which feeds every chunk read from fileobj to a hasher; used as request body.
+
+        Args:
+            fileobj (BinaryIO): file object to read from.
+            hasher (TransferHasher): hasher to update.
+            chunk_size (int, optional): size of the chunks when iterated. Defaults to DEFAULT_CHUNK_SIZE.
+        """
+        self.fileobj = fileobj
+        self.hasher = hasher
+        self.chunk_size = chunk_size
+        self._length = remaining_length(fileobj)
+
+        if hasher.total is None:
+            hasher.total = self._length
+
+    @property
+    def len(self) -> int | None:
+        """
+        Bytes left to read; used by requests and the MultipartEncoder for the content length
+        """
+        if self._length is None:
+            return None
+
+        return self._length - self.hasher.size
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.fileobj.read(size)
+
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+
+        if chunk:
+            self.hasher.update(chunk)
+
+        return chunk
+
+    def __iter__(self) -> Iterator[bytes]:
+        while chunk := self.read(self.chunk_size):
+            yield chunk
+
+
+def iter_hashed(chunks: Iterable[bytes], hasher: TransferHasher) -> Iterator[bytes]:
+    """
+    Pass chunks through while feeding them to a hasher; used for chunked request bodies.
+    """
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+
+        hasher.update(chunk)
+
+        yield chunk
@@ -40,3 +40,34 @@ class ConfluenceClient(CachedAPI):
         resource = "search"
 
         return self.call(self.methods.GET, resource, params={"cql": cql})
+
+    def iter_search(self, cql: str, limit: int = 100):
+        """
+        Iterate all search results; every page is decoded incrementally.
+
+        Args:
+            cql (str): confluence query.
+            limit (int, optional): amount of results per page. Defaults to 100.
+
+        Yields:
+            dict: singular search result
+        """
+        resource = "search"
+        start = 0
+
+        while True:
+            meta = {}
+
+            yield from self.stream_items(
+                self.methods.GET,
+                resource,
+                "results",
+                meta=meta,
+                params={"cql": cql, "start": start, "limit": limit},
+            )
+
+            size = meta.get("size", 0)
+            start += size
+
+            if size < limit:
+                break
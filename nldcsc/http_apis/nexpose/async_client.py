@@ -0,0 +1,156 @@
+import asyncio
+from collections import deque
+from functools import partial
+from typing import Awaitable, Callable, Literal, TypeVar, Union
+
+from nldcsc.httpx_apis.base_class.cached_base_class import AsyncCachedAPI
+
+from .client import NexposeEndpoints, NexposePageResponse, Sorting
+from .objects import NexposeFilter, NexposeSearchMatch
+
+T = TypeVar("T")
+
+
+class AsyncNexposeClient(NexposeEndpoints, AsyncCachedAPI):
+    """
+    Async twin of the NexposeClient; every get_* method returns an awaitable and the iter_* methods are async generators.
+    """
+
+    async def _iter_pages(
+        self,
+        source: Callable[..., Awaitable[NexposePageResponse[T]]],
+        offset: int = 0,
+        batch_size: int = 100,
+        prefetch: int = 0,
+        concurrency: int = 1,
+    ):
+        """
+        Reusable async generator to iter through paginated nexpose responses.
+
+        After the first page max(prefetch, concurrency) pages are requested ahead of the page being consumed
+        as tasks, of which at most concurrency are awaiting a response at the same time; pages are yielded in order.
+
+        Args:
+            source (Callable[..., Awaitable[NexposePageResponse[T]]]): Function to await and get a paginated response; function should accept kwarg 'page'
+            offset (int, optional): Amount of resources to initially skip. Defaults to 0.
+            batch_size (int, optional): Amount of resources to retrieve per page. Defaults to 100.
+            prefetch (int, optional): Amount of pages to request ahead of the current page; 0 fetches serially. Defaults to 0.
+            concurrency (int, optional): Amount of pages requested at the same time. Defaults to 1.
+
+        Yields:
+            T: Type that is returned from the source function as resource
+        """
+        page = offset // batch_size
+        skip = offset % batch_size
+        window = max(prefetch, concurrency, 1)
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+        async def fetch(page: int) -> NexposePageResponse[T]:
+            async with semaphore:
+                return await source(page=page)
+
+        assets = await source(page=page)
+
+        page += 1
+
+        for resource in assets.resources[skip:]:
+            yield resource
+
+        if assets.page is None or page >= assets.page.total_pages:
+            return
+
+        pending: deque[asyncio.Task] = deque()
+
+        try:
+            for page in range(page, assets.page.total_pages):
+                pending.append(asyncio.ensure_future(fetch(page)))
+
+                if len(pending) >= window:
+                    for resource in (await pending.popleft()).resources:
+                        yield resource
+
+            while pending:
+                for resource in (await pending.popleft()).resources:
+                    yield resource
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def iter_assets(
+        self,
+        offset: int = 0,
+        batch_size: int = 100,
+        sorting: Sorting = None,
+        filters: list[NexposeFilter] = None,
+        match: Union[
+            Literal["any"], Literal["all"], NexposeSearchMatch
+        ] = NexposeSearchMatch.ALL,
+        prefetch: int = 0,
+        concurrency: int = 1,
+    ):
+        """
+        iter asset from pages starting at an offset.
+
+        Args:
+            offset (int, optional): offset to start iterating from. Defaults to 0.
+            batch_size (int, optional): amount of assets to retrieve per page. Defaults to 100.
+            sorting (Sorting, optional): how the assets are sorted. Defaults to None.
+            filters (list[NexposeFilter], optional): filters to apply to the assets. Defaults to None.
+            match ( NexposeSearchMatch, optional): match method to use when searching. Defaults to NexposeSearchMatch.ALL..
+            prefetch (int, optional): amount of pages to request ahead. Defaults to 0.
+            concurrency (int, optional): amount of pages to request at the same time. Defaults to 1.
+
+        Yields:
+            NexposeResource: Singular asset
+        """
+        async for asset in self._iter_pages(
+            partial(
+                self.get_assets,
+                size=batch_size,
+                sorting=sorting,
+                filters=filters,
+                match=match,
+            ),
+            offset,
+            batch_size,
+            prefetch,
+            concurrency,
+        ):
+            yield asset
+
+    async def iter_asset_vulnerabilities(
+        self,
+        asset_id: int,
+        offset: int = 0,
+        batch_size: int = 100,
+        sorting: Sorting = None,
+        prefetch: int = 0,
+        concurrency: int = 1,
+    ):
+        """
+        iter asset vulnerabilities starting at an offset.
+
+        Args:
+            asset_id (int): asset id to retrieve vulnerabilities from.
+            offset (int, optional): offset to start iterating from. Defaults to 0.
+            batch_size (int, optional): amount of assets to retrieve per page. Defaults to 100.
+            sorting (Sorting, optional): how the assets are sorted. Defaults to None.
+            prefetch (int, optional): amount of pages to request ahead. Defaults to 0.
+            concurrency (int, optional): amount of pages to request at the same time. Defaults to 1.
+
+        Yields:
+            NexposeAssetVulnerability: Singular vulnerability on the requested asset
+        """
+        async for vulnerability in self._iter_pages(
+            partial(
+                self.get_asset_vulnerabilities,
+                asset_id=asset_id,
+                size=batch_size,
+                sorting=sorting,
+            ),
+            offset,
+            batch_size,
+            prefetch,
+            concurrency,
+        ):
+            yield vulnerability
@@ -1,6 +1,14 @@
+import inspect
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextvars import copy_context
 from functools import partial, wraps
+from itertools import islice
+from threading import Lock
 from typing import (
+    Awaitable,
     Callable,
+    Iterable,
     Literal,
     ParamSpec,
     Protocol,
@@ -14,6 +22,8 @@ from nldcsc.http_apis.base_class.cached_base_class import CachedAPI
 from .objects import (
     NexposeAssetVulnerabilities,
     NexposeAssets,
+    NexposeAssetVulnerability,
+    NexposeEnrichedVulnerability,
     NexposeLink,
     NexposePage,
     NexposeResource,
@@ -42,10 +52,7 @@ def as_object(obj: Type[T], transform: Callable[..., T] = None):
     """
 
     def wrapper(f: Callable[P, dict]) -> Callable[P, T]:
-        @wraps(f)
-        def inner(*args, **kwargs) -> T:
-            r = f(*args, **kwargs)
-
+        def parse(r: dict) -> T:
             try:
                 if transform:
                     return transform(r)
@@ -55,11 +62,41 @@ def as_object(obj: Type[T], transform: Callable[..., T] = None):
                     f"Failed transforming response for {f.__name__} into {obj=} -> {e=}"
                 )
 
+        async def a_parse(r: Awaitable[dict]) -> T:
+            return parse(await r)
+
+        @wraps(f)
+        def inner(*args, **kwargs) -> T:
+            r = f(*args, **kwargs)
+
+            # async clients return an awaitable; transform once it is resolved
+            if inspect.isawaitable(r):
+                return a_parse(r)
+            return parse(r)
+
         return inner
 
     return wrapper
 
 
+def submit_in_context(
+    pool: ThreadPoolExecutor, f: Callable[P, T], *args: P.args, **kwargs: P.kwargs
+) -> Future[T]:
+    """
+    Submit a function to a pool running it in a copy of the current context.
+
+    Context overrides like bypass_cache are stored in context vars which are not inherited by worker threads.
+
+    Args:
+        pool (ThreadPoolExecutor): pool to submit to.
+        f (Callable[P, T]): function to run.
+
+    Returns:
+        Future[T]: future of the submitted function.
+    """
+    return pool.submit(copy_context().run, f, *args, **kwargs)
+
+
 Sorting: TypeAlias = list[
     tuple[str, Union[Literal["ASC"], Literal["DESC"], NexposeSortingDirection]]
 ]
@@ -75,7 +112,11 @@ class NexposePageSource(Protocol[T]):
     def __call__(self, page: int) -> NexposePageResponse[T]: ...
 
 
-class NexposeClient(CachedAPI):
+class NexposeEndpoints:
+    """
+    Endpoints shared by the sync and async nexpose clients; the class using it should provide call and methods.
+    """
+
     def _pss_to_params(self, page: int = 0, size: int = 10, sorting: Sorting = None):
         """
         Transforms page, size and sorting (pss) to a params dict.
@@ -99,42 +140,7 @@ class NexposeClient(CachedAPI):
 
         return params
 
-    def _iter_pages(
-        self,
-        source: NexposePageSource[T],
-        offset: int = 0,
-        batch_size: int = 100,
-    ):
-        """
-        Reusable generator to iter through paginated nexpose responses.
-
-        Args:
-            source (NexposePageSource[T]): Function to call and get a paginated response; function should accept kwarg 'page'
-            offset (int, optional): Amount of resources to initially skip. Defaults to 0.
-            batch_size (int, optional): Amount of resources to retrieve per page. Defaults to 100.
-
-        Yields:
-            T: Type that is returned from the source function as resource
-        """
-        page = offset // batch_size
-        skip = offset % batch_size
-
-        while True:
-            assets = source(page=page)
-
-            page += 1
-
-            if skip:
-                assets.resources = assets.resources[skip:]
-                skip = 0
-
-            yield from assets.resources
-
-            if assets.page is None or page >= assets.page.total_pages:
-                break
-
-    @as_object(NexposeAssets, NexposeAssets.from_dict)
-    def get_assets(
+    def _assets_request(
         self,
         page: int = 0,
         size: int = 10,
@@ -145,99 +151,73 @@ class NexposeClient(CachedAPI):
         ] = NexposeSearchMatch.ALL,
     ):
         """
-        gets an page of assets.
-
-        Args:
-            page (int, optional): page number to retrieve. Defaults to 0.
-            size (int, optional): amount of resources on the page. Defaults to 10.
-            sorting (Sorting, optional): how to sort the assets. Defaults to None.
-            filters (list[NexposeFilter], optional): filters to apply to search for specific assets. Defaults to None.
-            match ( NexposeSearchMatch, optional): match method to use when searching. Defaults to NexposeSearchMatch.ALL.
+        Describes the request for a page of assets.
 
         Returns:
-            NexposeAssets: paginated response
+            tuple[str, str, dict]: method, resource and kwargs to pass to call.
         """
         params = self._pss_to_params(page, size, sorting)
 
         if filters:
             resource = "assets/search"
 
-            return self.call(
+            return (
                 self.methods.POST,
                 resource,
-                params=params,
-                json={"filters": filters, "match": match},
+                {"params": params, "json": {"filters": filters, "match": match}},
             )
 
         else:
             resource = "assets"
 
-            return self.call(self.methods.GET, resource, params=params)
+            return self.methods.GET, resource, {"params": params}
 
-    def iter_assets(
-        self,
-        offset: int = 0,
-        batch_size: int = 100,
-        sorting: Sorting = None,
-        filters: list[NexposeFilter] = None,
-        match: Union[
-            Literal["any"], Literal["all"], NexposeSearchMatch
-        ] = NexposeSearchMatch.ALL,
+    def _asset_vulnerabilities_request(
+        self, asset_id: int, page: int = 0, size: int = 10, sorting: Sorting = None
     ):
         """
-        iter asset from pages starting at an offset.
+        Describes the request for a page of asset vulnerabilities.
 
-        Args:
-            offset (int, optional): offset to start iterating from. Defaults to 0.
-            batch_size (int, optional): amount of assets to retrieve per page. Defaults to 100.
-            sorting (Sorting, optional): how the assets are sorted. Defaults to None.
-            filters (list[NexposeFilter], optional): filters to apply to the assets. Defaults to None.
-            match ( NexposeSearchMatch, optional): match method to use when searching. Defaults to NexposeSearchMatch.ALL..
-
-        Yields:
-            NexposeResource: Singular asset
+        Returns:
+            tuple[str, str, dict]: method, resource and kwargs to pass to call.
         """
-        yield from self._iter_pages(
-            partial(
-                self.get_assets,
-                size=batch_size,
-                sorting=sorting,
-                filters=filters,
-                match=match,
-            ),
-            offset,
-            batch_size,
+        resource = f"assets/{asset_id}/vulnerabilities"
+
+        return (
+            self.methods.GET,
+            resource,
+            {"params": self._pss_to_params(page, size, sorting)},
         )
 
-    def iter_asset_vulnerabilities(
+    @as_object(NexposeAssets, NexposeAssets.from_dict)
+    def get_assets(
         self,
-        asset_id: int,
-        offset: int = 0,
-        batch_size: int = 100,
+        page: int = 0,
+        size: int = 10,
         sorting: Sorting = None,
+        filters: list[NexposeFilter] = None,
+        match: Union[
+            Literal["any"], Literal["all"], NexposeSearchMatch
+        ] = NexposeSearchMatch.ALL,
     ):
-        yield from self._iter_pages(
-            partial(
-                self.get_asset_vulnerabilities,
-                asset_id=asset_id,
-                size=batch_size,
-                sorting=sorting,
-            ),
-            offset,
-            batch_size,
-        )
         """
-        iter asset vulnerabilities starting at an offset.
+        gets an page of assets.
 
         Args:
-            asset_id (int): asset id to retrieve vulnerabilities from.
-            offset (int, optional): offset to start iterating from. Defaults to 0.
-            batch_size (int, optional): amount of assets to retrieve per page. Defaults to 100.
-            sorting (Sorting, optional): how the assets are sorted. Defaults to None.
+            page (int, optional): page number to retrieve. Defaults to 0.
+            size (int, optional): amount of resources on the page. Defaults to 10.
+            sorting (Sorting, optional): how to sort the assets. Defaults to None.
+            filters (list[NexposeFilter], optional): filters to apply to search for specific assets. Defaults to None.
+            match ( NexposeSearchMatch, optional): match method to use when searching. Defaults to NexposeSearchMatch.ALL.
 
-        Yields:
-            NexposeVulnerability: Singular vulnerability on the requested asset
+        Returns:
+            NexposeAssets: paginated response
         """
+        method, resource, kwargs = self._assets_request(
+            page, size, sorting, filters, match
+        )
+
+        return self.call(method, resource, **kwargs)
 
     @as_object(NexposeAssetVulnerabilities, NexposeAssetVulnerabilities.from_dict)
     def get_asset_vulnerabilities(
@@ -255,12 +235,12 @@ class NexposeClient(CachedAPI):
         Returns:
             NexposeAssetVulnerabilities: paginated response
         """
-        resource = f"assets/{asset_id}/vulnerabilities"
-
-        return self.call(
-            self.methods.GET, resource, params=self._pss_to_params(page, size, sorting)
+        method, resource, kwargs = self._asset_vulnerabilities_request(
+            asset_id, page, size, sorting
         )
 
+        return self.call(method, resource, **kwargs)
+
     @as_object(NexposeResource, NexposeResource.from_dict)
     def get_asset(self, asset_id: int):
         """
@@ -326,3 +306,380 @@ class NexposeClient(CachedAPI):
 
     def __repr__(self):
         return f"<{self.__class__.__name__}({self.build_url(None)})>"
+
+
+class NexposeClient(NexposeEndpoints, CachedAPI):
+    def _iter_pages(
+        self,
+        source: NexposePageSource[T],
+        offset: int = 0,
+        batch_size: int = 100,
+        prefetch: int = 0,
+        concurrency: int = 1,
+    ):
+        """
+        Reusable generator to iter through paginated nexpose responses.
+
+        The first page is always fetched on its own to learn the total amount of pages. After that at most
+        max(prefetch, concurrency) pages are requested ahead of the page being consumed using a pool of
+        concurrency workers. Pages are yielded in order; the amount of pages held in memory never exceeds that window.
+
+        Args:
+            source (NexposePageSource[T]): Function to call and get a paginated response; function should accept kwarg 'page'
+            offset (int, optional): Amount of resources to initially skip. Defaults to 0.
+            batch_size (int, optional): Amount of resources to retrieve per page. Defaults to 100.
+            prefetch (int, optional): Amount of pages to request ahead of the current page; 0 fetches serially. Defaults to 0.
+            concurrency (int, optional): Amount of workers fetching pages in parallel. Defaults to 1.
+
+        Yields:
+            T: Type that is returned from the source function as resource
+        """
+        page = offset // batch_size
+        skip = offset % batch_size
+        window = max(prefetch, concurrency)
+
+        assets = source(page=page)
+
+        page += 1
+
+        yield from assets.resources[skip:]
+
+        if assets.page is None or page >= assets.page.total_pages:
+            return
+
+        if window <= 1:
+            while True:
+                assets = source(page=page)
+
+                page += 1
+
+                yield from assets.resources
+
+                if assets.page is None or page >= assets.page.total_pages:
+                    return
+
+        pending: deque[Future] = deque()
+        pool = ThreadPoolExecutor(
+            max_workers=max(concurrency, 1),
+            thread_name_prefix=f"{self.__class__.__name__}-pages",
+        )
+
+        try:
+            for page in range(page, assets.page.total_pages):
+                pending.append(submit_in_context(pool, source, page=page))
+
+                if len(pending) >= window:
+                    yield from pending.popleft().result().resources
+
+            while pending:
+                yield from pending.popleft().result().resources
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _check_stream_args(prefetch: int, concurrency: int):
+        if prefetch > 0 or concurrency > 1:
+            raise ValueError(
+                "Streaming pages cannot be combined with prefetch or concurrency"
+            )
+
+    def _iter_streamed_pages(
+        self,
+        request: Callable[..., tuple[str, str, dict]],
+        transform: Callable[[dict], T],
+        offset: int = 0,
+        batch_size: int = 100,
+    ):
+        """
+        Generator to iter through paginated nexpose responses decoding the resources incrementally.
+
+        Args:
+            request (Callable[..., tuple[str, str, dict]]): Function describing the request of a page; function should accept kwarg 'page'
+            transform (Callable[[dict], T]): Function to transform a single resource into an object.
+            offset (int, optional): Amount of resources to initially skip. Defaults to 0.
+            batch_size (int, optional): Amount of resources to retrieve per page. Defaults to 100.
+
+        Yields:
+            T: Type that is returned from the transform function
+        """
+        page = offset // batch_size
+        skip = offset % batch_size
+
+        while True:
+            method, resource, kwargs = request(page=page)
+            meta = {}
+
+            for item in islice(
+                self.stream_items(method, resource, "resources", meta=meta, **kwargs),
+                skip,
+                None,
+            ):
+                yield transform(item)
+
+            page += 1
+            skip = 0
+
+            total_pages = (meta.get("page") or {}).get("totalPages")
+
+            if total_pages is None or page >= total_pages:
+                break
+
+    def iter_assets(
+        self,
+        offset: int = 0,
+        batch_size: int = 100,
+        sorting: Sorting = None,
+        filters: list[NexposeFilter] = None,
+        match: Union[
+            Literal["any"], Literal["all"], NexposeSearchMatch
+        ] = NexposeSearchMatch.ALL,
+        prefetch: int = 0,
+        concurrency: int = 1,
+        stream: bool = False,
+    ):
+        """
+        iter asset from pages starting at an offset.
+
+        Args:
+            offset (int, optional): offset to start iterating from. Defaults to 0.
+            batch_size (int, optional): amount of assets to retrieve per page. Defaults to 100.
+            sorting (Sorting, optional): how the assets are sorted. Defaults to None.
+            filters (list[NexposeFilter], optional): filters to apply to the assets. Defaults to None.
+            match ( NexposeSearchMatch, optional): match method to use when searching. Defaults to NexposeSearchMatch.ALL..
+            prefetch (int, optional): amount of pages to request ahead. Defaults to 0.
+            concurrency (int, optional): amount of pages to request in parallel. Defaults to 1.
+            stream (bool, optional): decode the pages incrementally to bound memory; cannot be combined with prefetch or concurrency. Defaults to False.
+
+        Yields:
+            NexposeResource: Singular asset
+        """
+        if stream:
+            self._check_stream_args(prefetch, concurrency)
+
+            yield from self._iter_streamed_pages(
+                partial(
+                    self._assets_request,
+                    size=batch_size,
+                    sorting=sorting,
+                    filters=filters,
+                    match=match,
+                ),
+                NexposeResource.from_dict,
+                offset,
+                batch_size,
+            )
+            return
+
+        yield from self._iter_pages(
+            partial(
+                self.get_assets,
+                size=batch_size,
+                sorting=sorting,
+                filters=filters,
+                match=match,
+            ),
+            offset,
+            batch_size,
+            prefetch,
+            concurrency,
+        )
+
+    def iter_asset_vulnerabilities(
+        self,
+        asset_id: int,
+        offset: int = 0,
+        batch_size: int = 100,
+        sorting: Sorting = None,
+        prefetch: int = 0,
+        concurrency: int = 1,
+        stream: bool = False,
+    ):
+        """
+        iter asset vulnerabilities starting at an offset.
+
+        Args:
+            asset_id (int): asset id to retrieve vulnerabilities from.
+            offset (int, optional): offset to start iterating from. Defaults to 0.
+            batch_size (int, optional): amount of assets to retrieve per page. Defaults to 100.
+            sorting (Sorting, optional): how the assets are sorted. Defaults to None.
+            prefetch (int, optional): amount of pages to request ahead. Defaults to 0.
+            concurrency (int, optional): amount of pages to request in parallel. Defaults to 1.
+            stream (bool, optional): decode the pages incrementally to bound memory; cannot be combined with prefetch or concurrency. Defaults to False.
+
+        Yields:
+            NexposeAssetVulnerability: Singular vulnerability on the requested asset
+        """
+        if stream:
+            self._check_stream_args(prefetch, concurrency)
+
+            yield from self._iter_streamed_pages(
+                partial(
+                    self._asset_vulnerabilities_request,
+                    asset_id=asset_id,
+                    size=batch_size,
+                    sorting=sorting,
+                ),
+                NexposeAssetVulnerability.from_dict,
+                offset,
+                batch_size,
+            )
+            return
+
+        yield from self._iter_pages(
+            partial(
+                self.get_asset_vulnerabilities,
+                asset_id=asset_id,
+                size=batch_size,
+                sorting=sorting,
+            ),
+            offset,
+            batch_size,
+            prefetch,
+            concurrency,
+        )
+
+    def iter_enriched_vulnerabilities(
+        self,
+        assets: Iterable[NexposeResource] = None,
+        concurrency: int = 8,
+        asset_concurrency: int = 4,
+        include_solutions: bool = True,
+        batch_size: int = 100,
+        filters: list[NexposeFilter] = None,
+        match: Union[
+            Literal["any"], Literal["all"], NexposeSearchMatch
+        ] = NexposeSearchMatch.ALL,
+        memo_size: int = 10_000,
+    ):
+        """
+        Stream the vulnerabilities of assets joined with their vulnerability details and solutions.
+
+        Vulnerability and solution ids are deduplicated over the run; every unique detail is requested once on a
+        pool of concurrency workers and memoized in a lru of memo_size details per kind. Failed requests are not
+        memoized, so a transient error only fails the assets waiting for that request. At most asset_concurrency
+        assets are processed at the same time; records of an asset are yielded as soon as all its details are
+        resolved. When iterating all assets the next page of assets is fetched while the current one is enriched.
+
+        Args:
+            assets (Iterable[NexposeResource], optional): assets to enrich. Defaults to iterating all (filtered) assets.
+            concurrency (int, optional): amount of workers fetching vulnerability and solution details. Defaults to 8.
+            asset_concurrency (int, optional): amount of assets processed at the same time. Defaults to 4.
+            include_solutions (bool, optional): resolve the solutions of every vulnerability. Defaults to True.
+            batch_size (int, optional): amount of resources to retrieve per page. Defaults to 100.
+            filters (list[NexposeFilter], optional): filters to apply when iterating all assets. Defaults to None.
+            match ( NexposeSearchMatch, optional): match method to use when searching. Defaults to NexposeSearchMatch.ALL.
+            memo_size (int, optional): amount of vulnerabilities, solution lists and solutions memoized each. Defaults to 10_000.
+
+        Yields:
+            NexposeEnrichedVulnerability: vulnerability finding on an asset joined with its details
+        """
+        if assets is None:
+            assets = self.iter_assets(
+                batch_size=batch_size,
+                filters=filters,
+                match=match,
+                prefetch=2,
+            )
+
+        details_pool = ThreadPoolExecutor(
+            max_workers=max(concurrency, 1),
+            thread_name_prefix=f"{self.__class__.__name__}-details",
+        )
+        asset_pool = ThreadPoolExecutor(
+            max_workers=max(asset_concurrency, 1),
+            thread_name_prefix=f"{self.__class__.__name__}-assets",
+        )
+
+        vulnerabilities: OrderedDict[str, Future[NexposeVulnerability]] = OrderedDict()
+        vulnerability_solutions: OrderedDict[
+            str, Future[NexposeVulnerabilitySolutions]
+        ] = OrderedDict()
+        solutions: OrderedDict[str, Future[NexposeSolution]] = OrderedDict()
+
+        memo_lock = Lock()
+
+        def memoized(
+            memo: OrderedDict[str, Future[T]], f: Callable[[str], T], key: str
+        ):
+            with memo_lock:
+                future = memo.get(key)
+
+                # failed requests are requested again instead of failing every later asset
+                if future is None or (
+                    future.done() and (future.cancelled() or future.exception())
+                ):
+                    future = memo[key] = submit_in_context(details_pool, f, key)
+
+                memo.move_to_end(key)
+
+                while len(memo) > max(memo_size, 1):
+                    memo.popitem(False)
+
+                return future
+
+        def resolve_solutions(vulnerability_id: str):
+            ids = memoized(
+                vulnerability_solutions,
+                self.get_vulnerability_solutions,
+                vulnerability_id,
+            ).result()
+
+            pending = [
+                memoized(solutions, self.get_solution, solution_id)
+                for solution_id in ids.resources
+            ]
+
+            return [future.result() for future in pending]
+
+        def enrich(asset: NexposeResource):
+            findings: list[NexposeAssetVulnerability] = list(
+                self.iter_asset_vulnerabilities(asset.id, batch_size=batch_size)
+            )
+
+            details = [
+                memoized(vulnerabilities, self.get_vulnerability, finding.id)
+                for finding in findings
+            ]
+
+            if include_solutions:
+                for finding in findings:
+                    memoized(
+                        vulnerability_solutions,
+                        self.get_vulnerability_solutions,
+                        finding.id,
+                    )
+
+            return [
+                NexposeEnrichedVulnerability(
+                    asset=asset,
+                    finding=finding,
+                    vulnerability=detail.result(),
+                    solutions=(
+                        resolve_solutions(finding.id) if include_solutions else []
+                    ),
+                )
+                for finding, detail in zip(findings, details)
+            ]
+
+        pending: set[Future[list[NexposeEnrichedVulnerability]]] = set()
+
+        try:
+            for asset in assets:
+                pending.add(submit_in_context(asset_pool, enrich, asset))
+
+                if len(pending) < asset_concurrency:
+                    continue
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    yield from future.result()
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    yield from future.result()
+        finally:
+            asset_pool.shutdown(wait=False, cancel_futures=True)
+            details_pool.shutdown(wait=False, cancel_futures=True)
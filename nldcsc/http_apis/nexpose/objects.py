@@ -593,3 +593,11 @@ class NexposeAssetVulnerabilities(NexposeDataClassConfig):
 class NexposeVulnerabilitySolutions(NexposeDataClassConfig):
     links: list[NexposeLink]
     resources: list[str]
+
+
+@dataclass
+class NexposeEnrichedVulnerability(NexposeDataClassConfig):
+    asset: NexposeResource
+    finding: NexposeAssetVulnerability
+    vulnerability: NexposeVulnerability
+    solutions: list[NexposeSolution] = field(default_factory=list)
@@ -0,0 +1,143 @@
+import asyncio
+from contextvars import ContextVar
+from typing import Awaitable, Callable
+
+import httpx
+
+from nldcsc.http_apis.viper.auth import AuthInfo
+from nldcsc.http_apis.viper.collections.auth.objects import AuthResponse
+from nldcsc.http_apis.viper.collections.v1 import V1Collection
+from nldcsc.httpx_apis.base_class.cached_base_class import AsyncCachedAPI
+
+from .collections.unversioned import UnversionedCollection
+from .objects import ErrorItem
+
+
+class AsyncViperAuth(httpx.Auth):
+    _updating = ContextVar("viper_auth_updating", default=False)
+
+    def __init__(
+        self,
+        auth: tuple[str, str],
+        login: Callable[[str, str], Awaitable[AuthResponse]],
+        refresh: Callable[[str], Awaitable[AuthResponse]],
+    ):
+        """
+        httpx auth flow for viper; injects the bearer token and retries once on a TOKEN_FAILURE.
+
+        Args:
+            auth (tuple[str, str]): username and password.
+            login (Callable[[str, str], Awaitable[AuthResponse]]): coroutine function to login with.
+            refresh (Callable[[str], Awaitable[AuthResponse]]): coroutine function to refresh the token with.
+        """
+        self._lock = asyncio.Lock()
+        self.auth_info = AuthInfo(*auth)
+        self.login = login
+        self.refresh = refresh
+
+    async def update_token(self, force: bool = False):
+        async with self._lock:
+            if self.auth_info.valid() and not force:
+                return
+
+            # requests made while updating pass through this flow as well; don't recurse into the lock
+            t = self._updating.set(True)
+
+            try:
+                if not self.auth_info.refresh_valid():
+                    raise ValueError
+
+                self.auth_info.update_with_response(
+                    await self.refresh(refresh_token=self.auth_info.refresh_token)
+                )
+            except (ValueError, httpx.HTTPStatusError) as e:
+                if isinstance(e, ValueError) or e.response.status_code == 401:
+                    self.auth_info.update_with_response(
+                        await self.login(
+                            username=self.auth_info.username,
+                            password=self.auth_info.password,
+                        )
+                    )
+                else:
+                    raise
+            finally:
+                self._updating.reset(t)
+
+    async def async_auth_flow(self, request: httpx.Request):
+        if not self._updating.get() and not self.auth_info.valid():
+            await self.update_token()
+
+        request.headers["Authorization"] = f"Bearer {self.auth_info.access_token}"
+
+        response = yield request
+
+        if response.status_code != 401 or self._updating.get():
+            return
+
+        await response.aread()
+
+        try:
+            error = ErrorItem.from_json(response.text)
+        except Exception:
+            return
+
+        if error.error.code != "TOKEN_FAILURE":
+            return
+
+        await self.update_token(True)
+
+        request.headers["Authorization"] = f"Bearer {self.auth_info.access_token}"
+
+        yield request
+
+
+class AsyncViperClient(AsyncCachedAPI):
+    def __init__(
+        self,
+        baseurl,
+        auth: tuple[str, str] = tuple(),
+        api_path=None,
+        proxies=None,
+        user_agent="ViperClient",
+        verify=True,
+        timeout=10,
+        max_sessions=128,
+        persist_self=True,
+        default_retries=3,
+        default_expiry=3600,
+        default_storage=None,
+        http2=True,
+        limits=None,
+        **request_kwargs,
+    ):
+        super().__init__(
+            baseurl,
+            api_path,
+            proxies,
+            user_agent,
+            verify,
+            timeout,
+            max_sessions,
+            persist_self,
+            default_retries,
+            default_expiry,
+            default_storage,
+            http2,
+            limits,
+            **request_kwargs,
+        )
+
+        self.auth = AsyncViperAuth(
+            auth,
+            self.v1.auth.login,
+            self.v1.auth.refresh_token,
+        )
+        self.request_kwargs.setdefault("auth", self.auth)
+
+    @property
+    def unversioned(self):
+        return UnversionedCollection(client=self)
+
+    @property
+    def v1(self):
+        return V1Collection(client=self)
@@ -89,6 +89,22 @@ class AdminCollection(EndpointCollection, prefix="admin"):
     def iter_audit_log(self, page: int = 0, size: int = 50, *args, **kwargs):
         yield from self.iter_endpoint(self.audit_log, page, size, *args, **kwargs)
 
+    @signature_of(audit_log)
+    async def aiter_audit_log(self, page: int = 0, size: int = 50, *args, **kwargs):
+        async for item in self.aiter_endpoint(
+            self.audit_log, page, size, *args, **kwargs
+        ):
+            yield item
+
     @signature_of(async_searches)
     def iter_async_searches(self, page: int = 0, size: int = 50, *args, **kwargs):
         yield from self.iter_endpoint(self.async_searches, page, size, *args, **kwargs)
+
+    @signature_of(async_searches)
+    async def aiter_async_searches(
+        self, page: int = 0, size: int = 50, *args, **kwargs
+    ):
+        async for item in self.aiter_endpoint(
+            self.async_searches, page, size, *args, **kwargs
+        ):
+            yield item
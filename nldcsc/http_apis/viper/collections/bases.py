@@ -1,5 +1,15 @@
+import inspect
 from dataclasses import dataclass
-from typing import TYPE_CHECKING, Callable, Generator, Generic, Type, TypeVar
+from typing import (
+    TYPE_CHECKING,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Generator,
+    Generic,
+    Type,
+    TypeVar,
+)
 
 from dataclasses_json import DataClassJsonMixin
 
@@ -72,6 +82,12 @@ class EndpointCollection:
         *args,
         **kwargs
     ) -> Generator[T, None, None]:
+        # async clients return coroutines
+        if inspect.iscoroutinefunction(self.client.call):
+            raise TypeError(
+                "iter_* methods need a sync client; use the aiter_* variant with an async client"
+            )
+
         r = function(page, size, *args, **kwargs)
 
         yield from r.items
@@ -83,5 +99,26 @@ class EndpointCollection:
 
             yield from r.items
 
+    async def aiter_endpoint(
+        self,
+        function: Callable[[int, int], Awaitable[PaginatedResponse[T]]],
+        page: int,
+        size: int,
+        *args,
+        **kwargs
+    ) -> AsyncGenerator[T, None]:
+        r = await function(page, size, *args, **kwargs)
+
+        for item in r.items:
+            yield item
+
+        while r.has_next_page:
+            page += 1
+
+            r = await function(page, size, *args, **kwargs)
+
+            for item in r.items:
+                yield item
+
     def call(self, method: str, resource: str = None, **kwargs):
         return self.client.call(method, self._build_resource_path(resource), **kwargs)
@@ -105,3 +105,12 @@ class KPICollection(EndpointCollection, prefix="kpi"):
         yield from self.iter_endpoint(
             partial(self.get_async_search, async_search_id), page, size, *args, **kwargs
         )
+
+    @signature_of(get_async_search)
+    async def aiter_async_search(
+        self, async_search_id: str, page: int = 0, size: int = 50, *args, **kwargs
+    ):
+        async for item in self.aiter_endpoint(
+            partial(self.get_async_search, async_search_id), page, size, *args, **kwargs
+        ):
+            yield item
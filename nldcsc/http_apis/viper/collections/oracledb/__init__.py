@@ -71,6 +71,11 @@ class OracleDBCollection(EndpointCollection, prefix="oracle_db"):
     def iter_search(self, page: int = 0, size: int = 50, *args, **kwargs):
         yield from self.iter_endpoint(self.search, page, size, *args, **kwargs)
 
+    @signature_of(search)
+    async def aiter_search(self, page: int = 0, size: int = 50, *args, **kwargs):
+        async for item in self.aiter_endpoint(self.search, page, size, *args, **kwargs):
+            yield item
+
     @as_object(OracleDBCreateResponse)
     def create(self, oracle_dbs: list[OracleDBItem | dict]):
         resource = "create"
@@ -28,6 +28,15 @@ class UserCollection(EndpointCollection, prefix="user"):
             params={"page": page, "size": size, "sort": sort, "state": state},
         )
 
-    @signature_of
+    @signature_of(async_searches)
     def iter_async_searches(self, page: int = 0, size: int = 50, *args, **kwargs):
         yield from self.iter_endpoint(self.async_searches, page, size, *args, **kwargs)
+
+    @signature_of(async_searches)
+    async def aiter_async_searches(
+        self, page: int = 0, size: int = 50, *args, **kwargs
+    ):
+        async for item in self.aiter_endpoint(
+            self.async_searches, page, size, *args, **kwargs
+        ):
+            yield item
@@ -1,5 +1,6 @@
+import inspect
 from functools import wraps
-from typing import Any, Callable, ParamSpec, Type, TypeVar
+from typing import Any, Awaitable, Callable, ParamSpec, Type, TypeVar
 
 T = TypeVar("T")
 P = ParamSpec("P")
@@ -18,10 +19,7 @@ def as_object(obj: Type[T], transform: Callable[..., T] = None):
     """
 
     def wrapper(f: Callable[P, dict]) -> Callable[P, T]:
-        @wraps(f)
-        def inner(*args, **kwargs) -> T:
-            r = f(*args, **kwargs)
-
+        def parse(r: dict) -> T:
             try:
                 if transform:
                     return transform(r)
@@ -33,6 +31,18 @@ def as_object(obj: Type[T], transform: Callable[..., T] = None):
                     f"Failed transforming response for {f.__name__} into {obj=} -> {e=}"
                 )
 
+        async def a_parse(r: Awaitable[dict]) -> T:
+            return parse(await r)
+
+        @wraps(f)
+        def inner(*args, **kwargs) -> T:
+            r = f(*args, **kwargs)
+
+            # async clients return an awaitable; transform once it is resolved
+            if inspect.isawaitable(r):
+                return a_parse(r)
+            return parse(r)
+
         return inner
 
     return wrapper
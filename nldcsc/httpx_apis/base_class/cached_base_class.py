@@ -0,0 +1,630 @@
+import hashlib
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from functools import partial
+from json import JSONDecodeError
+from typing import Any, Awaitable, Callable, Optional
+
+import httpx
+from httpx import AsyncBaseTransport, AsyncClient, Limits, Request, Response
+
+from nldcsc.http_apis.base_class.cached_api_base import CachedAPIBase
+
+NEVER_EXPIRE = -1
+DO_NOT_CACHE = 0
+
+
+def parse_cache_control(value: str | None) -> dict[str, str | None]:
+    """
+    Parse a Cache-Control header into a dict of directives.
+
+    Args:
+        value (str | None): raw header value.
+
+    Returns:
+        dict[str, str | None]: directive names (lowercase) mapped to their argument, if any.
+    """
+    directives = {}
+
+    if not value:
+        return directives
+
+    for part in value.split(","):
+        key, _, arg = part.strip().partition("=")
+
+        if key:
+            directives[key.lower()] = arg.strip('"') or None
+
+    return directives
+
+
+@dataclass
+class CachedResponse:
+    status_code: int
+    headers: list[tuple[str, str]]
+    content: bytes
+    expires: Optional[float] = None
+    created_at: float = field(default_factory=time.time)
+    vary: dict[str, Optional[str]] = field(default_factory=dict)
+
+    @property
+    def is_expired(self) -> bool:
+        return self.expires is not None and time.time() >= self.expires
+
+    @property
+    def etag(self) -> str | None:
+        return httpx.Headers(self.headers).get("etag")
+
+    @property
+    def last_modified(self) -> str | None:
+        return httpx.Headers(self.headers).get("last-modified")
+
+    @property
+    def can_revalidate(self) -> bool:
+        return self.etag is not None or self.last_modified is not None
+
+    def matches(self, request: Request) -> bool:
+        """
+        Whether the request carries the same values for the headers named in the Vary header of the response.
+        """
+        return all(
+            request.headers.get(name) == value for name, value in self.vary.items()
+        )
+
+    def to_response(self) -> Response:
+        return Response(
+            self.status_code,
+            headers=self.headers,
+            content=self.content,
+            extensions={"from_cache": True},
+        )
+
+
+class BaseCacheStorage(ABC):
+    """
+    Base class for the storage used by the AsyncCacheTransport.
+    """
+
+    def create_key(self, request: Request) -> str:
+        """
+        Creates a key that identifies the cached resource of a request; the Authorization header is part of the
+        key so responses are never shared between credentials. Headers named in the Vary header of a response
+        are matched against the stored response, see CachedResponse.matches.
+
+        Args:
+            request (Request): request to create a key for.
+
+        Returns:
+            str: cache key
+        """
+        authorization = request.headers.get("authorization", "")
+
+        return hashlib.sha256(
+            f"{request.method}:{request.url}:{authorization}".encode()
+        ).hexdigest()
+
+    @abstractmethod
+    async def get(self, key: str) -> CachedResponse | None: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: CachedResponse): ...
+
+    @abstractmethod
+    async def delete(self, key: str): ...
+
+    @abstractmethod
+    async def clear(self): ...
+
+
+class MemoryCacheStorage(BaseCacheStorage):
+    def __init__(self, max_entries: int = 4096):
+        """
+        In memory (lru) storage for cached responses.
+
+        Args:
+            max_entries (int, optional): max amount of responses to keep. Defaults to 4096.
+        """
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, CachedResponse] = OrderedDict()
+
+    async def get(self, key: str) -> CachedResponse | None:
+        try:
+            self.entries.move_to_end(key)
+        except KeyError:
+            return None
+        return self.entries[key]
+
+    async def set(self, key: str, value: CachedResponse):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(False)
+
+    async def delete(self, key: str):
+        self.entries.pop(key, None)
+
+    async def clear(self):
+        self.entries.clear()
+
+
+class AsyncCacheTransport(AsyncBaseTransport):
+    def __init__(
+        self,
+        transport: AsyncBaseTransport,
+        storage: BaseCacheStorage,
+        cache_control: bool = True,
+        expire_after: int = 3600,
+        allowable_methods: tuple[str, ...] = ("GET", "HEAD"),
+        allowable_codes: tuple[int, ...] = (200, 203, 300, 301, 308),
+    ):
+        """
+        Transport which caches responses following http caching semantics.
+
+        Responses are stored in the storage and served from it while fresh. Stale responses carrying an ETag
+        or Last-Modified header are revalidated using a conditional request; a 304 refreshes the stored response.
+
+        Args:
+            transport (AsyncBaseTransport): transport used to actually send requests.
+            storage (BaseCacheStorage): storage to keep the responses in.
+            cache_control (bool, optional): respect the Cache-Control and Expires headers. Defaults to True.
+            expire_after (int, optional): default expiry in seconds; -1 never expires, 0 disables caching. Defaults to 3600.
+            allowable_methods (tuple[str, ...], optional): methods that may be cached. Defaults to ("GET", "HEAD").
+            allowable_codes (tuple[int, ...], optional): status codes that may be cached. Defaults to (200, 203, 300, 301, 308).
+        """
+        self.transport = transport
+        self.storage = storage
+        self.cache_control = cache_control
+        self.expire_after = expire_after
+        self.allowable_methods = allowable_methods
+        self.allowable_codes = allowable_codes
+
+    def get_expiration(self, headers: httpx.Headers) -> float | None | bool:
+        """
+        Determine when a response expires.
+
+        Args:
+            headers (httpx.Headers): response headers.
+
+        Returns:
+            float | None | bool: expiry timestamp, None if it never expires or False if it may not be cached.
+        """
+        now = time.time()
+
+        if self.cache_control:
+            directives = parse_cache_control(headers.get("cache-control"))
+
+            if "no-store" in directives:
+                return False
+
+            if "no-cache" in directives:
+                return now
+
+            for directive in ("s-maxage", "max-age"):
+                try:
+                    return now + int(directives[directive])
+                except (KeyError, TypeError, ValueError):
+                    continue
+
+            if "expires" in headers:
+                try:
+                    return parsedate_to_datetime(headers["expires"]).timestamp()
+                except (TypeError, ValueError):
+                    return now
+
+        if self.expire_after == NEVER_EXPIRE:
+            return None
+
+        if self.expire_after == DO_NOT_CACHE:
+            return False
+
+        return now + self.expire_after
+
+    async def handle_async_request(self, request: Request) -> Response:
+        if request.method not in self.allowable_methods:
+            return await self.transport.handle_async_request(request)
+
+        directives = parse_cache_control(request.headers.get("cache-control"))
+
+        if "no-store" in directives:
+            return await self.transport.handle_async_request(request)
+
+        key = self.storage.create_key(request)
+        cached = await self.storage.get(key)
+
+        if cached is not None and not cached.matches(request):
+            # another variant (Vary) of the resource; replaced by the response to this request
+            cached = None
+
+        must_revalidate = "no-cache" in directives or directives.get("max-age") == "0"
+
+        if cached is not None:
+            if not cached.is_expired and not must_revalidate:
+                return cached.to_response()
+
+            if cached.can_revalidate:
+                if cached.etag:
+                    request.headers["If-None-Match"] = cached.etag
+                if cached.last_modified:
+                    request.headers["If-Modified-Since"] = cached.last_modified
+            else:
+                await self.storage.delete(key)
+                cached = None
+
+        response = await self.transport.handle_async_request(request)
+
+        if cached is not None and response.status_code == 304:
+            await response.aclose()
+
+            headers = httpx.Headers(cached.headers)
+            headers.update(response.headers)
+            headers.pop("content-length", None)
+
+            expires = self.get_expiration(headers)
+
+            if expires is False:
+                await self.storage.delete(key)
+            else:
+                cached.headers = headers.multi_items()
+                cached.expires = expires
+                await self.storage.set(key, cached)
+
+            return cached.to_response()
+
+        if response.status_code not in self.allowable_codes:
+            return response
+
+        expires = self.get_expiration(response.headers)
+        vary = [
+            name.strip().lower()
+            for name in response.headers.get("vary", "").split(",")
+            if name.strip()
+        ]
+
+        if expires is False or "*" in vary:
+            return response
+
+        try:
+            # keep the raw (still encoded) body; the client decodes it like any other response
+            content = b"".join([chunk async for chunk in response.aiter_raw()])
+        except httpx.StreamConsumed:
+            content = response.content
+        finally:
+            await response.aclose()
+
+        cached = CachedResponse(
+            status_code=response.status_code,
+            headers=response.headers.multi_items(),
+            content=content,
+            expires=expires,
+            vary={name: request.headers.get(name) for name in vary},
+        )
+        await self.storage.set(key, cached)
+
+        return Response(
+            response.status_code,
+            headers=response.headers,
+            content=content,
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class AsyncCachedAPI(CachedAPIBase[AsyncClient]):
+    _session_kwargs = ContextVar("async_session_kwargs")
+    _request_kwargs = ContextVar("async_requests_kwargs")
+
+    def __init__(
+        self,
+        baseurl: str,
+        api_path: Optional[str] = None,
+        proxies: Optional[dict[str, str]] = None,
+        user_agent: str = "AsyncCachedApi",
+        verify: bool | str = True,
+        timeout: int = 10,
+        max_sessions: int = 128,
+        persist_self: bool = True,
+        default_retries: int = 3,
+        default_expiry: int = 3600,
+        default_storage: Optional[Callable[[], BaseCacheStorage]] = None,
+        http2: bool = True,
+        limits: Optional[Limits] = None,
+        **request_kwargs,
+    ):
+        """
+        Async twin of the CachedAPI; backed by pooled httpx AsyncClients and an AsyncCacheTransport.
+
+        By default this class respects the cache control headers and revalidates stale responses using their ETag
+        or Last-Modified headers; this can be overriden by setting the default session kwargs or using the
+        override_session_options context manager when calling your resource.
+
+        When extending this class you probably should await self.call, which is responsible for orchestrating the
+        request; see call tree below.
+
+        self.call
+            -> self.build_url
+            -> self.get_session
+                -> self.create_transport
+                -> self.persist_session
+            -> self.request
+                -> self.unpack_response
+
+        Args:
+            baseurl (str): baseurl of the api resource.
+            api_path (Optional[str], optional): api path of the resource. Defaults to None.
+            proxies (Optional[dict[str, str]], optional): proxies to use; the https proxy takes precedence over http. Defaults to None.
+            user_agent (str, optional): user agent to use. Defaults to "AsyncCachedApi".
+            verify (bool | str, optional): certificate verification, when passing a string it should be a path to the certificate. Defaults to True.
+            timeout (int, optional): default timeout to use. Defaults to 10.
+            max_sessions (int, optional): max amount of unique clients this object may create and manage. Defaults to 128.
+            persist_self (bool, optional): allow reusing clients this object creates. Defaults to True.
+            default_retries (int, optional): amount of retries on connection errors. Defaults to 3.
+            default_expiry (int, optional): default cache expiry. Defaults to 3600.
+            default_storage (Optional[Callable[[], BaseCacheStorage]], optional): default cache storage to use. Defaults to an in memory storage shared by this object.
+            http2 (bool, optional): enable http2 on the clients. Defaults to True.
+            limits (Optional[Limits], optional): connection pool limits for each client. Defaults to the httpx defaults.
+
+        Kwargs
+            **request_kwargs (Any, optional): Kwargs to pass to every request created like authentication headers.
+
+        """
+        self.baseurl = baseurl.removesuffix("/")
+        self.api_path = api_path.strip("/") if api_path else None
+        self.proxies = proxies
+        self.user_agent = user_agent
+        self.verify = verify
+        self.timeout = timeout
+        self.max_sessions = max_sessions
+        self.persist = persist_self
+        self.retries = default_retries
+        self.http2 = http2
+        self.limits = limits if limits else Limits()
+
+        storage = MemoryCacheStorage()
+
+        self.default_storage = default_storage if default_storage else lambda: storage
+        self.default_session_kwargs = {
+            "cache_control": True,
+            "expire_after": default_expiry,
+        }
+        self.request_kwargs = request_kwargs
+        self.sessions: OrderedDict[str, AsyncClient] = OrderedDict()
+        self.headers = self.default_headers
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @property
+    def proxy(self) -> httpx.URL | None:
+        """
+        The proxy to use; httpx only supports a single proxy per transport.
+
+        Returns:
+            httpx.URL | None: proxy url
+        """
+        if not self.proxies:
+            return None
+
+        for scheme in ("https", "http"):
+            if scheme in self.proxies:
+                return httpx.URL(self.proxies[scheme])
+
+        raise ValueError(
+            "Argument 'proxies' must contain http or https key and a full url as value"
+        )
+
+    @contextmanager
+    def override_session_options(
+        self, cache_control: bool = True, expire_after: int = 3600
+    ):
+        """
+        Context manager to override the default kwargs handed to create or fetch a client.
+        """
+        try:
+            t = self._session_kwargs.set(
+                {"cache_control": cache_control, "expire_after": expire_after}
+            )
+            yield
+        finally:
+            self._session_kwargs.reset(t)
+
+    async def persist_session(self, key: str, session: AsyncClient):
+        """
+        Persist a client to this objects session store.
+
+        Evicts existing clients (lru) if max_sessions is exceeded.
+
+        Args:
+            key (str): session key.
+            session (AsyncClient): client to store.
+        """
+        for evicted in self.store_session(key, session):
+            await evicted.aclose()
+
+    async def close(self):
+        """
+        Close and evict all clients managed by this object.
+        """
+        while self.sessions:
+            _, session = self.sessions.popitem()
+            await session.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def create_transport(self) -> AsyncBaseTransport:
+        """
+        Create the pooled transport which is wrapped by the cache transport.
+
+        Returns:
+            AsyncBaseTransport: transport that sends the requests.
+        """
+        return httpx.AsyncHTTPTransport(
+            verify=self.verify,
+            http2=self.http2,
+            limits=self.limits,
+            proxy=self.proxy,
+            retries=self.retries,
+        )
+
+    async def get_session(
+        self,
+        force_recreate: bool = False,
+        allow_persist: bool = True,
+        **kwargs,
+    ) -> AsyncClient:
+        """
+        Create or get an existing client from the session store.
+
+        Args:
+            force_recreate (bool, optional): force recreating the client skipping the session store. Defaults to False.
+            allow_persist (bool, optional): allow saving a client to the session store if newly created. Defaults to True.
+
+        Kwargs:
+            **kwargs: Kwargs to this function will override the default session kwargs and the kwargs set when using the override_session_options context manager
+
+        Returns:
+            AsyncClient: a client that caches its responses.
+        """
+        storage: BaseCacheStorage = kwargs.pop("storage", self.default_storage())
+        kwargs = kwargs or self._session_kwargs.get(self.default_session_kwargs)
+
+        key = self.create_session_key(storage, **kwargs)
+
+        s = self.stored_session(key)
+
+        if s and not force_recreate:
+            self.logger.debug(f"Reusing existing session {s=}")
+
+            return s
+        elif s:
+            await s.aclose()
+
+        s = AsyncClient(
+            transport=AsyncCacheTransport(self.create_transport(), storage, **kwargs),
+            timeout=self.timeout,
+            follow_redirects=True,
+        )
+
+        if self.persist and allow_persist:
+            await self.persist_session(key, s)
+
+        return s
+
+    async def call(
+        self,
+        method: str,
+        resource: str = None,
+        unpack_response: bool = True,
+        ignore_api_path: bool = False,
+        allow_persist_session: bool = True,
+        force_recreate_session: bool = False,
+        **kwargs,
+    ):
+        """
+        Call an endpoint.
+
+        This function should be the default entrypoint when calling a resource. As it will orchestrate the correct flow to call the resource; see call tree below.
+
+        self.call
+            -> self.build_url
+            -> self.get_session
+                -> self.create_transport
+                -> self.persist_session
+            -> self.request
+                -> self.unpack_response
+
+        Args:
+            method (str): http method to use.
+            resource (str, optional): resource to call. Defaults to None.
+            unpack_response (bool, optional): if the response should be unpacked or returned as Response. Defaults to True.
+            ignore_api_path (bool, optional): if the default api path should be ignored. Defaults to False.
+            allow_persist_session (bool, optional): allow the created client to be persisted. Defaults to True.
+            force_recreate_session (bool, optional): force the client to be recreated. Defaults to False.
+
+        Kwargs:
+            **kwargs: additional kwargs to pass to the httpx request call.
+
+        Raises:
+            ValueError: If the http method passed is unknown.
+
+        Returns:
+            dict | list | str | Response: Depending if unpack_response is set and the type of data returned from the api.
+        """
+
+        if method not in self.methods:
+            raise ValueError(f"Unknown {method=}")
+
+        s = await self.get_session(
+            force_recreate=force_recreate_session, allow_persist=allow_persist_session
+        )
+
+        request_kwargs = self.request_options(self.request_kwargs, kwargs)
+
+        try:
+            response = await self.request(
+                partial(s.request, method.upper()),
+                self.build_url(resource, ignore_api_path),
+                unpack_response,
+                **request_kwargs,
+            )
+        finally:
+            if not self.persist or not allow_persist_session:
+                await s.aclose()
+        return response
+
+    def unpack_response(self, response: Response):
+        """
+        Unpacks a response object to by decoding it as JSON or raw text.
+
+        Args:
+            response (Response): response to unpack.
+
+        Returns:
+            dict | list | str: Depends of the type of data returned.
+        """
+        if response.is_error:
+            response.raise_for_status()
+
+        try:
+            return response.json()
+        except JSONDecodeError:
+            return response.text
+
+    async def request(
+        self,
+        method: Callable[..., Awaitable[Response]],
+        url: str,
+        unpack: bool,
+        timeout: int = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Send the actual request by awaiting the function provided on the client.
+
+        Args:
+            method (Callable[..., Awaitable[Response]]): client function to call.
+            url (str): url to pass to the client.
+            unpack (bool): if the response should be unpacked.
+            timeout (int, optional): overriding timeout otherwise the default timeout is used. Defaults to None.
+
+        Returns:
+            dict | list | str | Response: Depending if unpack_response is set and the type of data returned from the api.
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        r = await method(url, timeout=timeout, **kwargs)
+
+        if unpack:
+            return self.unpack_response(r)
+        return r
@@ -0,0 +1,125 @@
+import dataclasses
+import json
+from functools import lru_cache
+from typing import (
+    Any,
+    Callable,
+    Type,
+    TypeVar,
+    get_args,
+    get_origin,
+    get_type_hints,
+)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None
+
+T = TypeVar("T")
+
+
+def decode_json(content: bytes | str) -> Any:
+    """
+    Decode a json document with orjson when it is installed, json otherwise.
+
+    Args:
+        content (bytes | str): json document.
+
+    Returns:
+        Any: decoded document.
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+
+    return json.loads(content)
+
+
+def _converter(type_: Type[T]) -> Callable[[Any], T]:
+    """
+    Build a function converting decoded json into type_ the way the existing objects are built.
+    """
+    if type_ is Any or type_ is dict:
+        return lambda value: value
+
+    if get_origin(type_) is list:
+        (item_type,) = get_args(type_) or (Any,)
+        convert = _converter(item_type)
+
+        return lambda value: [convert(item) for item in value]
+
+    if hasattr(type_, "from_dict"):
+        # dataclasses_json objects
+        return type_.from_dict
+
+    if dataclasses.is_dataclass(type_):
+        converters = {
+            name: _converter(hint) for name, hint in get_type_hints(type_).items()
+        }
+
+        def convert_dataclass(value):
+            if not isinstance(value, dict):
+                return value
+
+            # unknown keys are ignored, like msgspec does
+            return type_(
+                **{
+                    key: converters[key](item)
+                    for key, item in value.items()
+                    if key in converters
+                }
+            )
+
+        return convert_dataclass
+
+    if isinstance(type_, type):
+        return lambda value: type_(**value) if isinstance(value, dict) else value
+
+    return lambda value: value
+
+
+def _dec_hook(type_: Type[T], value: Any) -> T:
+    # msgspec leaves classes it does not know to the hook, with their decoded value
+    return _converter(type_)(value)
+
+
+@lru_cache(maxsize=None)
+def get_decoder(type_: Type[T] = None) -> Callable[[bytes | str], T]:
+    """
+    Get a (cached) function decoding a json document into type_.
+
+    With msgspec installed msgspec structs, dataclasses and typed collections are decoded straight from
+    the document without building intermediate dicts; other classes within them are built from their
+    decoded value by the constructor. Otherwise (or for dataclasses_json objects) the document is decoded
+    with decode_json and converted using from_dict or the constructor of type_.
+
+    Args:
+        type_ (Type[T], optional): target type; None decodes to plain python objects. Defaults to None.
+
+    Returns:
+        Callable[[bytes | str], T]: decoder.
+    """
+    if type_ is None:
+        return decode_json
+
+    if msgspec is not None and not hasattr(type_, "from_dict"):
+        try:
+            return msgspec.json.Decoder(type_, dec_hook=_dec_hook).decode
+        except TypeError:
+            pass
+
+    convert = _converter(type_)
+
+    return lambda content: convert(decode_json(content))
+
+
+def decode(content: bytes | str, type_: Type[T] = None) -> T:
+    """
+    Decode a json document into type_; see get_decoder.
+    """
+    return get_decoder(type_)(content)
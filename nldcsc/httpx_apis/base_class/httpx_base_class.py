@@ -1,8 +1,14 @@
+import asyncio
 import contextlib
+import inspect
 import logging
+import os
+import threading
 from collections import namedtuple
-from typing import Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, BinaryIO, Callable, Iterable, Iterator
 
+import aiofiles
 import httpx
 from httpx import (
     Client,
@@ -10,9 +16,17 @@ from httpx import (
     HTTPTransport,
     AsyncHTTPTransport,
     HTTPError,
+    Limits,
     Response,
 )
 
+from nldcsc.http_apis.base_class.transfer import (
+    DEFAULT_CHUNK_SIZE,
+    TransferHasher,
+    TransferResult,
+)
+from nldcsc.httpx_apis.base_class.decoding import decode
+from nldcsc.httpx_apis.base_class.retry import AsyncRetryTransport, RetryTransport
 from nldcsc.loggers.app_logger import AppLogger
 
 logging.setLoggerClass(AppLogger)
@@ -30,6 +44,19 @@ class HttpxBaseClass(object):
     ):
         """
         The Generic api caller handles all communication towards an api resource.
+
+        Calls share a client owned by the instance which is created on first use, so connections (and
+        their http2 and tls sessions) are reused. The sync client is shared between threads; the async
+        client is bound to the event loop it was created on and replaced when used from another loop.
+        Close the clients with close() / aclose() or by using the instance as (async) context manager.
+        The connection pool is configured with the 'limits' kwarg (httpx.Limits).
+
+        List resources are requested concurrently, at most 'max_concurrency' (kwarg, defaults to 10) at a
+        time; keep it at or below the max_connections of the limits.
+
+        Retries are opt-in: failed requests are retried according to the 'retry_policy' kwarg (RetryPolicy,
+        only idempotent methods by default), its stats are available through retry_stats. Without it only
+        connection errors are retried by the transport.
         """
         self.logger = logging.getLogger(self.__class__.__name__)
 
@@ -48,6 +75,23 @@ class HttpxBaseClass(object):
         else:
             self.http2 = kwargs.pop("http2")
 
+        if "limits" not in kwargs:
+            self.limits = Limits(
+                max_connections=100, max_keepalive_connections=20, keepalive_expiry=30
+            )
+        else:
+            self.limits = kwargs.pop("limits")
+
+        if "max_concurrency" not in kwargs:
+            self.max_concurrency = 10
+        else:
+            self.max_concurrency = kwargs.pop("max_concurrency")
+
+        if "retry_policy" not in kwargs:
+            self.retry_policy = None
+        else:
+            self.retry_policy = kwargs.pop("retry_policy")
+
         self.baseurl = baseurl
         self.api_path = api_path
 
@@ -76,6 +120,13 @@ class HttpxBaseClass(object):
 
         self.myheaders = self.__default_headers
 
+        self._client: Client | None = None
+        self._async_client: AsyncClient | None = None
+        self._async_client_loop: asyncio.AbstractEventLoop | None = None
+        self._client_lock = threading.Lock()
+
+        self.response_types: dict[str, type] = {}
+
     def __repr__(self) -> str:
         """return a string representation of the obj GenericApi"""
         return f"<< {self.__class__.__name__}:{self.baseurl} >>"
@@ -142,7 +193,17 @@ class HttpxBaseClass(object):
         self.myheaders = None
 
     def create_sync_client(self, **kwargs) -> Client:
-        transport = HTTPTransport(retries=3, http2=self.http2, verify=self.verify)
+        # connect errors are retried by the RetryTransport when there is a policy, not by both
+        transport = HTTPTransport(
+            retries=3 if self.retry_policy is None else 0,
+            http2=self.http2,
+            verify=self.verify,
+            limits=self.limits,
+        )
+
+        if self.retry_policy is not None:
+            transport = RetryTransport(transport, self.retry_policy)
+
         client = httpx.Client(
             verify=self.verify,
             proxy=self.proxies,
@@ -155,7 +216,17 @@ class HttpxBaseClass(object):
         return client
 
     def create_async_client(self, **kwargs) -> AsyncClient:
-        transport = AsyncHTTPTransport(retries=3, http2=self.http2, verify=self.verify)
+        # connect errors are retried by the AsyncRetryTransport when there is a policy, not by both
+        transport = AsyncHTTPTransport(
+            retries=3 if self.retry_policy is None else 0,
+            http2=self.http2,
+            verify=self.verify,
+            limits=self.limits,
+        )
+
+        if self.retry_policy is not None:
+            transport = AsyncRetryTransport(transport, self.retry_policy)
+
         client = httpx.AsyncClient(
             verify=self.verify,
             proxy=self.proxies,
@@ -173,6 +244,118 @@ class HttpxBaseClass(object):
         else:
             return self.create_sync_client(**self.kwargs)
 
+    def register_response_type(self, endpoint: str, response_type: type):
+        """
+        Register the type responses of an endpoint are decoded into by decode_response.
+
+        Args:
+            endpoint (str): name of the endpoint (method) as used by the subclass.
+            response_type (type): msgspec struct, dataclass, dataclasses_json object or typed collection.
+        """
+        self.response_types[endpoint] = response_type
+
+    def decode_response(
+        self,
+        response: Response,
+        response_type: type = None,
+        endpoint: str = None,
+        default: Callable[[Response], Any] = None,
+    ) -> Any:
+        """
+        Decode the json body of a response, straight into a typed object when a type is given or registered
+        for the endpoint; otherwise default (if given) is used to parse the response.
+
+        Args:
+            response (Response): response to decode.
+            response_type (type, optional): type to decode into. Defaults to None.
+            endpoint (str, optional): endpoint to look up a registered type for. Defaults to None.
+            default (Callable[[Response], Any], optional): parser used without a type. Defaults to None.
+
+        Returns:
+            Any: decoded response.
+        """
+        response_type = response_type or self.response_types.get(endpoint)
+
+        if response_type is None and default is not None:
+            return default(response)
+
+        return decode(response.content, response_type)
+
+    @property
+    def retry_stats(self) -> dict:
+        """
+        Property returning the retry counters of the retry policy
+        """
+        if self.retry_policy is None:
+            return {}
+
+        return self.retry_policy.stats.snapshot()
+
+    @property
+    def client(self) -> Client:
+        """
+        Property returning the persistent sync client; created on first use
+        """
+        if self._client is None or self._client.is_closed:
+            with self._client_lock:
+                if self._client is None or self._client.is_closed:
+                    self._client = self.create_sync_client(**self.kwargs)
+
+        return self._client
+
+    @property
+    def async_client(self) -> AsyncClient:
+        """
+        Property returning the persistent async client of the running event loop; created on first use
+        """
+        loop = asyncio.get_running_loop()
+
+        if (
+            self._async_client is None
+            or self._async_client.is_closed
+            or self._async_client_loop is not loop
+        ):
+            # a client of another (closed) loop can not be closed from here; its connections are dropped
+            self._async_client = self.create_async_client(**self.kwargs)
+            self._async_client_loop = loop
+
+        return self._async_client
+
+    def close(self):
+        """
+        Method to close the persistent sync client
+        """
+        with self._client_lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    async def aclose(self):
+        """
+        Method to close the persistent clients
+        """
+        self.close()
+
+        if self._async_client is not None:
+            client, self._async_client = self._async_client, None
+
+            if self._async_client_loop is asyncio.get_running_loop():
+                await client.aclose()
+
+            self._async_client_loop = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
     @contextlib.contextmanager
     def get_cm_client(self) -> Client | AsyncClient:
         client = self.get_client()
@@ -193,58 +376,61 @@ class HttpxBaseClass(object):
         timeout: int = 60,
         stream: bool = False,
         generic_request: bool = False,
+        max_concurrency: int = None,
+        return_exceptions: bool = False,
         **kwargs,
     ) -> Response | str | Any:
         """
         Method for requesting free format api resources
+
+        A list of resources is requested concurrently, limited by max_concurrency (defaults to the
+        instance's max_concurrency), and returns the responses in the order of the resources. With
+        return_exceptions exceptions are returned in place of their response instead of raised.
         """
         try:
+            client = self.client
+
             if stream:
                 request_api_resource = {
                     "headers": self.myheaders,
                     "timeout": timeout,
                 }
 
-                with self.get_client() as client:
-                    if isinstance(resources, str):
-                        with client.stream(
-                            method, resources, **request_api_resource
-                        ) as response_stream:
-                            # returning complete body; but other iter_* methods might be better suited for
-                            # specific cases
-                            return response_stream.read()
-                    else:
-                        raise TypeError(
-                            "For streaming responses; resources must be a string"
-                        )
+                if isinstance(resources, str):
+                    with client.stream(
+                        method, self._build_url(resources), **request_api_resource
+                    ) as response_stream:
+                        # returning complete body; use iter_bytes or download_to to stream in chunks
+                        return response_stream.read()
+                else:
+                    raise TypeError(
+                        "For streaming responses; resources must be a string"
+                    )
             else:
-                with self.get_client() as client:
-                    if isinstance(resources, list):
-                        results = []
-                        for resource in resources:
-                            results.append(
-                                self._s_connect(
-                                    method=method,
-                                    resource=resource,
-                                    client=client,
-                                    data=data,
-                                    timeout=timeout,
-                                    generic_request=generic_request,
-                                    **kwargs,
-                                )
-                            )
-                    else:
-                        resource = resources
-                        results = self._s_connect(
-                            method=method,
-                            resource=resource,
-                            client=client,
-                            data=data,
-                            timeout=timeout,
-                            generic_request=generic_request,
-                            **kwargs,
-                        )
-                    return results
+                if isinstance(resources, list):
+                    results = self._s_connect_many(
+                        resources,
+                        max_concurrency or self.max_concurrency,
+                        return_exceptions,
+                        method=method,
+                        client=client,
+                        data=data,
+                        timeout=timeout,
+                        generic_request=generic_request,
+                        **kwargs,
+                    )
+                else:
+                    resource = resources
+                    results = self._s_connect(
+                        method=method,
+                        resource=resource,
+                        client=client,
+                        data=data,
+                        timeout=timeout,
+                        generic_request=generic_request,
+                        **kwargs,
+                    )
+                return results
         except HTTPError:
             raise
         except Exception:
@@ -258,63 +444,312 @@ class HttpxBaseClass(object):
         timeout: int = 60,
         stream: bool = False,
         generic_request: bool = False,
+        max_concurrency: int = None,
+        return_exceptions: bool = False,
         **kwargs,
     ) -> Response | str | Any:
         """
         Method for requesting free format api resources
+
+        A list of resources is requested concurrently, limited by max_concurrency (defaults to the
+        instance's max_concurrency), and returns the responses in the order of the resources. With
+        return_exceptions exceptions are returned in place of their response instead of raised.
         """
         try:
+            client = self.async_client
+
             if stream:
                 request_api_resource = {
                     "headers": self.myheaders,
                     "timeout": timeout,
                 }
 
-                async with self.get_client() as client:
-                    if isinstance(resources, str):
-                        with client.stream(
-                            method, resources, **request_api_resource
-                        ) as response_stream:
-                            # returning complete body; but other iter_* methods might be better suited for
-                            # specific cases
-                            return await response_stream.read()
-                    else:
-                        raise TypeError(
-                            "For streaming responses; resources must be a string"
-                        )
+                if isinstance(resources, str):
+                    async with client.stream(
+                        method, self._build_url(resources), **request_api_resource
+                    ) as response_stream:
+                        # returning complete body; use aiter_bytes or a_download_to to stream in chunks
+                        return await response_stream.aread()
+                else:
+                    raise TypeError(
+                        "For streaming responses; resources must be a string"
+                    )
             else:
-                async with self.get_client() as client:
-                    if isinstance(resources, list):
-                        results = []
-                        for resource in resources:
-                            results.append(
-                                await self._a_connect(
-                                    method=method,
-                                    resource=resource,
-                                    client=client,
-                                    data=data,
-                                    timeout=timeout,
-                                    generic_request=generic_request,
-                                    **kwargs,
-                                )
-                            )
-                    else:
-                        resource = resources
-                        results = await self._a_connect(
-                            method=method,
-                            resource=resource,
-                            client=client,
-                            data=data,
-                            timeout=timeout,
-                            generic_request=generic_request,
-                            **kwargs,
-                        )
-                    return results
+                if isinstance(resources, list):
+                    results = await self._a_connect_many(
+                        resources,
+                        max_concurrency or self.max_concurrency,
+                        return_exceptions,
+                        method=method,
+                        client=client,
+                        data=data,
+                        timeout=timeout,
+                        generic_request=generic_request,
+                        **kwargs,
+                    )
+                else:
+                    resource = resources
+                    results = await self._a_connect(
+                        method=method,
+                        resource=resource,
+                        client=client,
+                        data=data,
+                        timeout=timeout,
+                        generic_request=generic_request,
+                        **kwargs,
+                    )
+                return results
         except HTTPError:
             raise
         except Exception:
             raise
 
+    def _stream_kwargs(self, timeout: int, kwargs: dict) -> dict:
+        return {"headers": self.myheaders, "timeout": timeout, **kwargs}
+
+    @staticmethod
+    def _content_length(response: Response) -> int | None:
+        # iter_bytes decodes compressed bodies, the content length is that of the encoded body
+        if "Content-Length" in response.headers and (
+            "Content-Encoding" not in response.headers
+        ):
+            return int(response.headers["Content-Length"])
+
+        return None
+
+    def iter_bytes(
+        self,
+        method: str,
+        resource: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        timeout: int = 60,
+        hasher: TransferHasher = None,
+        **kwargs,
+    ) -> Iterator[bytes]:
+        """
+        Stream a response body in chunks without holding it in memory.
+
+        Args:
+            method (str): http method.
+            resource (str): resource to request.
+            chunk_size (int, optional): maximum size of the chunks. Defaults to DEFAULT_CHUNK_SIZE.
+            timeout (int, optional): request timeout. Defaults to 60.
+            hasher (TransferHasher, optional): hasher to feed the chunks to; its total is set from the
+                content length. Defaults to None.
+            **kwargs: additional arguments for the request, e.g. params.
+
+        Raises:
+            httpx.HTTPStatusError: when the server returns an error status.
+
+        Yields:
+            bytes: chunks of the body
+        """
+        with self.client.stream(
+            method, self._build_url(resource), **self._stream_kwargs(timeout, kwargs)
+        ) as response:
+            response.raise_for_status()
+
+            if hasher is not None and hasher.total is None:
+                hasher.total = self._content_length(response)
+
+            for chunk in response.iter_bytes(chunk_size):
+                if hasher is not None:
+                    hasher.update(chunk)
+
+                yield chunk
+
+    async def aiter_bytes(
+        self,
+        method: str,
+        resource: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        timeout: int = 60,
+        hasher: TransferHasher = None,
+        **kwargs,
+    ) -> AsyncIterator[bytes]:
+        """
+        Async variant of iter_bytes.
+
+        Raises:
+            httpx.HTTPStatusError: when the server returns an error status.
+
+        Yields:
+            bytes: chunks of the body
+        """
+        async with self.async_client.stream(
+            method, self._build_url(resource), **self._stream_kwargs(timeout, kwargs)
+        ) as response:
+            response.raise_for_status()
+
+            if hasher is not None and hasher.total is None:
+                hasher.total = self._content_length(response)
+
+            async for chunk in response.aiter_bytes(chunk_size):
+                if hasher is not None:
+                    hasher.update(chunk)
+
+                yield chunk
+
+    def download_to(
+        self,
+        resource: str,
+        destination: str | os.PathLike | BinaryIO,
+        method: str = "GET",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        progress: Callable[[int, int | None], Any] = None,
+        algorithms: Iterable[str] = ("sha256",),
+        timeout: int = 60,
+        **kwargs,
+    ) -> TransferResult:
+        """
+        Stream a response body to a file without holding it in memory.
+
+        A path is written to '<path>.part' first and moved in place once the download is complete.
+
+        Args:
+            resource (str): resource to download.
+            destination (str | os.PathLike | BinaryIO): path or binary file object to write to.
+            method (str, optional): http method. Defaults to "GET".
+            chunk_size (int, optional): maximum size of the chunks. Defaults to DEFAULT_CHUNK_SIZE.
+            progress (Callable[[int, int | None], Any], optional): called with the written and total bytes after every chunk. Defaults to None.
+            algorithms (Iterable[str], optional): hashlib algorithms to compute while writing. Defaults to ("sha256",).
+            timeout (int, optional): request timeout. Defaults to 60.
+            **kwargs: additional arguments for the request, e.g. params.
+
+        Returns:
+            TransferResult: amount of bytes written and their digests.
+        """
+        hasher = TransferHasher(algorithms, progress)
+        chunks = self.iter_bytes(
+            method, resource, chunk_size, timeout, hasher, **kwargs
+        )
+
+        if hasattr(destination, "write"):
+            for chunk in chunks:
+                destination.write(chunk)
+
+            return hasher.result()
+
+        part = f"{os.fspath(destination)}.part"
+
+        try:
+            with open(part, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+
+            os.replace(part, destination)
+        except BaseException:
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+
+        return hasher.result()
+
+    async def a_download_to(
+        self,
+        resource: str,
+        destination: str | os.PathLike | BinaryIO,
+        method: str = "GET",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        progress: Callable[[int, int | None], Any] = None,
+        algorithms: Iterable[str] = ("sha256",),
+        timeout: int = 60,
+        **kwargs,
+    ) -> TransferResult:
+        """
+        Async variant of download_to; paths are written with aiofiles and file objects may have a sync or
+        async write method.
+
+        Returns:
+            TransferResult: amount of bytes written and their digests.
+        """
+        hasher = TransferHasher(algorithms, progress)
+        chunks = self.aiter_bytes(
+            method, resource, chunk_size, timeout, hasher, **kwargs
+        )
+
+        if hasattr(destination, "write"):
+            async for chunk in chunks:
+                if inspect.isawaitable(written := destination.write(chunk)):
+                    await written
+
+            return hasher.result()
+
+        part = f"{os.fspath(destination)}.part"
+
+        try:
+            async with aiofiles.open(part, "wb") as f:
+                async for chunk in chunks:
+                    await f.write(chunk)
+
+            os.replace(part, destination)
+        except BaseException:
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+
+        return hasher.result()
+
+    def _s_connect_many(
+        self,
+        resources: list[str],
+        max_concurrency: int,
+        return_exceptions: bool,
+        **kwargs,
+    ) -> list[Response | BaseException]:
+        """
+        Send a request per resource on a thread pool sharing the client
+        """
+
+        def connect(resource: str):
+            try:
+                return self._s_connect(resource=resource, **kwargs)
+            except Exception as err:
+                if not return_exceptions:
+                    raise
+                return err
+
+        if max_concurrency <= 1 or len(resources) <= 1:
+            return [connect(resource) for resource in resources]
+
+        with ThreadPoolExecutor(
+            max_workers=min(max_concurrency, len(resources)),
+            thread_name_prefix=self.__class__.__name__,
+        ) as pool:
+            futures = [pool.submit(connect, resource) for resource in resources]
+
+            try:
+                return [future.result() for future in futures]
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    async def _a_connect_many(
+        self,
+        resources: list[str],
+        max_concurrency: int,
+        return_exceptions: bool,
+        **kwargs,
+    ) -> list[Response | BaseException]:
+        """
+        Send a request per resource concurrently, at most max_concurrency at a time
+        """
+        semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+
+        async def connect(resource: str):
+            async with semaphore:
+                return await self._a_connect(resource=resource, **kwargs)
+
+        tasks = [asyncio.ensure_future(connect(resource)) for resource in resources]
+
+        try:
+            return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
     def _s_connect(
         self,
         method: str,
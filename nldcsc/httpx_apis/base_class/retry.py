@@ -0,0 +1,318 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+from typing import Iterable
+
+import httpx
+from httpx import AsyncBaseTransport, BaseTransport, Request, Response
+
+from nldcsc.http_apis.base_class.rate_limit import parse_retry_after
+from nldcsc.loggers.app_logger import AppLogger
+
+try:
+    from httpx._multipart import MultipartStream
+except ImportError:  # pragma: no cover
+    MultipartStream = None
+
+logging.setLoggerClass(AppLogger)
+
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"])
+RETRY_STATUS_CODES = frozenset([429, 502, 503, 504])
+
+
+class RetryBudget:
+    def __init__(
+        self, ratio: float = 0.2, min_retries_per_second: float = 1, ttl: float = 10
+    ):
+        """
+        Limits retries to a fraction of the requests made during the last ttl seconds, so a struggling
+        upstream is not flooded with retries; a minimum amount of retries per second is always allowed.
+
+        Args:
+            ratio (float, optional): allowed retries per request. Defaults to 0.2.
+            min_retries_per_second (float, optional): retries allowed regardless of the amount of requests. Defaults to 1.
+            ttl (float, optional): seconds requests and retries are remembered. Defaults to 10.
+        """
+        self.ratio = ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.ttl = ttl
+        self.requests: deque[float] = deque()
+        self.retries: deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        for events in (self.requests, self.retries):
+            while events and events[0] <= now - self.ttl:
+                events.popleft()
+
+    def deposit(self):
+        """
+        Register a request
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self.requests.append(now)
+
+    def withdraw(self) -> bool:
+        """
+        Register a retry if the budget allows it.
+
+        Returns:
+            bool: True if the retry may be made.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+
+            allowed = self.min_retries_per_second * self.ttl + self.ratio * len(
+                self.requests
+            )
+
+            if len(self.retries) >= allowed:
+                return False
+
+            self.retries.append(now)
+
+            return True
+
+
+class RetryStats:
+    def __init__(self):
+        """
+        Counters of the requests and retries made with a retry policy.
+        """
+        self.requests = 0
+        self.retries = 0
+        self.reasons: Counter[str] = Counter()
+        self.exhausted = 0
+        self.budget_exhausted = 0
+        self._lock = threading.Lock()
+
+    def count(self, field: str, reason: str = None):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+            if reason is not None:
+                self.reasons[reason] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "reasons": dict(self.reasons),
+                "exhausted": self.exhausted,
+                "budget_exhausted": self.budget_exhausted,
+            }
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        total: int = 3,
+        status_forcelist: Iterable[int] = RETRY_STATUS_CODES,
+        allowed_methods: Iterable[str] = IDEMPOTENT_METHODS,
+        backoff_factor: float = 0.5,
+        backoff_max: float = 30,
+        respect_retry_after: bool = True,
+        max_retry_after: float = 120,
+        budget: RetryBudget = None,
+    ):
+        """
+        Decides if and when a request is retried.
+
+        Responses with a status in status_forcelist and errors after the request was (possibly) sent are
+        only retried for allowed_methods. Connection errors are retried for every method, as the request
+        never reached the server. Delays use exponential backoff with full jitter, or the Retry-After
+        header of the response when present.
+
+        Args:
+            total (int, optional): maximum amount of retries per request. Defaults to 3.
+            status_forcelist (Iterable[int], optional): statuses to retry. Defaults to 429, 502, 503 and 504.
+            allowed_methods (Iterable[str], optional): methods that are safe to send again. Defaults to the idempotent methods.
+            backoff_factor (float, optional): base of the backoff; attempt n waits up to factor * 2 ** n seconds. Defaults to 0.5.
+            backoff_max (float, optional): maximum backoff in seconds. Defaults to 30.
+            respect_retry_after (bool, optional): wait as long as the Retry-After header asks. Defaults to True.
+            max_retry_after (float, optional): give up when Retry-After asks to wait longer. Defaults to 120.
+            budget (RetryBudget, optional): budget shared by all requests of the policy. Defaults to RetryBudget().
+        """
+        self.total = total
+        self.status_forcelist = frozenset(status_forcelist)
+        self.allowed_methods = frozenset(m.upper() for m in allowed_methods)
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.respect_retry_after = respect_retry_after
+        self.max_retry_after = max_retry_after
+        self.budget = budget or RetryBudget()
+        self.stats = RetryStats()
+
+    @staticmethod
+    def replayable(request: Request) -> bool:
+        """
+        Check if the body of a request can be sent again
+        """
+        if isinstance(request.stream, httpx.ByteStream):
+            return True
+
+        return MultipartStream is not None and isinstance(
+            request.stream, MultipartStream
+        )
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_factor * 2**attempt)
+        )
+
+    def next_delay(
+        self,
+        request: Request,
+        attempt: int,
+        response: Response = None,
+        error: Exception = None,
+    ) -> float | None:
+        """
+        Determine the delay before retrying a request.
+
+        Args:
+            request (Request): request that was sent.
+            attempt (int): amount of retries made so far.
+            response (Response, optional): response that was received. Defaults to None.
+            error (Exception, optional): transport error that was raised. Defaults to None.
+
+        Returns:
+            float | None: seconds to wait before retrying or None if the request should not be retried.
+        """
+        if response is not None:
+            if response.status_code not in self.status_forcelist:
+                return None
+
+            reason = str(response.status_code)
+            allowed = request.method in self.allowed_methods
+        else:
+            reason = error.__class__.__name__
+            allowed = isinstance(
+                error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+            ) or (request.method in self.allowed_methods)
+
+        if not allowed or not self.replayable(request):
+            return None
+
+        if attempt >= self.total:
+            self.stats.count("exhausted")
+            return None
+
+        delay = self.backoff(attempt)
+
+        if response is not None and self.respect_retry_after:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+            if retry_after is not None:
+                if retry_after > self.max_retry_after:
+                    self.stats.count("exhausted")
+                    return None
+
+                delay = retry_after
+
+        if not self.budget.withdraw():
+            self.stats.count("budget_exhausted")
+            return None
+
+        self.stats.count("retries", reason)
+
+        return delay
+
+
+class RetryTransport(BaseTransport):
+    def __init__(self, transport: BaseTransport, policy: RetryPolicy):
+        """
+        Transport retrying the requests of the wrapped transport according to a retry policy.
+
+        Args:
+            transport (BaseTransport): transport that sends the requests.
+            policy (RetryPolicy): policy deciding on retries.
+        """
+        self.transport = transport
+        self.policy = policy
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def handle_request(self, request: Request) -> Response:
+        self.policy.stats.count("requests")
+        self.policy.budget.deposit()
+
+        attempt = 0
+
+        while True:
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError as err:
+                if (
+                    delay := self.policy.next_delay(request, attempt, error=err)
+                ) is None:
+                    raise
+            else:
+                if (
+                    delay := self.policy.next_delay(request, attempt, response=response)
+                ) is None:
+                    return response
+
+                response.close()
+
+            self.logger.debug(
+                f"Retrying {request.method} {request.url} in {delay:.2f}s (attempt {attempt + 1})"
+            )
+
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRetryTransport(AsyncBaseTransport):
+    def __init__(self, transport: AsyncBaseTransport, policy: RetryPolicy):
+        """
+        Async transport retrying the requests of the wrapped transport according to a retry policy.
+
+        Args:
+            transport (AsyncBaseTransport): transport that sends the requests.
+            policy (RetryPolicy): policy deciding on retries.
+        """
+        self.transport = transport
+        self.policy = policy
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def handle_async_request(self, request: Request) -> Response:
+        self.policy.stats.count("requests")
+        self.policy.budget.deposit()
+
+        attempt = 0
+
+        while True:
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError as err:
+                if (
+                    delay := self.policy.next_delay(request, attempt, error=err)
+                ) is None:
+                    raise
+            else:
+                if (
+                    delay := self.policy.next_delay(request, attempt, response=response)
+                ) is None:
+                    return response
+
+                await response.aclose()
+
+            self.logger.debug(
+                f"Retrying {request.method} {request.url} in {delay:.2f}s (attempt {attempt + 1})"
+            )
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self.transport.aclose()
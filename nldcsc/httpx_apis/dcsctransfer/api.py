@@ -1,7 +1,11 @@
 import asyncio
+import dataclasses
+import threading
+import time
 from collections import defaultdict
 from collections.abc import Callable
-from functools import partial, wraps
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache, partial, wraps
 import math
 import os
 from typing import (
@@ -15,8 +19,31 @@ from typing import (
 )
 from aiofiles.threadpool.text import AsyncTextIOWrapper
 
-from httpx import Response
+from httpx import HTTPError, HTTPStatusError, Response, codes
+from nldcsc.httpx_apis.base_class.decoding import decode_json
 from nldcsc.httpx_apis.base_class.httpx_base_class import HttpxBaseClass
+from nldcsc.httpx_apis.dcsctransfer.hash_cache import (
+    MISSING,
+    HashCache,
+    ScalableBloomFilter,
+)
+from nldcsc.httpx_apis.dcsctransfer.listing import (
+    HashIndex,
+    HashListing,
+    ListingCheckpoint,
+)
+from nldcsc.httpx_apis.dcsctransfer.upload import (
+    ChunkContent,
+    FileDigest,
+    MappedFile,
+    MultipartChunk,
+    UploadFile,
+    UploadJournal,
+    a_read_chunk,
+    file_identity,
+    load_chunk,
+    read_chunk,
+)
 
 T = TypeVar("T")
 P = ParamSpec("P")
@@ -29,26 +56,43 @@ def signature_of(_: Callable[P, Any]) -> Callable[[Callable[..., T]], Callable[P
     return wrapper
 
 
+def _require_async_client(api: "DCSCTransferAPI"):
+    if not api.use_async_client:
+        raise AttributeError(
+            "You are attempting to call a async method whilst using a sync client!"
+        )
+
+
+def _require_sync_client(api: "DCSCTransferAPI"):
+    if api.use_async_client:
+        raise AttributeError(
+            "You are attempting to call a sync method whilst using a async client!"
+        )
+
+
 def async_call(
     calls: Callable[P, Any], parser: Callable[[Response | str | Any], T] = None
 ) -> Callable[[Callable[..., Any]], Callable[P, Awaitable[Response | str | Any | T]]]:
     def wrapper(
         _: Callable[..., Any],
     ) -> Callable[P, Awaitable[Response | str | Any | T]]:
+        endpoint = _.__name__.removeprefix("a_")
+
         @wraps(calls)
         async def inner(
             self: "DCSCTransferAPI", *args, **kwargs
         ) -> Awaitable[Response | str | Any]:
-            if not self.use_async_client:
-                raise AttributeError(
-                    "You are attempting to call a async method whilst using a sync client!"
-                )
+            _require_async_client(self)
 
             args, kwargs = calls(self, *args, **kwargs)
 
             r = await self.a_call(*args, **kwargs)
 
-            return parser(r) if parser else r
+            return (
+                self.decode_response(r, endpoint=endpoint, default=parser)
+                if parser
+                else r
+            )
 
         return inner
 
@@ -59,18 +103,21 @@ def sync_call(
     calls: Callable[P, Any], parser: Callable[[Response | str | Any], T] = None
 ) -> Callable[[Callable[..., Any]], Callable[P, Response | str | Any | T]]:
     def wrapper(_: Callable[..., Any]) -> Callable[P, Response | str | Any | T]:
+        endpoint = _.__name__
+
         @wraps(calls)
         def inner(self: "DCSCTransferAPI", *args, **kwargs) -> Response | str | Any | T:
-            if self.use_async_client:
-                raise AttributeError(
-                    "You are attempting to call a sync method whilst using a async client!"
-                )
+            _require_sync_client(self)
 
             args, kwargs = calls(self, *args, **kwargs)
 
             r = self.call(*args, **kwargs)
 
-            return parser(r) if parser else r
+            return (
+                self.decode_response(r, endpoint=endpoint, default=parser)
+                if parser
+                else r
+            )
 
         return inner
 
@@ -78,7 +125,22 @@ def sync_call(
 
 
 def json_parser(response: Response) -> dict[Any, Any]:
-    return response.json()
+    return decode_json(response.content)
+
+
+@lru_cache(maxsize=None)
+def hash_page_type(item_type: type) -> type:
+    """
+    Create a dataclass for a page of the hashes list holding items of item_type.
+    """
+    return dataclasses.make_dataclass(
+        f"HashPage{item_type.__name__}",
+        [
+            ("files", list[item_type], dataclasses.field(default_factory=list)),
+            ("start", int, 0),
+            ("size", int, 10),
+        ],
+    )
 
 
 class UploadHelper:
@@ -134,6 +196,7 @@ class DCSCTransferAPI(HttpxBaseClass):
         proxies=None,
         user_agent="HttpxBaseClass",
         use_async_client=True,
+        hash_cache: HashCache = None,
         **kwargs,
     ):
         super().__init__(
@@ -143,6 +206,8 @@ class DCSCTransferAPI(HttpxBaseClass):
         self.myheaders = self.__default_headers
         self.set_header_field("Access-Token", token)
 
+        self.hash_cache = hash_cache or HashCache()
+
     @property
     def __default_headers(self) -> dict:
         """
@@ -182,21 +247,16 @@ class DCSCTransferAPI(HttpxBaseClass):
 
         return (self.methods.GET,), {"resources": resource, "params": data}
 
-    def _iter_hashes(self, data: dict):
-        def parse(data: dict):
-            size = data.get("size", 10)
-            start = data.get("start", 0)
-
-            return data.get("files", []), start + size, size
-
-        files, next, size = parse(data)
-
-        while len(files) == size:
-            data = yield files, next
-
-            files, next, size = parse(data)
+    @staticmethod
+    def _parse_page(data: dict | Any) -> tuple[list, int]:
+        """
+        Items and reported size of a page of the hashes list
+        """
+        if not isinstance(data, dict):
+            # typed page, see hash_page_type
+            return data.files, data.size
 
-        yield files, None
+        return data.get("files", []), data.get("size", 10)
 
     def _get_upload_info(self):
         resource = "uploads/info"
@@ -241,6 +301,38 @@ class DCSCTransferAPI(HttpxBaseClass):
             "files": files,
         }
 
+    def _upload_chunk_stream(
+        self,
+        batch_id: str,
+        chunk_id: str,
+        chunk_idx: int,
+        chunk_count: int,
+        filename: str,
+        content: memoryview | bytes,
+    ):
+        """
+        Same request as _upload_chunk, with the multipart body generated from content (e.g. a slice of a
+        memory mapped file) instead of built in memory by httpx.
+        """
+        resource = "uploads/parts"
+
+        body = MultipartChunk(
+            {
+                "batch_id": batch_id,
+                "chunk_id": chunk_id,
+                "chunk_idx": chunk_idx,
+                "chunk_count": chunk_count,
+            },
+            filename,
+            content,
+        )
+
+        return (self.methods.PUT,), {
+            "resources": resource,
+            "content": body.aiter() if self.use_async_client else body,
+            "headers": {**(self.myheaders or {}), **body.headers},
+        }
+
     @signature_of(_get_file)
     @async_call(_get_file, json_parser)
     async def a_get_file(self): ...
@@ -305,100 +397,783 @@ class DCSCTransferAPI(HttpxBaseClass):
     @sync_call(_upload_chunk, json_parser)
     def upload_chunk(self): ...
 
-    def iter_hashes(self, fetch_size: int = 10):
-        generator = self._iter_hashes(self.list_hashes(0, fetch_size))
+    @signature_of(_upload_chunk_stream)
+    @async_call(_upload_chunk_stream, json_parser)
+    async def a_upload_chunk_stream(self): ...
+
+    @signature_of(_upload_chunk_stream)
+    @sync_call(_upload_chunk_stream, json_parser)
+    def upload_chunk_stream(self): ...
+
+    def _list_hashes_typed(self, start: int, size: int, item_type: type = None):
+        if item_type is None:
+            return self.list_hashes(start, size)
 
-        files, start = next(generator)
+        _require_sync_client(self)
+        args, kwargs = self._list_hashes(start, size)
 
-        while True:
-            yield from files
+        return self.decode_response(
+            self.call(*args, **kwargs), hash_page_type(item_type)
+        )
+
+    async def _a_list_hashes_typed(self, start: int, size: int, item_type: type = None):
+        if item_type is None:
+            return await self.a_list_hashes(start, size)
+
+        _require_async_client(self)
+        args, kwargs = self._list_hashes(start, size)
 
-            if start is None:
-                break
+        return self.decode_response(
+            await self.a_call(*args, **kwargs), hash_page_type(item_type)
+        )
 
-            files, start = generator.send(self.list_hashes(start, fetch_size))
+    def _fetch_page(self, start: int, size: int, item_type: type = None):
+        began = time.monotonic()
+        files, reported = self._parse_page(
+            self._list_hashes_typed(start, size, item_type)
+        )
 
-    async def a_iter_hashes(self, fetch_size: int = 10):
-        generator = self._iter_hashes(await self.a_list_hashes(0, fetch_size))
+        return start, size, files, reported, time.monotonic() - began
 
-        files, start = next(generator)
+    async def _a_fetch_page(self, start: int, size: int, item_type: type = None):
+        began = time.monotonic()
+        files, reported = self._parse_page(
+            await self._a_list_hashes_typed(start, size, item_type)
+        )
 
-        while True:
-            for file in files:
-                yield file
+        return start, size, files, reported, time.monotonic() - began
 
-            if start is None:
-                break
+    @staticmethod
+    def _listing(
+        start: int,
+        fetch_size: int,
+        max_fetch_size: int,
+        checkpoint: str | os.PathLike | None,
+    ) -> tuple[HashListing, ListingCheckpoint | None]:
+        if checkpoint is not None:
+            checkpoint = ListingCheckpoint(checkpoint)
+            start = max(start, checkpoint.load())
 
-            files, start = generator.send(await self.a_list_hashes(start, fetch_size))
+        return HashListing(start, fetch_size, max_fetch_size), checkpoint
+
+    def iter_hashes(
+        self,
+        fetch_size: int = 100,
+        item_type: type = None,
+        prefetch: int = 4,
+        start: int = 0,
+        max_fetch_size: int = 1000,
+        checkpoint: str | os.PathLike = None,
+    ):
+        """
+        Iter all hashes, with up to prefetch pages requested ahead on a thread pool.
+
+        The page size starts at fetch_size and adapts to the response times of the server, up to
+        max_fetch_size (see HashListing). With a checkpoint file the offset of the consumed hashes is
+        recorded after every page, and a later iteration with the same checkpoint resumes from it; the
+        checkpoint is removed once all hashes are listed.
+
+        Args:
+            fetch_size (int, optional): initial amount of hashes per page. Defaults to 100.
+            item_type (type, optional): type (e.g. a msgspec struct or dataclass) to decode every hash into
+                straight from the response; dicts are yielded without. Defaults to None.
+            prefetch (int, optional): amount of pages in flight. Defaults to 4.
+            start (int, optional): offset to start at. Defaults to 0.
+            max_fetch_size (int, optional): largest amount of hashes per page. Defaults to 1000.
+            checkpoint (str | os.PathLike, optional): file to record and resume the offset with. Defaults to None.
+        """
+        listing, checkpoint = self._listing(
+            start, fetch_size, max_fetch_size, checkpoint
+        )
+        prefetch = max(prefetch, 1)
+        in_flight = set()
+
+        pool = ThreadPoolExecutor(
+            max_workers=prefetch, thread_name_prefix=self.__class__.__name__
+        )
+
+        try:
+            while not listing.done:
+                while len(in_flight) < prefetch and (request := listing.next_request()):
+                    in_flight.add(pool.submit(self._fetch_page, *request, item_type))
+
+                if not in_flight:
+                    break
+
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+
+                for future in finished:
+                    listing.complete(*future.result())
+
+                for files in listing.ready():
+                    yield from files
+
+                    if checkpoint is not None:
+                        checkpoint.save(listing.cursor)
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+        if checkpoint is not None:
+            checkpoint.remove()
+
+    async def a_iter_hashes(
+        self,
+        fetch_size: int = 100,
+        item_type: type = None,
+        prefetch: int = 4,
+        start: int = 0,
+        max_fetch_size: int = 1000,
+        checkpoint: str | os.PathLike = None,
+    ):
+        """
+        Async variant of iter_hashes; the pages in flight are tasks.
+        """
+        listing, checkpoint = self._listing(
+            start, fetch_size, max_fetch_size, checkpoint
+        )
+        prefetch = max(prefetch, 1)
+        in_flight = set()
+
+        try:
+            while not listing.done:
+                while len(in_flight) < prefetch and (request := listing.next_request()):
+                    in_flight.add(
+                        asyncio.ensure_future(self._a_fetch_page(*request, item_type))
+                    )
+
+                if not in_flight:
+                    break
+
+                finished, in_flight = await asyncio.wait(
+                    in_flight, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                for task in finished:
+                    listing.complete(*task.result())
+
+                for files in listing.ready():
+                    for file in files:
+                        yield file
+
+                    if checkpoint is not None:
+                        checkpoint.save(listing.cursor)
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+        if checkpoint is not None:
+            checkpoint.remove()
+
+    def write_hash_index(
+        self, path: str | os.PathLike, hash_type: str = "sha256", **kwargs
+    ) -> HashIndex:
+        """
+        Write all hashes of a type to a compact sorted index file for offline membership checks.
+
+        Args:
+            path (str | os.PathLike): index file to create.
+            hash_type (str, optional): md5, sha1 or sha256. Defaults to "sha256".
+            **kwargs: passed to iter_hashes.
+
+        Returns:
+            HashIndex: the index; close it when done.
+        """
+        return HashIndex.write(
+            path,
+            (
+                value
+                for item in self.iter_hashes(**kwargs)
+                if (value := self._hash_value(item, hash_type))
+            ),
+        )
+
+    async def a_write_hash_index(
+        self, path: str | os.PathLike, hash_type: str = "sha256", **kwargs
+    ) -> HashIndex:
+        """
+        Async variant of write_hash_index.
+        """
+        values = [
+            value
+            async for item in self.a_iter_hashes(**kwargs)
+            if (value := self._hash_value(item, hash_type))
+        ]
+
+        return await asyncio.to_thread(HashIndex.write, path, values)
+
+    def _cached_hashes(
+        self, hashes: Iterable[str], hash_type: str, refresh: bool
+    ) -> tuple[dict[str, Any], list[str]]:
+        """
+        Split hashes in the results known by the cache and the (unique, lowercase) hashes to look up
+        """
+        results, missing = {}, []
+
+        for value in dict.fromkeys(h.lower() for h in hashes):
+            if refresh or (result := self.hash_cache.get(hash_type, value)) is MISSING:
+                missing.append(value)
+            else:
+                results[value] = result
+
+        return results, missing
+
+    def _store_hashes(
+        self, hash_type: str, hashes: list[str], responses: list[Response]
+    ) -> dict[str, Any]:
+        """
+        Parse and cache lookup responses; a 404 means the hash is unknown
+        """
+        results = {}
+
+        for value, response in zip(hashes, responses):
+            if response.status_code == codes.NOT_FOUND:
+                result = None
+            else:
+                response.raise_for_status()
+                result = self.decode_response(
+                    response, endpoint=f"search_{hash_type}", default=json_parser
+                )
+
+            self.hash_cache.set(hash_type, value, result)
+            results[value] = result
+
+        return results
+
+    def search_hashes(
+        self,
+        hashes: Iterable[str],
+        hash_type: str = "sha256",
+        max_concurrency: int = None,
+        refresh: bool = False,
+    ) -> dict[str, Any]:
+        """
+        Look up many hashes at once.
+
+        Hashes known by the hash cache (or certainly unknown according to its Bloom filter) are resolved
+        locally; the others are requested concurrently over the shared client and cached.
+
+        Args:
+            hashes (Iterable[str]): hashes to look up.
+            hash_type (str, optional): md5, sha1 or sha256. Defaults to "sha256".
+            max_concurrency (int, optional): max lookups in flight. Defaults to the instance's max_concurrency.
+            refresh (bool, optional): ignore the cache. Defaults to False.
+
+        Returns:
+            dict[str, Any]: per hash the result of the lookup or None if the hash is unknown.
+        """
+        hashes = list(hashes)
+        results, missing = self._cached_hashes(hashes, hash_type, refresh)
+
+        if missing:
+            responses = self.call(
+                self.methods.GET,
+                [
+                    self._search_hash(value, hash_type)[1]["resources"]
+                    for value in missing
+                ],
+                max_concurrency=max_concurrency,
+            )
+            results.update(self._store_hashes(hash_type, missing, responses))
+
+        return {value: results[value.lower()] for value in hashes}
+
+    async def a_search_hashes(
+        self,
+        hashes: Iterable[str],
+        hash_type: str = "sha256",
+        max_concurrency: int = None,
+        refresh: bool = False,
+    ) -> dict[str, Any]:
+        """
+        Async variant of search_hashes.
+        """
+        hashes = list(hashes)
+        results, missing = self._cached_hashes(hashes, hash_type, refresh)
+
+        if missing:
+            responses = await self.a_call(
+                self.methods.GET,
+                [
+                    self._search_hash(value, hash_type)[1]["resources"]
+                    for value in missing
+                ],
+                max_concurrency=max_concurrency,
+            )
+            results.update(self._store_hashes(hash_type, missing, responses))
+
+        return {value: results[value.lower()] for value in hashes}
+
+    @staticmethod
+    def _hash_value(item: dict | Any, hash_type: str) -> str | None:
+        if isinstance(item, dict):
+            return item.get(hash_type)
+
+        return getattr(item, hash_type, None)
+
+    def _hash_keys(self, item: dict | Any, hash_types: Iterable[str]) -> Iterable[str]:
+        for hash_type in hash_types:
+            if value := self._hash_value(item, hash_type):
+                yield HashCache.key(hash_type, value)
+
+    def preload_hash_filter(
+        self,
+        hash_types: Iterable[str] = ("md5", "sha1", "sha256"),
+        fetch_size: int = 100,
+        error_rate: float = 0.001,
+        capacity: int = 100_000,
+    ) -> ScalableBloomFilter:
+        """
+        Load a Bloom filter of all known hashes (from iter_hashes) into the hash cache, so search_hashes
+        resolves unknown hashes without a lookup.
+
+        The keys of every page are added to the filter as the pages arrive, so the listing is never held in
+        memory; the filter grows when more keys than capacity are added. It is only used once complete.
+
+        Args:
+            hash_types (Iterable[str], optional): hash types to add. Defaults to ("md5", "sha1", "sha256").
+            fetch_size (int, optional): amount of hashes per page. Defaults to 100.
+            error_rate (float, optional): false positive rate of the filter. Defaults to 0.001.
+            capacity (int, optional): expected amount of keys (hashes times hash types). Defaults to 100_000.
+
+        Returns:
+            ScalableBloomFilter: the filter.
+        """
+        bloom = ScalableBloomFilter(capacity, error_rate)
+
+        for item in self.iter_hashes(fetch_size):
+            bloom.update(self._hash_keys(item, hash_types))
+
+        self.hash_cache.set_bloom(bloom)
+
+        return bloom
+
+    async def a_preload_hash_filter(
+        self,
+        hash_types: Iterable[str] = ("md5", "sha1", "sha256"),
+        fetch_size: int = 100,
+        error_rate: float = 0.001,
+        capacity: int = 100_000,
+    ) -> ScalableBloomFilter:
+        """
+        Async variant of preload_hash_filter.
+        """
+        bloom = ScalableBloomFilter(capacity, error_rate)
+
+        async for item in self.a_iter_hashes(fetch_size):
+            bloom.update(self._hash_keys(item, hash_types))
+
+        self.hash_cache.set_bloom(bloom)
+
+        return bloom
+
+    @staticmethod
+    def _retry_chunk(err: HTTPError) -> bool:
+        # transport errors, 429 and 5xx are retried; other error statuses are final
+        if not isinstance(err, HTTPStatusError):
+            return True
+
+        status = err.response.status_code
+
+        return status == codes.TOO_MANY_REQUESTS or status >= 500
+
+    def _send_chunk(
+        self,
+        batch_id: str,
+        f: UploadFile,
+        idx: int,
+        content: memoryview | bytes,
+        retries: int,
+    ) -> dict:
+        """
+        Upload a chunk, retrying transport errors, 429 and 5xx responses with backoff.
+
+        Raises:
+            HTTPError: the chunk was not stored by the server.
+        """
+        for attempt in range(retries + 1):
+            try:
+                args, kwargs = self._upload_chunk_stream(
+                    batch_id, f.chunk_id, idx, f.chunk_count, f.filename, content
+                )
+                response = self.call(*args, **kwargs)
+                response.raise_for_status()
+
+                return self.decode_response(
+                    response, endpoint="upload_chunk_stream", default=json_parser
+                )
+            except HTTPError as err:
+                if attempt == retries or not self._retry_chunk(err):
+                    raise
+
+                time.sleep(0.5 * 2**attempt)
+
+    async def _a_send_chunk(
+        self,
+        batch_id: str,
+        f: UploadFile,
+        idx: int,
+        content: memoryview | bytes,
+        retries: int,
+    ) -> dict:
+        """
+        Async variant of _send_chunk.
+        """
+        for attempt in range(retries + 1):
+            try:
+                args, kwargs = self._upload_chunk_stream(
+                    batch_id, f.chunk_id, idx, f.chunk_count, f.filename, content
+                )
+                response = await self.a_call(*args, **kwargs)
+                response.raise_for_status()
+
+                return self.decode_response(
+                    response, endpoint="upload_chunk_stream", default=json_parser
+                )
+            except HTTPError as err:
+                if attempt == retries or not self._retry_chunk(err):
+                    raise
+
+                await asyncio.sleep(0.5 * 2**attempt)
+
+    def _plan_upload(
+        self,
+        sizes: dict[str, int],
+        journal: UploadJournal | None,
+        upload_info: dict = None,
+        batch: dict = None,
+        identities: dict[str, dict] = None,
+    ) -> tuple[str, list[UploadFile], list[tuple[UploadFile, int]]]:
+        """
+        Plan the chunks to upload; the files of a matching journal are resumed, otherwise the new batch is used.
+
+        Returns:
+            tuple[str, list[UploadFile], list[tuple[UploadFile, int]]]: batch id, files and the chunks left to upload.
+        """
+        if batch is None:
+            batch_id, files = journal.batch_id, journal.files()
+        else:
+            helper = UploadHelper(upload_info)
+            helper.set_batch(batch)
+
+            batch_id, files = helper.batch_id, []
+
+            for filename, size in sizes.items():
+                chunk_id, _ = helper.get_from_batch(filename=filename)
+                files.append(
+                    UploadFile(
+                        filename,
+                        chunk_id,
+                        size,
+                        helper.max_chunk_size,
+                        max(helper.calculate_chunk_count(size), 1),
+                    )
+                )
+
+            if journal is not None:
+                journal.begin(batch_id, helper.max_chunk_size, files, identities)
+
+        done = journal.done if journal is not None else set()
+        pending = [
+            (f, idx)
+            for f in files
+            for idx in range(f.chunk_count)
+            if (f.chunk_id, idx) not in done
+        ]
+
+        for f, _ in pending:
+            f.remaining += 1
+
+        return batch_id, files, pending
+
+    @staticmethod
+    def _digest_uploaded(
+        files: list[UploadFile],
+        pending: list[tuple[UploadFile, int]],
+        load: Callable[[UploadFile, int, int], ChunkContent],
+        algorithms: Iterable[str],
+    ) -> dict[str, FileDigest]:
+        """
+        Create the digests of the files and feed them the chunks uploaded before (journal), which are
+        loaded once it is their turn.
+        """
+        hashers = {f.filename: FileDigest(f, algorithms) for f in files}
+        left = {(f.chunk_id, idx) for f, idx in pending}
+
+        for f in files:
+            for idx in range(f.chunk_count):
+                if (f.chunk_id, idx) not in left:
+                    hashers[f.filename].complete(
+                        idx, partial(load, f, *f.chunk_range(idx))
+                    )
+
+        return hashers
 
     async def a_upload_files(
         self,
         *file_handles: AsyncTextIOWrapper,
         comment: str = None,
         is_malware: bool = True,
+        concurrency: int = 4,
+        retries: int = 2,
+        journal: str | os.PathLike = None,
+        digests: Iterable[str] = ("md5", "sha256"),
     ):
-        helper = UploadHelper(await self.a_get_upload_info())
-        helper.set_batch(
-            await self.a_request_batch(
-                helper.prepare_batch(handles=file_handles), comment, is_malware
-            )
-        )
+        """
+        Upload files in chunks, with at most concurrency chunks in flight across all files.
+
+        Files are memory mapped and every chunk is streamed from its slice of the map in a generated
+        multipart body, so memory use per chunk in flight stays small whatever the chunk size. Files that
+        can not be mapped are read at the offset of the chunk (os.pread in a worker thread when possible).
+        Chunks failing with a transport error, 429 or 5xx are retried with backoff; when a journal path is
+        given the chunks stored by the server are recorded so a failed upload of the same files resumes where it stopped;
+        files changed since (size, modification time or inode) are uploaded again in a new batch.
+
+        Args:
+            *file_handles (AsyncTextIOWrapper): aiofiles handles opened in binary mode.
+            comment (str, optional): comment of the batch. Defaults to None.
+            is_malware (bool, optional): mark the files as malware. Defaults to True.
+            concurrency (int, optional): amount of chunks uploaded at the same time. Defaults to 4.
+            retries (int, optional): retries per chunk. Defaults to 2.
+            journal (str | os.PathLike, optional): path of the journal to resume from and record in. Defaults to None.
+            digests (Iterable[str], optional): hashlib algorithms to compute over every file. Defaults to ("md5", "sha256").
+
+        Returns:
+            list[dict]: per file the response of the chunk that completed it, the filename and the digests
+                (None when a chunk uploaded before resuming can not be read).
+        """
+        handles = {os.path.basename(h.name): h for h in file_handles}
+        sizes = {}
 
-        async def upload(file_handle: AsyncTextIOWrapper):
-            await file_handle.seek(0, os.SEEK_END)
-            file_size = await file_handle.tell()
-            await file_handle.seek(0, os.SEEK_SET)
-
-            chunk_id, filename = helper.get_from_batch(handle=file_handle)
-            chunk_count = helper.calculate_chunk_count(file_size)
-
-            for idx in range(chunk_count):
-                result = await self.a_upload_chunk(
-                    helper.batch_id,
-                    chunk_id,
-                    idx,
-                    chunk_count,
-                    filename,
-                    await file_handle.read(helper.max_chunk_size),
-                )
+        for filename, file_handle in handles.items():
+            sizes[filename] = await file_handle.seek(0, os.SEEK_END)
 
-            return {**result, "file": filename}
+        journal = UploadJournal(journal) if journal is not None else None
 
-        return await asyncio.gather(
-            *(upload(file_handle) for file_handle in file_handles)
-        )
+        identities = {
+            filename: file_identity(file_handle)
+            for filename, file_handle in handles.items()
+        }
+
+        if (
+            journal is not None
+            and journal.load()
+            and journal.matches(sizes, identities)
+        ):
+            batch_id, files, pending = self._plan_upload(sizes, journal)
+        else:
+            upload_info = await self.a_get_upload_info()
+            batch = await self.a_request_batch(list(handles), comment, is_malware)
+            batch_id, files, pending = self._plan_upload(
+                sizes, journal, upload_info, batch, identities
+            )
+
+        mapped = {filename: MappedFile(h) for filename, h in handles.items()}
+        locks = {filename: asyncio.Lock() for filename in handles}
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+        async def upload(f: UploadFile, idx: int):
+            async with semaphore:
+                offset, size = f.chunk_range(idx)
+
+                if (content := mapped[f.filename].chunk(offset, size)) is None:
+                    content = await a_read_chunk(
+                        handles[f.filename], offset, size, locks[f.filename]
+                    )
+
+                try:
+                    result = await self._a_send_chunk(
+                        batch_id, f, idx, content, retries
+                    )
+                except BaseException:
+                    if isinstance(content, memoryview):
+                        content.release()
+                    raise
+
+            if journal is not None:
+                journal.record(f.chunk_id, idx)
+
+            # the digest hashes (or keeps) the content that was sent
+            hashers[f.filename].complete(idx, content)
+
+            f.remaining -= 1
+
+            if f.remaining == 0:
+                f.result = result
+
+        hashers: dict[str, FileDigest] = {}
+
+        try:
+            hashers = self._digest_uploaded(
+                files,
+                pending,
+                lambda f, offset, size: load_chunk(
+                    mapped[f.filename], handles[f.filename], offset, size
+                ),
+                digests,
+            )
+            tasks = [asyncio.ensure_future(upload(f, idx)) for f, idx in pending]
+
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+        finally:
+            for hasher in hashers.values():
+                hasher.close()
+
+            for m in mapped.values():
+                m.close()
+
+        if journal is not None:
+            journal.remove()
+
+        return [
+            {
+                **(f.result or {}),
+                "file": f.filename,
+                "digests": hashers[f.filename].result(),
+            }
+            for f in files
+        ]
 
     def upload_files(
-        self, *file_handles: IO[bytes], comment: str = None, is_malware: bool = True
+        self,
+        *file_handles: IO[bytes],
+        comment: str = None,
+        is_malware: bool = True,
+        concurrency: int = 4,
+        retries: int = 2,
+        journal: str | os.PathLike = None,
+        digests: Iterable[str] = ("md5", "sha256"),
     ):
-        helper = UploadHelper(self.get_upload_info())
-        helper.set_batch(
-            self.request_batch(
-                helper.prepare_batch(handles=file_handles), comment, is_malware
-            )
-        )
+        """
+        Upload files in chunks on a thread pool, with at most concurrency chunks in flight across all files.
+
+        Files are memory mapped and every chunk is streamed from its slice of the map in a generated
+        multipart body, so memory use per chunk in flight stays small whatever the chunk size. Files that
+        can not be mapped are read at the offset of the chunk with os.pread when the file has a descriptor,
+        so workers do not share a file position. Chunks failing with a transport error, 429 or 5xx are retried
+        with backoff; when a journal path is given the chunks stored by the server are recorded so a failed upload of the same files resumes where it stopped.
+
+        Args:
+            *file_handles (IO[bytes]): files opened in binary mode.
+            comment (str, optional): comment of the batch. Defaults to None.
+            is_malware (bool, optional): mark the files as malware. Defaults to True.
+            concurrency (int, optional): amount of chunks uploaded at the same time. Defaults to 4.
+            retries (int, optional): retries per chunk. Defaults to 2.
+            journal (str | os.PathLike, optional): path of the journal to resume from and record in. Defaults to None.
+            digests (Iterable[str], optional): hashlib algorithms to compute over every file. Defaults to ("md5", "sha256").
+
+        Returns:
+            list[dict]: per file the response of the chunk that completed it, the filename and the digests
+                (None when a chunk uploaded before resuming can not be read).
+        """
+        handles = {os.path.basename(h.name): h for h in file_handles}
+        sizes = {
+            filename: file_handle.seek(0, os.SEEK_END)
+            for filename, file_handle in handles.items()
+        }
 
-        results = []
+        journal = UploadJournal(journal) if journal is not None else None
 
-        for file_handle in file_handles:
-            file_handle.seek(0, os.SEEK_END)
-            file_size = file_handle.tell()
+        identities = {
+            filename: file_identity(file_handle)
+            for filename, file_handle in handles.items()
+        }
+
+        if (
+            journal is not None
+            and journal.load()
+            and journal.matches(sizes, identities)
+        ):
+            batch_id, files, pending = self._plan_upload(sizes, journal)
+        else:
+            upload_info = self.get_upload_info()
+            batch = self.request_batch(list(handles), comment, is_malware)
+            batch_id, files, pending = self._plan_upload(
+                sizes, journal, upload_info, batch, identities
+            )
 
-            file_handle.seek(0, os.SEEK_SET)
+        mapped = {filename: MappedFile(h) for filename, h in handles.items()}
+        locks = {filename: threading.Lock() for filename in handles}
+        remaining_lock = threading.Lock()
 
-            chunk_id, filename = helper.get_from_batch(handle=file_handle)
-            chunk_count = helper.calculate_chunk_count(file_size)
+        def upload(f: UploadFile, idx: int):
+            offset, size = f.chunk_range(idx)
 
-            for idx in range(chunk_count):
-                result = self.upload_chunk(
-                    helper.batch_id,
-                    chunk_id,
-                    idx,
-                    chunk_count,
-                    filename,
-                    file_handle.read(helper.max_chunk_size),
+            if (content := mapped[f.filename].chunk(offset, size)) is None:
+                content = read_chunk(
+                    handles[f.filename], offset, size, locks[f.filename]
                 )
 
-            results.append({**result, "file": filename})
-        return results
+            try:
+                result = self._send_chunk(batch_id, f, idx, content, retries)
+            except BaseException:
+                if isinstance(content, memoryview):
+                    content.release()
+                raise
+
+            if journal is not None:
+                journal.record(f.chunk_id, idx)
+
+            # the digest hashes (or keeps) the content that was sent
+            hashers[f.filename].complete(idx, content)
+
+            with remaining_lock:
+                f.remaining -= 1
+
+                if f.remaining == 0:
+                    f.result = result
+
+        hashers: dict[str, FileDigest] = {}
+
+        try:
+            hashers = self._digest_uploaded(
+                files,
+                pending,
+                lambda f, offset, size: load_chunk(
+                    mapped[f.filename],
+                    handles[f.filename],
+                    offset,
+                    size,
+                    locks[f.filename],
+                ),
+                digests,
+            )
+
+            if pending:
+                with ThreadPoolExecutor(
+                    max_workers=max(min(concurrency, len(pending)), 1),
+                    thread_name_prefix=self.__class__.__name__,
+                ) as pool:
+                    futures = [pool.submit(upload, f, idx) for f, idx in pending]
+
+                    try:
+                        for future in futures:
+                            future.result()
+                    except BaseException:
+                        for future in futures:
+                            future.cancel()
+                        raise
+        finally:
+            for hasher in hashers.values():
+                hasher.close()
+
+            for m in mapped.values():
+                m.close()
+
+        if journal is not None:
+            journal.remove()
+
+        return [
+            {
+                **(f.result or {}),
+                "file": f.filename,
+                "digests": hashers[f.filename].result(),
+            }
+            for f in files
+        ]
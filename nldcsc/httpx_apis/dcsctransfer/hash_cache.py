@@ -0,0 +1,235 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Iterable
+
+MISSING = object()
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        """
+        Bloom filter for membership checks of a large set of hashes in little memory; a value which is
+        not in the filter is certainly not in the set, a value in the filter probably is.
+
+        Args:
+            capacity (int): expected amount of values.
+            error_rate (float, optional): false positive rate at capacity. Defaults to 0.001.
+        """
+        capacity = max(capacity, 1)
+
+        self.capacity = capacity
+        self.size = max(
+            math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2), 8
+        )
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value: str) -> Iterable[int]:
+        # double hashing; two 64 bit hashes from a single digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value: str):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+        self.count += 1
+
+    def update(self, values: Iterable[str]):
+        for value in values:
+            self.add(value)
+
+    def __contains__(self, value: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(value)
+        )
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class ScalableBloomFilter:
+    def __init__(
+        self,
+        initial_capacity: int = 100_000,
+        error_rate: float = 0.001,
+        growth: int = 2,
+        tightening: float = 0.5,
+    ):
+        """
+        Bloom filter of a set of unknown size. Once a filter holds its capacity a filter of growth times the
+        capacity is added, with an error rate tightening times as low, so the false positive rate of all
+        filters together stays below error_rate however many values are added.
+
+        Args:
+            initial_capacity (int, optional): capacity of the first filter. Defaults to 100_000.
+            error_rate (float, optional): false positive rate of all filters together. Defaults to 0.001.
+            growth (int, optional): capacity of a filter relative to the one before. Defaults to 2.
+            tightening (float, optional): error rate of a filter relative to the one before. Defaults to 0.5.
+        """
+        self.initial_capacity = max(initial_capacity, 1)
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.filters: list[BloomFilter] = []
+
+    def _current(self) -> BloomFilter:
+        if not self.filters or len(self.filters[-1]) >= self.filters[-1].capacity:
+            n = len(self.filters)
+            self.filters.append(
+                BloomFilter(
+                    self.initial_capacity * self.growth**n,
+                    self.error_rate * (1 - self.tightening) * self.tightening**n,
+                )
+            )
+
+        return self.filters[-1]
+
+    def add(self, value: str):
+        self._current().add(value)
+
+    def update(self, values: Iterable[str]):
+        for value in values:
+            self.add(value)
+
+    def __contains__(self, value: str) -> bool:
+        return any(value in bloom for bloom in self.filters)
+
+    def __len__(self) -> int:
+        return sum(len(bloom) for bloom in self.filters)
+
+
+class HashCache:
+    def __init__(
+        self,
+        max_entries: int = 100_000,
+        ttl: float = 3600,
+        negative_ttl: float = 600,
+        bloom_ttl: float = 3600,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Thread safe in memory (lru) cache of hash lookups; results of known hashes and the absence of
+        unknown hashes are kept for their own ttl.
+
+        A Bloom filter of all known hashes (see DCSCTransferAPI.preload_hash_filter) resolves hashes which
+        are certainly unknown without a lookup. Hashes added to the server after the filter was loaded are
+        not in it, so the filter is only trusted for bloom_ttl seconds.
+
+        Args:
+            max_entries (int, optional): max amount of results to keep. Defaults to 100_000.
+            ttl (float, optional): seconds a found hash is kept. Defaults to 3600.
+            negative_ttl (float, optional): seconds an unknown hash is kept. Defaults to 600.
+            bloom_ttl (float, optional): seconds the Bloom filter is used after it was loaded. Defaults to 3600.
+            clock (Callable[[], float], optional): monotonic clock in seconds. Defaults to time.monotonic.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.bloom_ttl = bloom_ttl
+        self.clock = clock
+
+        self.entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.bloom: BloomFilter | ScalableBloomFilter = None
+        self.bloom_loaded: float = None
+
+        self.hits = 0
+        self.misses = 0
+        self.bloom_hits = 0
+
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(hash_type: str, value: str) -> str:
+        return f"{hash_type}:{value.lower()}"
+
+    def set_bloom(self, bloom: BloomFilter | ScalableBloomFilter):
+        """
+        Use a Bloom filter holding the keys (see key) of all known hashes.
+        """
+        with self._lock:
+            self.bloom = bloom
+            self.bloom_loaded = self.clock()
+
+    def get(self, hash_type: str, value: str) -> Any:
+        """
+        Get the cached lookup of a hash.
+
+        Returns:
+            Any: the result, None if the hash is unknown or MISSING if it has to be looked up.
+        """
+        key = self.key(hash_type, value)
+
+        with self._lock:
+            now = self.clock()
+
+            if (entry := self.entries.get(key)) is not None:
+                expires, result = entry
+
+                if expires > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+
+                del self.entries[key]
+
+            if (
+                self.bloom is not None
+                and now - self.bloom_loaded < self.bloom_ttl
+                and key not in self.bloom
+            ):
+                self.bloom_hits += 1
+                return None
+
+            self.misses += 1
+
+            return MISSING
+
+    def set(self, hash_type: str, value: str, result: Any):
+        """
+        Cache the lookup of a hash; a result of None marks the hash as unknown.
+        """
+        key = self.key(hash_type, value)
+
+        with self._lock:
+            ttl = self.negative_ttl if result is None else self.ttl
+
+            if ttl <= 0:
+                return
+
+            self.entries[key] = (self.clock() + ttl, result)
+            self.entries.move_to_end(key)
+
+            if result is not None and self.bloom is not None:
+                self.bloom.add(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(False)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.bloom = self.bloom_loaded = None
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.bloom_hits
+
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "bloom_hits": self.bloom_hits,
+                "misses": self.misses,
+                "hit_ratio": (
+                    (self.hits + self.bloom_hits) / lookups if lookups else 0.0
+                ),
+            }
@@ -0,0 +1,227 @@
+import bisect
+import json
+import mmap
+import os
+from typing import Any, Iterable
+
+INDEX_MAGIC = b"NLHI"
+INDEX_HEADER = len(INDEX_MAGIC) + 1
+
+
+class HashListing:
+    def __init__(
+        self,
+        start: int = 0,
+        fetch_size: int = 100,
+        max_fetch_size: int = 1000,
+        min_fetch_size: int = 10,
+        target_latency: float = 1.0,
+    ):
+        """
+        Plans the page requests of a listing fetched with several pages in flight and puts the pages
+        back in order.
+
+        The page size grows while full pages are returned faster than target_latency and shrinks when
+        they are slow. Pages holding fewer items than requested while reporting their size as the amount
+        of items returned (the server caps the page size) are completed with another request; pages
+        holding fewer items than their reported size mark the end of the listing.
+
+        Args:
+            start (int, optional): offset to start at, e.g. a checkpoint. Defaults to 0.
+            fetch_size (int, optional): initial page size. Defaults to 100.
+            max_fetch_size (int, optional): largest page size. Defaults to 1000.
+            min_fetch_size (int, optional): smallest page size. Defaults to 10.
+            target_latency (float, optional): seconds a page request may take before the page size shrinks. Defaults to 1.0.
+        """
+        self.offset = start
+        self.cursor = start
+        self.end: int = None
+
+        self.size = max(fetch_size, 1)
+        self.max_fetch_size = max(max_fetch_size, self.size)
+        self.min_fetch_size = min(min_fetch_size, self.size)
+        self.target_latency = target_latency
+
+        self.gaps: list[tuple[int, int]] = []
+        self.pages: dict[int, list] = {}
+
+    @property
+    def done(self) -> bool:
+        return self.end is not None and self.cursor >= self.end
+
+    def next_request(self) -> tuple[int, int] | None:
+        """
+        Offset and size of the next page to request, or None if everything is requested.
+        """
+        if self.gaps:
+            return self.gaps.pop(0)
+
+        if self.end is not None and self.offset >= self.end:
+            return None
+
+        request = (self.offset, self.size)
+        self.offset += self.size
+
+        return request
+
+    def adapt(self, latency: float, full: bool):
+        if latency > 2 * self.target_latency:
+            self.size = max(self.size // 2, self.min_fetch_size)
+        elif full and latency < self.target_latency:
+            self.size = min(self.size * 2, self.max_fetch_size)
+
+    def complete(
+        self, start: int, requested: int, files: list, size: int, latency: float = 0
+    ):
+        """
+        Register a fetched page.
+
+        Args:
+            start (int): offset of the page.
+            requested (int): requested page size.
+            files (list): items of the page.
+            size (int): page size reported by the server.
+            latency (float, optional): seconds the request took. Defaults to 0.
+        """
+        count = len(files)
+
+        if count < requested and count and count >= size:
+            # the server caps the page size
+            self.max_fetch_size = min(self.max_fetch_size, count)
+            self.size = min(self.size, count)
+            self.gaps.append((start + count, requested - count))
+        elif count < requested:
+            self.end = (
+                start + count if self.end is None else min(self.end, start + count)
+            )
+
+        self.adapt(latency, count == requested)
+
+        if self.end is None or start < self.end:
+            self.pages[start] = files
+
+    def ready(self) -> Iterable[list]:
+        """
+        Pop the pages that are next in order.
+        """
+        while not self.done and (files := self.pages.pop(self.cursor, None)):
+            self.cursor += len(files)
+
+            yield files
+
+
+class ListingCheckpoint:
+    def __init__(self, path: str | os.PathLike):
+        """
+        File holding the offset up to which a listing was consumed, so it can be resumed.
+
+        Args:
+            path (str | os.PathLike): file to keep the offset in.
+        """
+        self.path = os.fspath(path)
+
+    def load(self) -> int:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)["offset"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return 0
+
+    def save(self, offset: int):
+        with open(f"{self.path}.part", "w") as f:
+            json.dump({"offset": offset}, f)
+
+        os.replace(f"{self.path}.part", self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class HashIndex:
+    def __init__(self, path: str | os.PathLike):
+        """
+        Read only index of hashes for offline membership checks; a file of sorted fixed width binary
+        hashes which is memory mapped and binary searched. Create it with HashIndex.write.
+
+        Args:
+            path (str | os.PathLike): index file.
+        """
+        self.path = os.fspath(path)
+
+        with open(self.path, "rb") as f:
+            header = f.read(INDEX_HEADER)
+
+            if header[: len(INDEX_MAGIC)] != INDEX_MAGIC:
+                raise ValueError(f"{self.path} is not a hash index")
+
+            self.width = header[-1]
+            self.count = (
+                (os.fstat(f.fileno()).st_size - INDEX_HEADER) // self.width
+                if self.width
+                else 0
+            )
+            self._mmap = (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.count else b""
+            )
+
+    @staticmethod
+    def write(path: str | os.PathLike, hashes: Iterable[str]) -> "HashIndex":
+        """
+        Write an index of hex encoded hashes of a single type; duplicates are removed.
+
+        Args:
+            path (str | os.PathLike): index file to create.
+            hashes (Iterable[str]): hashes to add.
+
+        Returns:
+            HashIndex: the index.
+        """
+        values = sorted({bytes.fromhex(h) for h in hashes})
+        width = len(values[0]) if values else 0
+
+        if any(len(value) != width for value in values):
+            raise ValueError("All hashes in an index should be of the same type")
+
+        path = os.fspath(path)
+
+        with open(f"{path}.part", "wb") as f:
+            f.write(INDEX_MAGIC + bytes([width]))
+
+            for value in values:
+                f.write(value)
+
+        os.replace(f"{path}.part", path)
+
+        return HashIndex(path)
+
+    def _item(self, idx: int) -> bytes:
+        offset = INDEX_HEADER + idx * self.width
+
+        return self._mmap[offset : offset + self.width]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, value: Any) -> bool:
+        if not self.count or not isinstance(value, str):
+            return False
+
+        try:
+            value = bytes.fromhex(value)
+        except ValueError:
+            return False
+
+        idx = bisect.bisect_left(range(self.count), value, key=self._item)
+
+        return idx < self.count and self._item(idx) == value
+
+    def close(self):
+        if self.count:
+            self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,479 @@
+import asyncio
+import hashlib
+import io
+import json
+import mmap
+import os
+import secrets
+import threading
+from dataclasses import dataclass, field
+from typing import IO, Any, AsyncIterator, Callable, Iterable, Iterator
+
+from aiofiles.threadpool.text import AsyncTextIOWrapper
+
+from nldcsc.http_apis.base_class.transfer import DEFAULT_CHUNK_SIZE
+
+IDENTITY_KEYS = ("mtime_ns", "inode")
+
+
+@dataclass
+class UploadFile:
+    filename: str
+    chunk_id: str
+    size: int
+    chunk_size: int
+    chunk_count: int
+    remaining: int = field(default=0, repr=False)
+    result: dict = field(default=None, repr=False)
+
+    def chunk_range(self, chunk_idx: int) -> tuple[int, int]:
+        """
+        Offset and length of a chunk in the file
+        """
+        offset = chunk_idx * self.chunk_size
+
+        return offset, max(min(self.chunk_size, self.size - offset), 0)
+
+
+class UploadJournal:
+    def __init__(self, path: str | os.PathLike):
+        """
+        Small append only journal of an upload batch so an interrupted upload can be resumed.
+
+        The first line holds the batch (id, chunk size and the chunk id, size, chunk count, modification
+        time and inode per file); every following line is a chunk that was uploaded.
+
+        Args:
+            path (str | os.PathLike): file to keep the journal in.
+        """
+        self.path = os.fspath(path)
+        self.header: dict = None
+        self.done: set[tuple[str, int]] = set()
+        self._lock = threading.Lock()
+
+    def load(self) -> bool:
+        """
+        Read the journal from disk.
+
+        Returns:
+            bool: True if a journal was found.
+        """
+        try:
+            with open(self.path, "r") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return False
+
+        if not lines:
+            return False
+
+        self.header = json.loads(lines[0])
+
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # torn write of the last entry; that chunk is uploaded again
+                continue
+
+            self.done.add((entry["chunk_id"], entry["chunk_idx"]))
+
+        return True
+
+    def matches(
+        self, sizes: dict[str, int], identities: dict[str, dict] = None
+    ) -> bool:
+        """
+        Check if the journal belongs to an upload of the same, unchanged files; a file edited in place
+        keeps its size but not its modification time (see file_identity).
+
+        Args:
+            sizes (dict[str, int]): size per filename of the files to upload.
+            identities (dict[str, dict], optional): file_identity per filename. Defaults to None.
+        """
+        if self.header is None:
+            return False
+
+        files = self.header["files"]
+
+        if {name: info["size"] for name, info in files.items()} != sizes:
+            return False
+
+        return all(
+            files[name].get(key) == identity.get(key)
+            for name, identity in (identities or {}).items()
+            for key in IDENTITY_KEYS
+        )
+
+    @property
+    def batch_id(self) -> str:
+        return self.header["batch_id"]
+
+    def files(self) -> list[UploadFile]:
+        return [
+            UploadFile(
+                name,
+                info["chunk_id"],
+                info["size"],
+                self.header["max_chunk_size"],
+                info["chunk_count"],
+            )
+            for name, info in self.header["files"].items()
+        ]
+
+    def begin(
+        self,
+        batch_id: str,
+        max_chunk_size: int,
+        files: list[UploadFile],
+        identities: dict[str, dict] = None,
+    ):
+        """
+        Start a new journal for a batch, replacing an existing one.
+        """
+        identities = identities or {}
+        self.header = {
+            "batch_id": batch_id,
+            "max_chunk_size": max_chunk_size,
+            "files": {
+                f.filename: {
+                    "chunk_id": f.chunk_id,
+                    "size": f.size,
+                    "chunk_count": f.chunk_count,
+                    **identities.get(f.filename, {}),
+                }
+                for f in files
+            },
+        }
+        self.done = set()
+
+        with open(self.path, "w") as f:
+            f.write(json.dumps(self.header) + "\n")
+
+    def record(self, chunk_id: str, chunk_idx: int):
+        """
+        Register an uploaded chunk.
+        """
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(
+                    json.dumps({"chunk_id": chunk_id, "chunk_idx": chunk_idx}) + "\n"
+                )
+
+            self.done.add((chunk_id, chunk_idx))
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def file_identity(handle: Any) -> dict:
+    """
+    Modification time (ns) and inode of a file, to tell a file changed in place from the one in a journal.
+    Empty for files without a descriptor.
+    """
+    try:
+        stat = os.fstat(handle.fileno())
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return {}
+
+    return {"mtime_ns": stat.st_mtime_ns, "inode": stat.st_ino}
+
+
+def _fileno(handle: Any) -> int | None:
+    if not hasattr(os, "pread"):
+        return None
+
+    try:
+        return handle.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+
+def _pread(fd: int, size: int, offset: int) -> bytes:
+    chunks = []
+
+    while size > 0:
+        chunk = os.pread(fd, size, offset)
+
+        if not chunk:
+            break
+
+        chunks.append(chunk)
+        size -= len(chunk)
+        offset += len(chunk)
+
+    return b"".join(chunks)
+
+
+def read_chunk(
+    handle: IO[bytes], offset: int, size: int, lock: threading.Lock
+) -> bytes:
+    """
+    Read a chunk at an offset without using the shared file position when the file has a descriptor
+    (os.pread); other file objects are read under lock.
+
+    Args:
+        handle (IO[bytes]): file to read from.
+        offset (int): offset of the chunk.
+        size (int): size of the chunk.
+        lock (threading.Lock): lock guarding the file position.
+
+    Returns:
+        bytes: the chunk.
+    """
+    if (fd := _fileno(handle)) is not None:
+        return _pread(fd, size, offset)
+
+    with lock:
+        handle.seek(offset)
+        return handle.read(size)
+
+
+async def a_read_chunk(
+    handle: AsyncTextIOWrapper, offset: int, size: int, lock: asyncio.Lock
+) -> bytes:
+    """
+    Async variant of read_chunk for aiofiles handles; os.pread runs in a worker thread.
+    """
+    if (fd := _fileno(handle)) is not None:
+        return await asyncio.to_thread(_pread, fd, size, offset)
+
+    async with lock:
+        await handle.seek(offset)
+        return await handle.read(size)
+
+
+class MappedFile:
+    def __init__(self, handle: IO[bytes] | AsyncTextIOWrapper):
+        """
+        Read only memory map of a file; chunks are memoryview slices of the map so they are not copied
+        into memory before they are sent. Files without a descriptor (or empty files, which can not be
+        mapped) are not mapped and view stays None.
+
+        Args:
+            handle (IO[bytes] | AsyncTextIOWrapper): file opened in binary mode.
+        """
+        self._mmap: mmap.mmap = None
+        self.view: memoryview = None
+
+        try:
+            fd = handle.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return
+
+        try:
+            self._mmap = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            return
+
+        self.view = memoryview(self._mmap)
+
+    def chunk(self, offset: int, size: int) -> memoryview | None:
+        """
+        Slice of the map; release it when done. None if the file is not mapped.
+        """
+        if size == 0:
+            return memoryview(b"")
+
+        if self.view is None:
+            return None
+
+        return self.view[offset : offset + size]
+
+    def close(self):
+        if self.view is not None:
+            self.view.release()
+            self._mmap.close()
+            self.view = self._mmap = None
+
+
+class MultipartChunk:
+    def __init__(
+        self,
+        fields: dict[str, Any],
+        filename: str,
+        payload: memoryview | bytes,
+        name: str = "content",
+        content_type: str = "application/octet-stream",
+        algorithms: Iterable[str] = (),
+        block_size: int = DEFAULT_CHUNK_SIZE,
+    ):
+        """
+        multipart/form-data body with form fields and a single file, generated on the fly.
+
+        The payload is sent in blocks of block_size sliced from the (memory mapped) payload, so only one
+        block is copied at a time regardless of the chunk size. The body can be iterated more than once
+        (e.g. when retried); the digests of the payload are computed while it is sent.
+
+        Args:
+            fields (dict[str, Any]): form fields.
+            filename (str): filename of the file part.
+            payload (memoryview | bytes): content of the file part.
+            name (str, optional): form name of the file part. Defaults to "content".
+            content_type (str, optional): content type of the file part. Defaults to "application/octet-stream".
+            algorithms (Iterable[str], optional): hashlib algorithms to compute over the payload. Defaults to ().
+            block_size (int, optional): size of the blocks the payload is sent in. Defaults to DEFAULT_CHUNK_SIZE.
+        """
+        self.boundary = secrets.token_hex(16)
+        self.payload = (
+            payload if isinstance(payload, memoryview) else memoryview(payload)
+        )
+        self.algorithms = tuple(algorithms)
+        self.block_size = block_size
+        self.digests: dict[str, str] = {}
+
+        head = [
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{self._quote(key)}"\r\n\r\n{value}\r\n'
+            for key, value in fields.items()
+        ]
+        head.append(
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{self._quote(name)}"; filename="{self._quote(filename)}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        )
+
+        self.head = "".join(head).encode()
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode()
+
+    @staticmethod
+    def _quote(value: str) -> str:
+        # same escaping as httpx uses for multipart names
+        return (
+            value.replace("\\", "\\\\")
+            .replace('"', "%22")
+            .replace("\r", "%0D")
+            .replace("\n", "%0A")
+        )
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return len(self.head) + self.payload.nbytes + len(self.tail)
+
+    @property
+    def headers(self) -> dict:
+        return {"Content-Type": self.content_type, "Content-Length": str(len(self))}
+
+    def __iter__(self) -> Iterator[bytes]:
+        hashes = [hashlib.new(name) for name in self.algorithms]
+
+        yield self.head
+
+        for start in range(0, self.payload.nbytes, self.block_size):
+            with self.payload[start : start + self.block_size] as block:
+                for h in hashes:
+                    h.update(block)
+
+                yield bytes(block)
+
+        self.digests = {name: h.hexdigest() for name, h in zip(self.algorithms, hashes)}
+
+        yield self.tail
+
+    async def aiter(self) -> AsyncIterator[bytes]:
+        """
+        The body as async iterator, as required by async clients
+        """
+        for part in self:
+            yield part
+
+    def release(self):
+        self.payload.release()
+
+
+ChunkContent = memoryview | bytes | None
+
+
+def load_chunk(
+    mapped: MappedFile,
+    handle: IO[bytes] | AsyncTextIOWrapper,
+    offset: int,
+    size: int,
+    lock: threading.Lock = None,
+) -> ChunkContent:
+    """
+    A chunk from the memory map, else read at its offset; with a lock the handle is read like read_chunk,
+    without one (async handles) only os.pread is used. None if the chunk can not be read.
+    """
+    if (chunk := mapped.chunk(offset, size)) is not None:
+        return chunk
+
+    if lock is not None:
+        return read_chunk(handle, offset, size, lock)
+
+    if (fd := _fileno(handle)) is not None:
+        return _pread(fd, size, offset)
+
+    return None
+
+
+class FileDigest:
+    def __init__(self, upload_file: UploadFile, algorithms: Iterable[str]):
+        """
+        Digests of a file uploaded in chunks which may complete in any order.
+
+        Chunks are hashed in file order from the content that was sent, so the file is read once. A chunk
+        which completes before the chunks in front of it is kept until those are hashed; a slice of a
+        memory map costs no memory, chunks that were read are buffered.
+
+        Args:
+            upload_file (UploadFile): the file.
+            algorithms (Iterable[str]): hashlib algorithms to compute.
+        """
+        self.file = upload_file
+        self.hashes = {name: hashlib.new(name) for name in algorithms}
+        self.next = 0
+        self.waiting: dict[int, ChunkContent | Callable[[], ChunkContent]] = {}
+        self.failed = False
+        self._lock = threading.Lock()
+
+    def complete(
+        self, chunk_idx: int, content: ChunkContent | Callable[[], ChunkContent]
+    ):
+        """
+        Register the content of a completed chunk and hash the chunks that are now contiguous. The digest
+        takes ownership of memoryviews. A callable is only called when it is the turn of the chunk (e.g.
+        for chunks uploaded before a resume); None means the chunk can not be hashed.
+        """
+        with self._lock:
+            self.waiting[chunk_idx] = content
+
+            while self.next in self.waiting:
+                content = self.waiting.pop(self.next)
+
+                if callable(content):
+                    content = content()
+
+                if content is None:
+                    self.failed = True
+                elif not self.failed:
+                    for h in self.hashes.values():
+                        h.update(content)
+
+                if isinstance(content, memoryview):
+                    content.release()
+
+                self.next += 1
+
+    def close(self):
+        """
+        Release the chunks still waiting for the chunks in front of them (e.g. after a failed upload).
+        """
+        with self._lock:
+            for content in self.waiting.values():
+                if isinstance(content, memoryview):
+                    content.release()
+
+            self.waiting.clear()
+
+    def result(self) -> dict[str, str] | None:
+        """
+        The digests or None if not all chunks were hashed.
+        """
+        if self.failed or self.next != self.file.chunk_count:
+            return None
+
+        return {name: h.hexdigest() for name, h in self.hashes.items()}
@@ -0,0 +1,269 @@
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable
+
+NXDOMAIN = 3
+SOA = 6
+
+
+def negative_ttl(data: dict) -> int | None:
+    """
+    TTL of a negative answer (NXDOMAIN or no data) following RFC 2308; the minimum of the TTL of the SOA
+    record in the authority section and its minimum field.
+
+    Args:
+        data: decoded dns-json response.
+
+    Returns:
+        TTL in seconds or None if the response holds no SOA record
+    """
+    for record in data.get("Authority") or ():
+        if record.get("type") != SOA:
+            continue
+
+        try:
+            minimum = int(str(record["data"]).split()[-1])
+        except (KeyError, IndexError, ValueError):
+            continue
+
+        return min(int(record.get("TTL", minimum)), minimum)
+
+    return None
+
+
+def answer_ttl(data: dict, default_negative_ttl: int = 0) -> int | None:
+    """
+    Determine how long a dns-json response may be cached.
+
+    Answers are cached for the lowest TTL of their records; NXDOMAIN and empty answers for the negative
+    TTL of the SOA record (default_negative_ttl without one). Other failures are not cached.
+
+    Args:
+        data: decoded dns-json response.
+        default_negative_ttl: TTL of negative answers without SOA record.
+
+    Returns:
+        TTL in seconds or None if the response may not be cached
+    """
+    status = data.get("Status")
+
+    if status == 0 and data.get("Answer"):
+        return min(int(record.get("TTL", 0)) for record in data["Answer"])
+
+    if status in (0, NXDOMAIN):
+        ttl = negative_ttl(data)
+
+        return default_negative_ttl if ttl is None else ttl
+
+    return None
+
+
+def age_ttls(content: bytes, elapsed: float) -> bytes:
+    """
+    Subtract the time a dns-json response spent in the cache from the TTL of its records, with a floor
+    of 0, like a caching resolver does.
+
+    Args:
+        content: dns-json response.
+        elapsed: seconds since the response was cached.
+
+    Returns:
+        the response with aged TTLs; unchanged if it is not dns-json
+    """
+    if (elapsed := int(elapsed)) <= 0:
+        return content
+
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return content
+
+    if not isinstance(data, dict):
+        return content
+
+    for section in ("Answer", "Authority", "Additional"):
+        for record in data.get(section) or ():
+            if isinstance(record, dict) and "TTL" in record:
+                record["TTL"] = max(int(record["TTL"]) - elapsed, 0)
+
+    return json.dumps(data).encode()
+
+
+class DnsCache:
+    def __init__(
+        self,
+        max_entries: int = 100_000,
+        redis_client=None,
+        prefix: str = "doh",
+        max_ttl: int = 86400,
+        default_negative_ttl: int = 60,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Cache of DoH responses keyed by (name, type) which respects the TTL of the answers.
+
+        Responses are kept in an in process lru and, when a redis client (sync or asyncio) is given, in
+        redis so the cache is shared between workers and survives restarts. Negative answers (NXDOMAIN,
+        no data) are cached for the negative TTL of their SOA record. The TTLs of cached responses count
+        down with the time they spent in the cache (see age_ttls).
+
+        Args:
+            max_entries: max amount of responses kept in memory.
+            redis_client: optional redis client for the second tier.
+            prefix: prefix of the redis keys.
+            max_ttl: upper bound of the TTL in seconds.
+            default_negative_ttl: TTL of negative answers without SOA record.
+            clock: wall clock in seconds.
+        """
+        self.max_entries = max_entries
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.max_ttl = max_ttl
+        self.default_negative_ttl = default_negative_ttl
+        self.clock = clock
+
+        # (expires, stored, content) per key
+        self.entries: OrderedDict[Hashable, tuple[float, float, bytes]] = OrderedDict()
+
+        self.memory_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+
+    def redis_key(self, key: tuple[str, int]) -> str:
+        name, qtype = key
+        return f"{self.prefix}:{qtype}:{name.lower()}"
+
+    def ttl(self, data: Any) -> int | None:
+        """
+        TTL to cache a decoded response for, capped at max_ttl; None if it may not be cached
+        """
+        if not isinstance(data, dict):
+            return None
+
+        ttl = answer_ttl(data, self.default_negative_ttl)
+
+        if ttl is None or ttl <= 0:
+            return None
+
+        return min(ttl, self.max_ttl)
+
+    def _get_memory(
+        self, key: tuple[str, int], now: float
+    ) -> tuple[float, bytes] | None:
+        if (entry := self.entries.get(key)) is None:
+            return None
+
+        expires, stored, content = entry
+
+        if expires <= now:
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+
+        return stored, content
+
+    def _set_memory(
+        self, key: tuple[str, int], content: bytes, expires: float, stored: float
+    ):
+        self.entries[key] = (expires, stored, content)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(False)
+
+    @staticmethod
+    async def _result(value):
+        # works with both sync and asyncio redis clients
+        if inspect.isawaitable(value):
+            return await value
+
+        return value
+
+    async def get_many(self, keys: Iterable[tuple[str, int]]) -> list[bytes | None]:
+        """
+        Get the cached responses of (name, type) keys; memory first, then a single redis round trip.
+
+        Returns:
+            Response content per key, with the TTLs aged by the time in the cache, or None if not cached
+        """
+        keys = [(name.lower(), qtype) for name, qtype in keys]
+        now = self.clock()
+
+        with self._lock:
+            results = [self._get_memory(key, now) for key in keys]
+
+        missing = [idx for idx, entry in enumerate(results) if entry is None]
+
+        if missing and self.redis_client is not None:
+            values = await self._result(
+                self.redis_client.mget([self.redis_key(keys[idx]) for idx in missing])
+            )
+
+            with self._lock:
+                for idx, value in zip(missing, values):
+                    if value is None:
+                        continue
+
+                    header, _, content = bytes(value).partition(b"\n")
+                    # entries written before the stored time was kept are not aged
+                    expires, stored = (header.split() + [now])[:2]
+
+                    if (expires := float(expires)) <= now:
+                        continue
+
+                    self._set_memory(keys[idx], content, expires, float(stored))
+                    results[idx] = float(stored), content
+                    self.redis_hits += 1
+
+        with self._lock:
+            self.memory_hits += len(keys) - len(missing)
+            self.misses += sum(entry is None for entry in results)
+
+        return [
+            None if entry is None else age_ttls(entry[1], now - entry[0])
+            for entry in results
+        ]
+
+    async def set(self, key: tuple[str, int], content: bytes, ttl: int):
+        """
+        Cache the response of a (name, type) key for ttl seconds.
+        """
+        key = (key[0].lower(), key[1])
+        stored = self.clock()
+        expires = stored + ttl
+
+        with self._lock:
+            self._set_memory(key, content, expires, stored)
+
+        if self.redis_client is not None:
+            await self._result(
+                self.redis_client.set(
+                    self.redis_key(key),
+                    f"{expires} {stored}\n".encode() + content,
+                    ex=ttl,
+                )
+            )
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.redis_hits + self.misses
+            hits = self.memory_hits + self.redis_hits
+
+            return {
+                "entries": len(self.entries),
+                "memory_hits": self.memory_hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+            }
@@ -1,17 +1,26 @@
+import asyncio
 import collections
 import json
 import logging
-from dataclasses import dataclass, field
-from typing import List, Optional
+import os
+from dataclasses import dataclass
+from ipaddress import IPv6Address
+from typing import Any, AsyncIterator, List, Optional
 
-from dataclasses_json import config as json_config
-from dataclasses_json import dataclass_json
-from httpx import Response
-from netaddr.ip import IPAddress
+from httpx import Response, codes
 
-from nldcsc.generic.utils import exclude_optional_dict, reverse_from_named_tuple
+from nldcsc.generic.utils import reverse_index
+from nldcsc.httpx_apis.base_class.decoding import decode_json
 from nldcsc.loggers.app_logger import AppLogger
-from nldcsc.plugins.doh.doh_requester import DOHRequester, q_types
+from nldcsc.plugins.doh.dns_cache import DnsCache
+from nldcsc.plugins.doh.doh_requester import (
+    DnsQuery,
+    DnsResolver,
+    DOHRequester,
+    q_types,
+)
+from nldcsc.plugins.doh.resolver_pool import ResolverPool
+from nldcsc.plugins.doh.wire import DNS_MESSAGE, decode_message
 
 logging.setLoggerClass(AppLogger)
 
@@ -21,6 +30,23 @@ status_types = collections.namedtuple(
 )(0, 1, 2, 3, 4, 5)
 
 
+def decode_response(response: Response) -> Any:
+    """
+    Decode a dns-json or RFC 8484 wire format (application/dns-message) response into the structure of
+    the dns-json api
+
+    Args:
+        response: the response
+
+    Returns:
+        decoded response
+    """
+    if response.headers.get("content-type", "").startswith(DNS_MESSAGE):
+        return decode_message(response.content)
+
+    return decode_json(response.content)
+
+
 def reverse_pointer_ip(ptr_address: str) -> str | None:
     """
     Method to reverse the reverse dns lookup address
@@ -42,47 +68,74 @@ def reverse_pointer_ip(ptr_address: str) -> str | None:
     if ipv6_def in ptr_address:
         address = ptr_address.replace(ipv6_def, "")
         reverse_string = address.replace(".", "")[::-1]
-        full_ipv6_string = ":".join(
-            reverse_string[i : i + 4] for i in range(0, len(reverse_string), 4)
-        )
-        ipv6_address = IPAddress(full_ipv6_string)
-        return str(ipv6_address)
+
+        if len(reverse_string) != 32:
+            return None
+
+        try:
+            return str(IPv6Address(int(reverse_string, 16)))
+        except ValueError:
+            return None
 
     return None
 
 
-# noinspection PyClassHasNoInitInspection
-@dataclass_json
-@dataclass
+_q_type_names = reverse_index(q_types)
+_status_names = reverse_index(status_types)
+
+
+def _optional(data: dict, key: str, value: Any):
+    # optional fields are left out when empty, like exclude_optional_dict does
+    if value:
+        data[key] = value
+
+
+@dataclass(slots=True)
 class QuestionData:
     name: str
     type: int
-    original_ip: Optional[str] = field(
-        metadata=json_config(exclude=exclude_optional_dict), default=None
-    )
+    original_ip: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuestionData":
+        return cls(**data, original_ip=reverse_pointer_ip(data["name"]))
+
+    def to_dict(self) -> dict:
+        data = {"name": self.name, "type": self.type}
+        _optional(data, "original_ip", self.original_ip)
+
+        return data
 
     @property
     def s_type(self) -> str:
-        return reverse_from_named_tuple(q_types, self.type)
+        return _q_type_names[self.type]
 
 
-# noinspection PyClassHasNoInitInspection
-@dataclass_json
-@dataclass
+@dataclass(slots=True)
 class AnswerData:
     name: str
     type: int
     TTL: int
     data: str
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "AnswerData":
+        return cls(**data)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "type": self.type,
+            "TTL": self.TTL,
+            "data": self.data,
+        }
+
     @property
     def s_type(self) -> str:
-        return reverse_from_named_tuple(q_types, self.type)
+        return _q_type_names[self.type]
 
 
-# noinspection PyClassHasNoInitInspection
-@dataclass_json
-@dataclass
+@dataclass(slots=True)
 class Request:
     Status: int
     TC: bool
@@ -91,19 +144,51 @@ class Request:
     AD: bool
     CD: bool
     Question: List[QuestionData]
-    Answer: Optional[List[AnswerData]] = field(
-        metadata=json_config(exclude=exclude_optional_dict), default=None
-    )
-    Authority: Optional[List[AnswerData]] = field(
-        metadata=json_config(exclude=exclude_optional_dict), default=None
-    )
-    Comment: Optional[List[str]] = field(
-        metadata=json_config(exclude=exclude_optional_dict), default=None
-    )
+    Answer: Optional[List[AnswerData]] = None
+    Authority: Optional[List[AnswerData]] = None
+    Comment: Optional[List[str]] = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Request":
+        """
+        Create a request from a decoded dns-json response
+
+        Raises:
+            TypeError: the response holds unknown or misses required fields
+        """
+        data = dict(data)
+
+        if data.get("Question") is not None:
+            data["Question"] = [QuestionData.from_dict(x) for x in data["Question"]]
+
+        for section in ("Answer", "Authority"):
+            if data.get(section) is not None:
+                data[section] = [AnswerData.from_dict(x) for x in data[section]]
+
+        return cls(**data)
+
+    def to_dict(self) -> dict:
+        data = {
+            "Status": self.Status,
+            "TC": self.TC,
+            "RD": self.RD,
+            "RA": self.RA,
+            "AD": self.AD,
+            "CD": self.CD,
+            "Question": [x.to_dict() for x in self.Question],
+        }
+
+        if self.Answer:
+            data["Answer"] = [x.to_dict() for x in self.Answer]
+        if self.Authority:
+            data["Authority"] = [x.to_dict() for x in self.Authority]
+        _optional(data, "Comment", self.Comment)
+
+        return data
 
     @property
     def s_status(self) -> str:
-        return reverse_from_named_tuple(status_types, self.Status)
+        return _status_names[self.Status]
 
     @property
     def request_ok(self) -> bool:
@@ -128,12 +213,27 @@ class Request:
 
 
 class DohParser(object):
-    def __init__(self):
+    def __init__(self, cache: DnsCache = None, resolver: DnsResolver = None):
         """
         Create new instance of DohParser
+
+        Without resolver a pool of the resolvers in the DOH_RESOLVERS environment variable is used (see
+        ResolverPool.from_env), or https://1.1.1.1 when it is not set.
+
+        Args:
+            cache: optional cache of the responses; cached queries are not sent to the resolver
+            resolver: resolver (DOHRequester or ResolverPool) to use
         """
         self.logger = logging.getLogger(self.__class__.__name__)
-        self.doh_requester = DOHRequester("https://1.1.1.1")
+
+        if resolver is None:
+            if os.getenv("DOH_RESOLVERS"):
+                resolver = ResolverPool.from_env()
+            else:
+                resolver = DOHRequester("https://1.1.1.1")
+
+        self.doh_requester = resolver
+        self.cache = cache
 
     async def make_requests(
         self, workload: dict[int | str, List[str]]
@@ -147,7 +247,66 @@ class DohParser(object):
         Returns:
             A list of `Response` objects
         """
-        data = await self.doh_requester.get_bulk_domains(workload=workload)
+        if self.cache is None:
+            data = await self.doh_requester.get_bulk_domains(workload=workload)
+            return data
+
+        queries = list(self.doh_requester.iter_queries(workload))
+        return await self.make_cached_requests(queries)
+
+    async def make_cached_requests(self, queries: List[DnsQuery]) -> List[Response]:
+        """
+        Method to make DOH requests for the queries which are not in the cache, and cache their responses for
+        the TTL of the answers
+
+        Args:
+            queries: a list of queries
+
+        Returns:
+            A list of `Response` objects in the order of the queries; cached ones have the 'from_cache' extension
+        """
+        cached = await self.cache.get_many(queries)
+
+        data = [
+            (
+                Response(codes.OK, content=content, extensions={"from_cache": True})
+                if content is not None
+                else None
+            )
+            for content in cached
+        ]
+
+        missing = [idx for idx, response in enumerate(data) if response is None]
+
+        if not missing:
+            return data
+
+        responses = await self.doh_requester.get_queries(
+            [queries[idx] for idx in missing]
+        )
+
+        for idx, response in zip(missing, responses):
+            data[idx] = response
+
+            if response.status_code != codes.OK:
+                continue
+
+            try:
+                decoded = decode_response(response)
+            except ValueError:
+                continue
+
+            if (ttl := self.cache.ttl(decoded)) is None:
+                continue
+
+            if response.headers.get("content-type", "").startswith(DNS_MESSAGE):
+                # cached as dns-json, so cached responses are always decoded the same way
+                content = json.dumps(decoded).encode()
+            else:
+                content = response.content
+
+            await self.cache.set(queries[idx], content, ttl)
+
         return data
 
     def parse_responses(self, responses: List[Response]) -> List[Request]:
@@ -165,25 +324,9 @@ class DohParser(object):
         for response in responses:
             if response.status_code == 200:
                 try:
-                    data = json.loads(response.content.decode("utf-8"))
+                    data = decode_response(response)
                     if isinstance(data, dict):
-                        if "Question" in data:
-                            q_list = [
-                                QuestionData(
-                                    **x,
-                                    original_ip=reverse_pointer_ip(x["name"]),
-                                )
-                                for x in data["Question"]
-                            ]
-                            data["Question"] = q_list
-                        if "Answer" in data:
-                            a_list = [AnswerData(**x) for x in data["Answer"]]
-                            data["Answer"] = a_list
-                        if "Authority" in data:
-                            a_list = [AnswerData(**x) for x in data["Authority"]]
-                            data["Authority"] = a_list
-
-                        r_list.append(Request(**data))
+                        r_list.append(Request.from_dict(data))
                     else:
                         raise ValueError
                 except TypeError:
@@ -206,30 +349,140 @@ class DohParser(object):
                     continue
         return r_list
 
+    async def _request(self, query: DnsQuery, timeout: float = 10) -> Response:
+        if self.cache is None:
+            return await self.doh_requester.query(query, timeout)
+
+        return (await self.make_cached_requests([query]))[0]
+
+    async def _stream_requests(
+        self,
+        workload: dict[int | str, List[str]],
+        reverse: bool,
+        concurrency: int | None,
+    ) -> AsyncIterator[tuple[str, tuple[int, ...], Request]]:
+        # yields the position of the query as well: (index in the workload,) for forward lookups and
+        # (index of the forward lookup, index of the address) for reverse lookups
+        forward = (
+            (query, "forward", (idx,))
+            for idx, query in enumerate(self.doh_requester.iter_queries(workload))
+        )
+        forward_done = False
+        # reverse lookups queued from the answers; None ends the feed
+        queue: asyncio.Queue[tuple[DnsQuery, str, tuple] | None] = asyncio.Queue()
+        in_flight: dict[DnsQuery, collections.deque[tuple[str, tuple]]] = (
+            collections.defaultdict(collections.deque)
+        )
+        seen: set[str] = set()
+        outstanding = 0
+
+        async def feed() -> AsyncIterator[DnsQuery]:
+            nonlocal forward_done, outstanding
+
+            while True:
+                if not queue.empty():
+                    item = queue.get_nowait()
+                elif (item := next(forward, None)) is None:
+                    forward_done = True
+
+                    if outstanding == 0:
+                        return
+
+                    item = await queue.get()
+
+                if item is None:
+                    return
+
+                query, stage, position = item
+                in_flight[query].append((stage, position))
+                outstanding += 1
+                yield query
+
+        async for query, response in self.doh_requester.resolve(
+            feed(), concurrency, send=self._request
+        ):
+            outstanding -= 1
+            stage, position = in_flight[query].popleft()
+
+            if not in_flight[query]:
+                del in_flight[query]
+
+            if isinstance(response, Exception):
+                self.logger.warning(f"DOH request failed: {response}")
+                requests = []
+            else:
+                requests = self.parse_responses([response])
+
+            for request in requests:
+                if stage == "forward" and reverse:
+                    ips = [ip for ip in request.reverse_data_lookups if ip not in seen]
+                    seen.update(ips)
+
+                    for idx, query in enumerate(
+                        self.doh_requester.iter_queries({q_types.PTR: ips})
+                    ):
+                        queue.put_nowait((query, "reverse", position + (idx,)))
+
+            if forward_done and outstanding == 0 and queue.empty():
+                queue.put_nowait(None)
+
+            for request in requests:
+                yield stage, position, request
+
+    async def stream_requests(
+        self,
+        workload: dict[int | str, List[str]],
+        reverse: bool = True,
+        concurrency: int = None,
+    ) -> AsyncIterator[tuple[str, Request]]:
+        """
+        Method to resolve a workload and the reverse lookups of its answers as a pipeline; as soon as a
+        forward answer is parsed its A and AAAA addresses, not seen before, are queued for a PTR lookup, so
+        forward and reverse lookups are in flight at the same time. Pending reverse lookups go first, so
+        their results do not wait for the end of the forward lookups.
+
+        The queries are fed to the resolve method of the resolver, which keeps the window of lookups in flight.
+
+        Args:
+            workload: a dictionary as dictated by get_bulk_domains method of the DohRequester class
+            reverse: whether to do the reverse lookups of the answers
+            concurrency: lookups in flight. Defaults to the max_concurrency of the resolver
+
+        Returns:
+            Async iterator of ("forward" or "reverse", `Request`) tuples in order of completion
+        """
+        async for stage, _, request in self._stream_requests(
+            workload, reverse, concurrency
+        ):
+            yield stage, request
+
     async def request_and_parse(
         self, workload: dict[int | str, List[str]]
     ) -> dict[str, List[dict[str, str | int | List[dict[str, str | int]]]]]:
-        query_data = await self.make_requests(workload=workload)
-
-        # forward dns queries
-        query_request_data = self.parse_responses(query_data)
-
-        # reverse lookups
-        reverse_lookups = []
-        for response in query_request_data:
-            reverse_lookups.extend(response.reverse_data_lookups)
-        reverse_data = await self.make_requests(
-            workload={q_types.PTR: list(set(reverse_lookups))}
-        )
+        """
+        Method to resolve a workload and the reverse lookups of its answers (see stream_requests)
 
-        reverse_request_data = self.parse_responses(reverse_data)
+        Args:
+            workload: a dictionary as dictated by get_bulk_domains method of the DohRequester class
 
-        ret_dict = {
-            "forward_requests": [x.to_dict() for x in query_request_data],
-            "reverse_requests": [x.to_dict() for x in reverse_request_data],
+        Returns:
+            The forward requests as dictionaries in the order of the workload, and the reverse requests in
+            the order of the forward answers they were looked up for
+        """
+        results = {"forward": [], "reverse": []}
+
+        async for stage, position, request in self._stream_requests(
+            workload, True, None
+        ):
+            results[stage].append((position, request))
+
+        return {
+            f"{stage}_requests": [
+                request.to_dict()
+                for _, request in sorted(requests, key=lambda item: item[0])
+            ]
+            for stage, requests in results.items()
         }
 
-        return ret_dict
-
     def __repr__(self):
         return "<< DohParser >>"
@@ -1,35 +1,43 @@
+import asyncio
 import collections
+import logging
+from abc import ABC, abstractmethod
 from ipaddress import ip_address
-from typing import List
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+)
 
 from httpx import Response
 
+from nldcsc.generic.tasks import iter_completed
 from nldcsc.httpx_apis.base_class.httpx_base_class import HttpxBaseClass
+from nldcsc.plugins.doh.wire import DNS_MESSAGE, encode_query
 
 q_types = collections.namedtuple(
     "q_types", ["A", "NS", "CNAME", "SOA", "PTR", "MX", "TXT", "AAAA"]
 )(1, 2, 5, 6, 12, 15, 16, 28)
 
 
-class DOHRequester(HttpxBaseClass):
-    def __init__(
-        self,
-        baseurl: str,
-        api_path: str = None,
-        proxies: dict = None,
-        user_agent: str = "Certex",
-        **kwargs,
-    ):
-        super().__init__(
-            baseurl=baseurl,
-            api_path=api_path,
-            proxies=proxies,
-            user_agent=user_agent,
-            **kwargs,
-        )
+class DnsQuery(NamedTuple):
+    name: str
+    type: int
 
-        self.clear_headers()
-        self.set_header_field("accept", "application/dns-json")
+
+class DnsResolver(ABC):
+    """
+    Resolving logic shared by the resolvers (DOHRequester, ResolverPool); subclasses implement query and
+    provide a logger and max_concurrency.
+    """
+
+    logger: logging.Logger
+    max_concurrency: int
 
     @staticmethod
     def _convert_to_reverse_format(ipaddress: str) -> str:
@@ -44,6 +52,87 @@ class DOHRequester(HttpxBaseClass):
         """
         return ip_address(ipaddress).reverse_pointer
 
+    def _resolve_type(self, dns_type: int | str) -> int | str:
+        if isinstance(dns_type, str) and dns_type != "*":
+            try:
+                return getattr(q_types, dns_type)
+            except AttributeError:
+                self.logger.warning(
+                    f"Requesting a dns type ({dns_type}) which is not in the q_types tuple; passing requested int"
+                )
+
+        return dns_type
+
+    def iter_queries(self, workload: dict[int | str, List[str]]) -> Iterator[DnsQuery]:
+        """
+        Expand a workload (see get_bulk_domains) into queries
+        """
+        for qtype, domain_list in workload.items():
+            qtype = self._resolve_type(qtype)
+
+            if qtype == "*":
+                #  since we are querying all types; filter out double entries
+                for domain in dict.fromkeys(domain_list):
+                    if len(domain.split(".")) == 2:
+                        q_type_list = [x for x in q_types._fields if x != "PTR"]
+                    else:
+                        q_type_list = ["A", "AAAA", "CNAME", "TXT"]
+
+                    for q_type in q_type_list:
+                        yield DnsQuery(domain, getattr(q_types, q_type))
+            else:
+                for domain in domain_list:
+                    if qtype == q_types.PTR:
+                        domain = self._convert_to_reverse_format(domain)
+
+                    yield DnsQuery(domain, qtype)
+
+    @abstractmethod
+    async def query(self, query: DnsQuery, timeout: float = 10) -> Response:
+        """
+        Resolve a single query.
+
+        Args:
+            query: the query.
+            timeout: seconds the request may take.
+
+        Returns:
+            `Response` object
+        """
+
+    async def resolve(
+        self,
+        queries: Iterable[DnsQuery] | AsyncIterable[DnsQuery],
+        concurrency: int = None,
+        timeout: float = 10,
+        send: Callable[[DnsQuery, float], Awaitable[Response]] = None,
+    ) -> AsyncIterator[tuple[DnsQuery, Response | Exception]]:
+        """
+        Resolve queries concurrently over the shared (http2) client, yielding the results as they complete.
+
+        Queries are taken from queries as slots free up, so large (or async) iterables are never
+        materialised; at most concurrency queries of this call, and max_concurrency queries of this
+        resolver overall, are in flight. An async iterable may be fed from the results, as the next query
+        is awaited alongside the queries in flight. Failed queries are yielded with their exception.
+
+        Args:
+            queries: queries to resolve, e.g. from iter_queries.
+            concurrency: queries of this call in flight. Defaults to the max_concurrency of the resolver.
+            timeout: seconds a request may take.
+            send: coroutine function sending a query (e.g. through a cache). Defaults to query.
+
+        Returns:
+            Async iterator of (query, `Response` or exception) tuples in order of completion
+        """
+        send = send or self.query
+
+        async for result in iter_completed(
+            queries,
+            lambda query: send(query, timeout),
+            concurrency or self.max_concurrency,
+        ):
+            yield result
+
     async def get_domain_list_by_type(
         self, domains: List[str], dns_type: int | str = 1  # A record
     ) -> List[Response]:
@@ -58,21 +147,7 @@ class DOHRequester(HttpxBaseClass):
         Returns:
             List of `Response` objects
         """
-        if isinstance(dns_type, str):
-            try:
-                dns_type = getattr(q_types, dns_type)
-            except AttributeError:
-                self.logger.warning(
-                    f"Requesting a dns type ({dns_type}) which is not in the q_types tuple; passing requested int"
-                )
-                pass
-
-        if dns_type == q_types.PTR:
-            domains = [self._convert_to_reverse_format(x) for x in domains]
-
-        resources = [f"dns-query?name={each}&type={dns_type}" for each in domains]
-        data = await self.a_call(self.methods.GET, resources=resources)
-        return data
+        return await self.get_bulk_domains({dns_type: domains})
 
     async def get_bulk_domains(
         self, workload: dict[int | str, List[str]]
@@ -87,48 +162,27 @@ class DOHRequester(HttpxBaseClass):
         Returns:
             List of `Response` objects
         """
-        resources = []
-        query_all_types = False
+        return await self.get_queries(list(self.iter_queries(workload)))
 
-        for qtype, domain_list in workload.items():
-            if isinstance(qtype, str):
-                if qtype == "*":
-                    query_all_types = True
-                    #  since we are querying all types; create a set of domain_list to filter out double entries
-                    domain_list = list(set(domain_list))
-                else:
-                    try:
-                        qtype = getattr(q_types, qtype)
-                    except AttributeError:
-                        self.logger.warning(
-                            f"Requesting a dns type ({qtype}) which is not in the q_types tuple; passing requested int"
-                        )
-                        pass
-
-            if qtype == q_types.PTR and not query_all_types:
-                domain_list = [self._convert_to_reverse_format(x) for x in domain_list]
-
-            for domain in domain_list:
-                if query_all_types:
-                    if len(domain.split(".")) == 2:
-                        q_type_list = [
-                            x
-                            for x in q_types.__dir__()
-                            if not x.startswith("_")
-                            and x not in ["index", "count"]
-                            and x != "PTR"
-                        ]
-                    else:
-                        q_type_list = ["A", "AAAA", "CNAME", "TXT"]
+    async def get_queries(self, queries: List[DnsQuery]) -> List[Response]:
+        """
+        Get the responses of a list of queries, in the order of the queries; every query is sent through
+        query, so the limit on queries in flight of the resolver holds.
 
-                    for q_type in q_type_list:
-                        resources.append(
-                            f"dns-query?name={domain}&type={getattr(q_types, q_type)}"
-                        )
-                else:
-                    resources.append(f"dns-query?name={domain}&type={qtype}")
-        data = await self.a_call(self.methods.GET, resources=resources)
-        return data
+        Args:
+            queries: list of queries, e.g. from iter_queries
+
+        Returns:
+            List of `Response` objects
+        """
+        tasks = [asyncio.ensure_future(self.query(query)) for query in queries]
+
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
 
     async def get_reverse_lookups(self, ips: List[str]) -> List[Response]:
         """
@@ -140,9 +194,83 @@ class DOHRequester(HttpxBaseClass):
         Returns:
             List of `Response` objects
         """
-        resources = [
-            f"dns-query?name={self._convert_to_reverse_format(each)}&type=PTR"
-            for each in ips
-        ]
-        data = await self.a_call(self.methods.GET, resources=resources)
-        return data
+        return await self.get_bulk_domains({q_types.PTR: ips})
+
+
+class DOHRequester(DnsResolver, HttpxBaseClass):
+    def __init__(
+        self,
+        baseurl: str,
+        api_path: str = None,
+        proxies: dict = None,
+        user_agent: str = "Certex",
+        wire_format: bool = False,
+        **kwargs,
+    ):
+        """
+        Requester for DNS over HTTPS resolvers.
+
+        By default the dns-json api is used; with wire_format queries are POSTed as RFC 8484
+        application/dns-message, which every DoH resolver supports and which is smaller to send and
+        faster to parse (see nldcsc.plugins.doh.wire).
+        """
+        super().__init__(
+            baseurl=baseurl,
+            api_path=api_path,
+            proxies=proxies,
+            user_agent=user_agent,
+            **kwargs,
+        )
+
+        self.wire_format = wire_format
+
+        self.clear_headers()
+        self.set_header_field(
+            "accept", DNS_MESSAGE if wire_format else "application/dns-json"
+        )
+
+        self._slots: asyncio.Semaphore | None = None
+        self._slots_loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        """
+        Semaphore limiting the queries in flight towards this resolver to max_concurrency, shared by all
+        resolve calls on the running event loop
+        """
+        loop = asyncio.get_running_loop()
+
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(max(self.max_concurrency, 1))
+            self._slots_loop = loop
+
+        return self._slots
+
+    @staticmethod
+    def _resource(query: DnsQuery) -> str:
+        return f"dns-query?name={query.name}&type={query.type}"
+
+    async def query(self, query: DnsQuery, timeout: float = 10) -> Response:
+        """
+        Resolve a single query, waiting for a free slot of this resolver.
+
+        Args:
+            query: the query.
+            timeout: seconds the request may take.
+
+        Returns:
+            `Response` object
+        """
+        async with self.slots:
+            if self.wire_format:
+                return await self.a_call(
+                    self.methods.POST,
+                    resources="dns-query",
+                    content=encode_query(query.name, query.type),
+                    headers={**self.myheaders, "content-type": DNS_MESSAGE},
+                    timeout=timeout,
+                )
+
+            return await self.a_call(
+                self.methods.GET, resources=self._resource(query), timeout=timeout
+            )
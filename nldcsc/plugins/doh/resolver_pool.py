@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import List
+
+from httpx import Response
+
+from nldcsc.generic.utils import getenv_bool, getenv_list
+from nldcsc.loggers.app_logger import AppLogger
+from nldcsc.plugins.doh.doh_requester import DnsQuery, DnsResolver, DOHRequester
+
+logging.setLoggerClass(AppLogger)
+
+
+class PooledResolver(object):
+    def __init__(
+        self,
+        requester: DOHRequester,
+        weight: float = 1,
+        max_failures: int = 3,
+        cooldown: float = 30,
+        alpha: float = 0.2,
+    ):
+        """
+        Resolver of a pool with its health; latency and error rate are tracked as exponentially weighted
+        moving averages. After max_failures consecutive failures the resolver is skipped for cooldown
+        seconds, after which it gets a new chance.
+
+        Args:
+            requester: the resolver.
+            weight: relative share of the queries the resolver gets when healthy.
+            max_failures: consecutive failures before the resolver is skipped.
+            cooldown: seconds a failing resolver is skipped.
+            alpha: weight of a new sample in the moving averages.
+        """
+        self.requester = requester
+        self.weight = weight
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.alpha = alpha
+
+        self.latency = 0.1
+        self.error_rate = 0.0
+        self.failures = 0
+        self.down_until = 0.0
+
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @property
+    def name(self) -> str:
+        return self.requester.baseurl
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    @property
+    def score(self) -> float:
+        """
+        Higher is better; the weight lowered by latency and error rate
+        """
+        return self.weight / (self.latency * (1 + 10 * self.error_rate))
+
+    def record(self, latency: float, ok: bool):
+        self.requests += 1
+        self.latency += self.alpha * (latency - self.latency)
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+
+        if ok:
+            self.failures = 0
+            return
+
+        self.errors += 1
+        self.failures += 1
+
+        if self.failures >= self.max_failures:
+            self.down_until = time.monotonic() + self.cooldown
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "latency": self.latency,
+            "error_rate": self.error_rate,
+            "healthy": self.healthy,
+        }
+
+
+class ResolverPool(DnsResolver):
+    def __init__(
+        self,
+        resolvers: List[DOHRequester | tuple[DOHRequester, float]],
+        hedge_after: float | None = 0.5,
+        attempts: int = 3,
+        max_concurrency: int = None,
+    ):
+        """
+        Spreads queries over several DoH resolvers.
+
+        Every query goes to a healthy resolver picked at random, weighted by its score (weight, latency
+        and error rate). Queries which fail (transport errors, 429 and 5xx responses) fail over to another
+        resolver; queries without response after hedge_after seconds are also sent to another resolver
+        and the first answer is used.
+
+        Args:
+            resolvers: resolvers, optionally with their weight.
+            hedge_after: seconds before a slow query is hedged; None disables hedging.
+            attempts: max amount of resolvers tried per query.
+            max_concurrency: queries in flight of resolve calls. Defaults to the sum of the resolvers.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.resolvers = [
+            PooledResolver(*r) if isinstance(r, tuple) else PooledResolver(r)
+            for r in resolvers
+        ]
+
+        if not self.resolvers:
+            raise ValueError("A resolver pool needs at least one resolver")
+
+        self.hedge_after = hedge_after
+        self.attempts = max(attempts, 1)
+        self.max_concurrency = max_concurrency or sum(
+            r.requester.max_concurrency for r in self.resolvers
+        )
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "ResolverPool":
+        """
+        Create a pool from the environment:
+
+        DOH_RESOLVERS: json list of resolver urls or objects with url, weight and wire_format keys
+        DOH_WIRE_FORMAT: use the wire format for all resolvers (default False)
+        DOH_HEDGE_AFTER: seconds before a slow query is hedged, 0 disables hedging (default 0.5)
+        DOH_ATTEMPTS: max amount of resolvers tried per query (default 3)
+        """
+        wire_format = getenv_bool("DOH_WIRE_FORMAT", "False")
+        resolvers = []
+
+        for resolver in getenv_list("DOH_RESOLVERS", ["https://1.1.1.1"]):
+            if isinstance(resolver, str):
+                resolver = {"url": resolver}
+
+            resolvers.append(
+                (
+                    DOHRequester(
+                        resolver["url"],
+                        wire_format=resolver.get("wire_format", wire_format),
+                        **kwargs,
+                    ),
+                    float(resolver.get("weight", 1)),
+                )
+            )
+
+        hedge_after = float(os.getenv("DOH_HEDGE_AFTER", "0.5"))
+
+        return cls(
+            resolvers,
+            hedge_after=hedge_after or None,
+            attempts=int(os.getenv("DOH_ATTEMPTS", "3")),
+        )
+
+    def pick(self, exclude: List[PooledResolver] = ()) -> PooledResolver | None:
+        """
+        Pick a resolver, weighted by score; unhealthy resolvers are only used when no healthy one is left
+        """
+        candidates = [r for r in self.resolvers if r not in exclude]
+
+        if not candidates:
+            return None
+
+        candidates = [r for r in candidates if r.healthy] or candidates
+
+        return random.choices(candidates, weights=[r.score for r in candidates])[0]
+
+    @staticmethod
+    async def _attempt(
+        resolver: PooledResolver, query: DnsQuery, timeout: float
+    ) -> tuple[Response | Exception, bool]:
+        began = time.monotonic()
+
+        try:
+            response = await resolver.requester.query(query, timeout)
+        except Exception as err:
+            resolver.record(time.monotonic() - began, False)
+            return err, False
+
+        ok = response.status_code < 500 and response.status_code != 429
+        resolver.record(time.monotonic() - began, ok)
+
+        return response, ok
+
+    async def query(self, query: DnsQuery, timeout: float = 10) -> Response:
+        tried: List[PooledResolver] = []
+        result: Response | Exception = None
+
+        while len(tried) < min(self.attempts, len(self.resolvers)):
+            primary = self.pick(tried)
+            tried.append(primary)
+
+            tasks = {
+                asyncio.ensure_future(self._attempt(primary, query, timeout)): primary
+            }
+            hedged = self.hedge_after is None
+
+            try:
+                while tasks:
+                    done, _ = await asyncio.wait(
+                        tasks,
+                        timeout=None if hedged else self.hedge_after,
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+
+                    if not done:
+                        hedged = True
+
+                        if len(tried) < self.attempts and (other := self.pick(tried)):
+                            tried.append(other)
+                            other.hedges += 1
+                            tasks[
+                                asyncio.ensure_future(
+                                    self._attempt(other, query, timeout)
+                                )
+                            ] = other
+
+                        continue
+
+                    for task in done:
+                        resolver = tasks.pop(task)
+                        result, ok = task.result()
+
+                        if ok:
+                            if resolver is not primary:
+                                resolver.hedge_wins += 1
+
+                            return result
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+            self.logger.debug(f"Query {query} failed on {tried[-1].name}: {result}")
+
+        if isinstance(result, Exception):
+            raise result
+
+        return result
+
+    @property
+    def stats(self) -> dict:
+        """
+        Stats per resolver
+        """
+        return {r.name: r.stats for r in self.resolvers}
+
+    async def aclose(self):
+        for r in self.resolvers:
+            await r.requester.aclose()
+
+    def close(self):
+        for r in self.resolvers:
+            r.requester.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    def __repr__(self):
+        return f"<< ResolverPool: {', '.join(r.name for r in self.resolvers)} >>"
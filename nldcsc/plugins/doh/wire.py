@@ -0,0 +1,192 @@
+import struct
+from ipaddress import IPv6Address
+
+DNS_MESSAGE = "application/dns-message"
+
+_HEADER = struct.Struct("!HHHHHH")
+_QUESTION = struct.Struct("!HH")
+_RECORD = struct.Struct("!HHIH")
+_SOA = struct.Struct("!IIIII")
+
+A, NS, CNAME, SOA, PTR, MX, TXT, AAAA = 1, 2, 5, 6, 12, 15, 16, 28
+NAME_TYPES = frozenset([NS, CNAME, PTR])
+
+
+class DnsMessageError(ValueError):
+    pass
+
+
+def encode_query(name: str, qtype: int, message_id: int = 0) -> bytes:
+    """
+    Encode a recursive query in the dns wire format (RFC 1035); the id defaults to 0 as RFC 8484 advises
+    for cache friendliness.
+
+    Args:
+        name: domain name.
+        qtype: query type.
+        message_id: id of the message.
+
+    Returns:
+        The query message
+    """
+    labels = [label.encode("idna") for label in name.rstrip(".").split(".") if label]
+
+    if any(len(label) > 63 for label in labels):
+        raise DnsMessageError(f"Label too long in {name}")
+
+    qname = b"".join(bytes([len(label)]) + label for label in labels) + b"\x00"
+
+    # flags: RD
+    return (
+        _HEADER.pack(message_id, 0x0100, 1, 0, 0, 0) + qname + _QUESTION.pack(qtype, 1)
+    )
+
+
+def _read_name(data: bytes, offset: int) -> tuple[str, int]:
+    """
+    Read a (compressed) name at offset.
+
+    Returns:
+        The name (without trailing dot) and the offset after it
+    """
+    labels = []
+    end = None
+    jumps = 0
+
+    while True:
+        try:
+            length = data[offset]
+        except IndexError:
+            raise DnsMessageError("Truncated name")
+
+        if length & 0xC0 == 0xC0:
+            if (jumps := jumps + 1) > 64:
+                raise DnsMessageError("Compression loop")
+
+            if end is None:
+                end = offset + 2
+
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+
+        offset += 1
+
+        if length == 0:
+            break
+
+        labels.append(
+            data[offset : offset + length].decode("ascii", "backslashreplace")
+        )
+        offset += length
+
+    return ".".join(labels), end if end is not None else offset
+
+
+def _txt(rdata: bytes) -> str:
+    strings, offset = [], 0
+
+    while offset < len(rdata):
+        length = rdata[offset]
+        text = rdata[offset + 1 : offset + 1 + length].decode("utf-8", "replace")
+        strings.append('"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"')
+        offset += 1 + length
+
+    return " ".join(strings)
+
+
+def _rdata(data: bytes, rtype: int, offset: int, length: int) -> str:
+    """
+    Presentation format of record data, like the dns-json api returns it
+    """
+    rdata = data[offset : offset + length]
+
+    if rtype == A and length == 4:
+        return "%d.%d.%d.%d" % tuple(rdata)
+
+    if rtype == AAAA and length == 16:
+        return str(IPv6Address(rdata))
+
+    if rtype in NAME_TYPES:
+        return _read_name(data, offset)[0] + "."
+
+    if rtype == MX:
+        return f"{struct.unpack_from('!H', data, offset)[0]} {_read_name(data, offset + 2)[0]}."
+
+    if rtype == TXT:
+        return _txt(rdata)
+
+    if rtype == SOA:
+        mname, position = _read_name(data, offset)
+        rname, position = _read_name(data, position)
+
+        return f"{mname}. {rname}. " + " ".join(
+            str(value) for value in _SOA.unpack_from(data, position)
+        )
+
+    # unknown types, RFC 3597
+    return f"\\# {length} {rdata.hex()}"
+
+
+def decode_message(data: bytes) -> dict:
+    """
+    Decode a dns wire format response into the structure of the dns-json api (Status, flags, Question,
+    Answer and Authority), so both formats are parsed the same way.
+
+    Args:
+        data: the response message.
+
+    Returns:
+        The decoded message
+    """
+    try:
+        _, flags, qdcount, ancount, nscount, _ = _HEADER.unpack_from(data)
+    except struct.error:
+        raise DnsMessageError("Truncated header")
+
+    message = {
+        "Status": flags & 0x000F,
+        "TC": bool(flags & 0x0200),
+        "RD": bool(flags & 0x0100),
+        "RA": bool(flags & 0x0080),
+        "AD": bool(flags & 0x0020),
+        "CD": bool(flags & 0x0010),
+        "Question": [],
+    }
+
+    offset = _HEADER.size
+
+    try:
+        for _ in range(qdcount):
+            name, offset = _read_name(data, offset)
+            qtype, _ = _QUESTION.unpack_from(data, offset)
+            offset += _QUESTION.size
+
+            message["Question"].append({"name": name, "type": qtype})
+
+        for section, count in (("Answer", ancount), ("Authority", nscount)):
+            records = []
+
+            for _ in range(count):
+                name, offset = _read_name(data, offset)
+                rtype, _, ttl, length = _RECORD.unpack_from(data, offset)
+                offset += _RECORD.size
+
+                if offset + length > len(data):
+                    raise DnsMessageError("Truncated record")
+
+                records.append(
+                    {
+                        "name": name,
+                        "type": rtype,
+                        "TTL": ttl,
+                        "data": _rdata(data, rtype, offset, length),
+                    }
+                )
+                offset += length
+
+            if records:
+                message[section] = records
+    except (struct.error, IndexError):
+        raise DnsMessageError("Truncated message")
+
+    return message
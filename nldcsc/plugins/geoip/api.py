@@ -1,18 +1,25 @@
 import asyncio
+import itertools
 import json
 import logging
 import os
-from typing import List
+import random
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterable, List
 
 import aiohttp
 from netaddr import IPAddress
 from netaddr.core import AddrFormatError
 
+from nldcsc.generic.tasks import iter_completed
 from nldcsc.http_apis.base_class.api_base_class import ApiBaseClass
+from nldcsc.http_apis.base_class.rate_limit import parse_retry_after
 from nldcsc.loggers.app_logger import AppLogger
 
 logging.setLoggerClass(AppLogger)
 
+MAX_RETRY_DELAY = 60
+
 
 class GeoIp(ApiBaseClass):
     def __init__(
@@ -21,8 +28,16 @@ class GeoIp(ApiBaseClass):
         api_path: str = "ipgeo",
         proxies: dict = None,
         user_agent: str = "Certex",
+        max_concurrency: int = 100,
         **kwargs,
     ):
+        """
+        Client of the ipgeolocation.io api.
+
+        Lookups of ip lists (get_geo_for_ip_list, fetch_all and iter_geo_for_ip_list) share a single
+        aiohttp connector and keep at most max_concurrency requests in flight; 429 responses are retried
+        up to rate_limit_retries times, after the Retry-After header or an exponential backoff.
+        """
         super().__init__(
             baseurl=baseurl,
             api_path=api_path,
@@ -32,6 +47,7 @@ class GeoIp(ApiBaseClass):
         )
 
         self.logger = logging.getLogger(self.__class__.__name__)
+        self.max_concurrency = max_concurrency
 
         enabled = os.getenv("IPGEOLOCATION_ENABLE", False)
         api_key = os.getenv("IPGEOLOCATION_API_KEY", None)
@@ -95,33 +111,69 @@ class GeoIp(ApiBaseClass):
             .replace("api.", "")
         )
 
-        with self.get_session() as session:
-            pic_bytes = session.get(image_url_resource).content
+        pic_bytes = self.session.get(image_url_resource).content
 
         return pic_bytes
 
     def get_geo_for_ip_list(self, ip_address_list):
         """
-        Method for retrieving a list with ip addresses
+        Method for retrieving a list with ip addresses; can be called from a running event loop, the
+        lookups then run on their own loop in a worker thread while the calling loop waits for them
 
         :param ip_address_list: List with ip addresses to retrieve geo info of
         :type ip_address_list: list
         :return: A list with dictionaries of Geo Ip Information
         :rtype: list
         """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.fetch_all(ip_address_list))
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(
+                asyncio.run, self.fetch_all(ip_address_list)
+            ).result()
+
+    def _ip_url(self, ip: str) -> str:
+        return self._build_url(
+            resource=f"?apiKey={self.api_key}&ip={ip}&fields=geo,isp,organization"
+        )
+
+    def _client_session(self, concurrency: int) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=concurrency, limit_per_host=concurrency, ttl_dns_cache=300
+        )
+
+        return aiohttp.ClientSession(connector=connector, headers=self.headers)
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        # exponential backoff with jitter, capped at a minute
+        return min(2**attempt, MAX_RETRY_DELAY) * random.uniform(0.5, 1.0)
 
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        results = loop.run_until_complete(self.fetch_all(ip_address_list, loop))
+    def _retry_delay(self, retry_after: str | None, attempt: int) -> float:
+        delay = parse_retry_after(retry_after)
 
-        return results
+        # a Retry-After is honoured up to the same minute the backoff is capped at
+        return self._backoff(attempt) if delay is None else min(delay, MAX_RETRY_DELAY)
 
     async def fetch(self, session, url):
+        data = None
+
         try:
-            async with session.get(url) as response:
-                data = await response.content.read()
-                data = json.loads(data)
-                return {data["ip"]: data}
+            for attempt in itertools.count():
+                async with session.get(url) as response:
+                    if response.status != 429 or attempt >= self.rate_limit_retries:
+                        data = await response.content.read()
+                        data = json.loads(data)
+                        return {data["ip"]: data}
+
+                    delay = self._retry_delay(
+                        response.headers.get("Retry-After"), attempt
+                    )
+
+                await asyncio.sleep(delay)
         except KeyError:
             if "message" in data:
                 self.logger.error(f"{data['message']}")
@@ -131,24 +183,55 @@ class GeoIp(ApiBaseClass):
             self.logger.exception(e)
             return {"ERROR": f"Error getting {url} data...."}
 
-    async def fetch_all(self, ips, loop):
-        sem = asyncio.Semaphore(100)
-        async with sem:
-            async with aiohttp.ClientSession(
-                loop=loop, headers=self.headers
-            ) as session:
-                results = await asyncio.gather(
-                    *[
-                        self.fetch(
-                            session,
-                            f"{self._build_url(resource=f'?apiKey={self.api_key}&ip={ip}&fields=geo,isp,organization')}",
-                        )
-                        for ip in ips
-                        if (self.is_valid_ip(ip))
-                    ],
-                    return_exceptions=True,
-                )
-                return results
+    async def fetch_all(self, ips, loop=None):
+        """
+        Method for retrieving a list with ip addresses, with at most max_concurrency requests in flight
+
+        :param ips: List with ip addresses to retrieve geo info of
+        :type ips: list
+        :param loop: unused, kept for backwards compatibility
+        :return: A list with dictionaries of Geo Ip Information (or exceptions) in the order of the ips
+        :rtype: list
+        """
+        sem = asyncio.Semaphore(max(self.max_concurrency, 1))
+
+        async def bounded_fetch(session, url):
+            async with sem:
+                return await self.fetch(session, url)
+
+        async with self._client_session(self.max_concurrency) as session:
+            return await asyncio.gather(
+                *[
+                    bounded_fetch(session, self._ip_url(ip))
+                    for ip in ips
+                    if (self.is_valid_ip(ip))
+                ],
+                return_exceptions=True,
+            )
+
+    async def iter_geo_for_ip_list(
+        self, ips: Iterable[str], concurrency: int = None
+    ) -> AsyncIterator[dict | Exception]:
+        """
+        Method for retrieving a (large) iterable of ip addresses, yielding the results as they complete;
+        ips are taken from the iterable as requests finish, so it is never materialised
+
+        :param ips: ip addresses to retrieve geo info of; invalid ones are skipped
+        :type ips: Iterable[str]
+        :param concurrency: requests in flight, defaults to max_concurrency
+        :type concurrency: int
+        :return: Async iterator of Geo Ip Information (or exceptions) in order of completion
+        :rtype: AsyncIterator[dict]
+        """
+        concurrency = max(concurrency or self.max_concurrency, 1)
+
+        async with self._client_session(concurrency) as session:
+            async for _, result in iter_completed(
+                (ip for ip in ips if self.is_valid_ip(ip)),
+                lambda ip: self.fetch(session, self._ip_url(ip)),
+                concurrency,
+            ):
+                yield result
 
 
 class TooManyIPAddressesException(Exception):
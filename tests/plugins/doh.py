@@ -1,8 +1,112 @@
-from nldcsc.plugins.doh.doh_parser import DohParser
+import asyncio
+import json
+import struct
+
+import httpx
+import pytest
+
+from nldcsc.plugins.doh.dns_cache import DnsCache, age_ttls, answer_ttl
+from nldcsc.plugins.doh.doh_parser import DohParser, Request, reverse_pointer_ip
+from nldcsc.plugins.doh.wire import DNS_MESSAGE, decode_message, encode_query
+from nldcsc.plugins.doh.doh_requester import (
+    DnsQuery,
+    DnsResolver,
+    DOHRequester,
+    q_types,
+)
+from nldcsc.plugins.doh.resolver_pool import ResolverPool
+
+
+class DnsHandler:
+    def __init__(
+        self, delay: float = 0, fail: set[str] = (), delays: dict[str, float] = None
+    ):
+        self.delay = delay
+        self.delays = delays or {}
+        self.fail = set(fail)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.queries: list[tuple[str, int]] = []
+
+    async def __call__(self, request: httpx.Request):
+        name = request.url.params["name"]
+        qtype = int(request.url.params["type"])
+        self.queries.append((name, qtype))
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        try:
+            await asyncio.sleep(self.delays.get(name, self.delay))
+        finally:
+            self.in_flight -= 1
+
+        if name in self.fail:
+            raise httpx.ConnectError("refused", request=request)
+
+        return httpx.Response(
+            200,
+            json={
+                "Status": 0,
+                "TC": False,
+                "RD": True,
+                "RA": True,
+                "AD": False,
+                "CD": False,
+                "Question": [{"name": name, "type": qtype}],
+                "Answer": [
+                    {"name": name, "type": qtype, "TTL": 300, "data": "192.0.2.1"}
+                ],
+            },
+        )
+
+
+def wire_response(query: bytes, status: int = 0) -> bytes:
+    """
+    Build a response to a wire format query; A and AAAA records for NOERROR, a SOA record for NXDOMAIN.
+    """
+    message_id, _, _, _, _, _ = struct.unpack_from("!HHHHHH", query)
+    question = query[12:]
+    # pointer to the question name
+    name = b"\xc0\x0c"
+
+    if status == 0:
+        records = [
+            name + struct.pack("!HHIH", 1, 1, 300, 4) + bytes([192, 0, 2, 1]),
+            name
+            + struct.pack("!HHIH", 28, 1, 60, 16)
+            + bytes.fromhex("20010db8000000000000000000000001"),
+            name + struct.pack("!HHIH", 16, 1, 60, 6) + b"\x05hello",
+        ]
+        counts = (len(records), 0)
+    else:
+        soa = b"\x02ns\xc0\x0c\x04host\xc0\x0c" + struct.pack(
+            "!IIIII", 1, 7200, 900, 1209600, 300
+        )
+        records = [name + struct.pack("!HHIH", 6, 1, 900, len(soa)) + soa]
+        counts = (0, 1)
+
+    return (
+        struct.pack("!HHHHHH", message_id, 0x8180 | status, 1, *counts, 0)
+        + question
+        + b"".join(records)
+    )
+
+
+class MockedDOHRequester(DOHRequester):
+    def __init__(self, handler, baseurl: str = "https://1.1.1.1", **kwargs):
+        super().__init__(baseurl, retry_policy=None, **kwargs)
+        self.handler = handler
+
+    def create_async_client(self, **kwargs):
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler), **kwargs)
 
 
 class DOHTest:
     def test_doh_request_init(self):
+        with pytest.raises(TypeError):
+            DnsResolver()
+
         dp = DohParser()
         assert dp.doh_requester.baseurl == "https://1.1.1.1"
         assert dp.doh_requester.user_agent == "Certex"
@@ -11,3 +115,351 @@ class DOHTest:
         dp = DohParser()
         reversed_format = dp.doh_requester._convert_to_reverse_format("66.102.1.113")
         assert reversed_format == "113.1.102.66.in-addr.arpa"
+
+    def test_request_records(self):
+        data = {
+            "Status": 3,
+            "TC": False,
+            "RD": True,
+            "RA": True,
+            "AD": False,
+            "CD": False,
+            "Question": [
+                {
+                    "name": "1.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.8.b.d.0.1.0.0.2.ip6.arpa",
+                    "type": 12,
+                }
+            ],
+            "Authority": [
+                {"name": "arpa", "type": 6, "TTL": 60, "data": "a. b. 1 2 3 4 5"}
+            ],
+        }
+        request = Request.from_dict(data)
+
+        assert request.s_status == "NXDOMAIN"
+        assert request.Question[0].s_type == "PTR"
+        assert request.Question[0].original_ip == "2001:db8::1"
+        assert request.to_dict() == {
+            **data,
+            "Question": [{**data["Question"][0], "original_ip": "2001:db8::1"}],
+        }
+        assert reverse_pointer_ip("1.2.0.192.in-addr.arpa") == "192.0.2.1"
+        assert reverse_pointer_ip("8.b.d.0.1.0.0.2.ip6.arpa") is None
+
+    def test_iter_queries(self):
+        requester = DOHRequester("https://1.1.1.1")
+
+        queries = list(
+            requester.iter_queries(
+                {"A": ["a.example.com"], "PTR": ["192.0.2.1"], "*": ["example.com"] * 2}
+            )
+        )
+
+        assert queries[:2] == [
+            DnsQuery("a.example.com", q_types.A),
+            DnsQuery("1.2.0.192.in-addr.arpa", q_types.PTR),
+        ]
+        # every type but PTR once for the apex domain
+        assert len(queries[2:]) == len(q_types) - 1
+
+    def test_resolve_stream(self):
+        handler = DnsHandler(delay=0.01, fail={"bad.example.com"})
+        names = [f"{i}.example.com" for i in range(50)] + ["bad.example.com"]
+
+        async def queries():
+            for name in names:
+                yield DnsQuery(name, q_types.A)
+
+        async def run():
+            async with MockedDOHRequester(handler, max_concurrency=8) as requester:
+                return [
+                    result
+                    async for result in requester.resolve(queries(), concurrency=20)
+                ]
+
+        results = asyncio.run(run())
+
+        assert sorted(query.name for query, _ in results) == sorted(names)
+        # limited by the max_concurrency of the resolver
+        assert 1 < handler.max_in_flight <= 8
+
+        errors = [query.name for query, r in results if isinstance(r, Exception)]
+        assert errors == ["bad.example.com"]
+
+    def test_bulk_queries_use_slots(self):
+        handler = DnsHandler(delay=0.01)
+        names = [f"{i}.example.com" for i in range(20)]
+
+        async def run():
+            async with MockedDOHRequester(handler, max_concurrency=3) as requester:
+                # concurrent calls share the slots of the resolver
+                return await asyncio.gather(
+                    requester.get_bulk_domains({"A": names}),
+                    requester.get_bulk_domains({"A": names[::-1]}),
+                )
+
+        responses, reversed_responses = asyncio.run(run())
+
+        assert [r.json()["Question"][0]["name"] for r in responses] == names
+        assert [r.json()["Question"][0]["name"] for r in reversed_responses] == (
+            names[::-1]
+        )
+        assert 1 < handler.max_in_flight <= 3
+
+    def test_pipelined_requests(self):
+        handler = DnsHandler(delay=0.01)
+
+        async def run(parser: DohParser, **kwargs):
+            parser.doh_requester = MockedDOHRequester(handler)
+
+            async with parser.doh_requester:
+                if kwargs:
+                    return [
+                        stage
+                        async for stage, _ in parser.stream_requests(
+                            {"A": ["a.example.com", "b.example.com", "c.example.com"]},
+                            **kwargs,
+                        )
+                    ]
+
+                return await parser.request_and_parse(
+                    {"A": ["a.example.com", "b.example.com"]}
+                )
+
+        # the reverse lookup of the first answer is sent before the next forward lookup
+        stages = asyncio.run(run(DohParser(), concurrency=1))
+
+        assert stages == ["forward", "reverse", "forward", "forward"]
+        assert handler.queries[1] == ("1.2.0.192.in-addr.arpa", q_types.PTR)
+
+        result = asyncio.run(run(DohParser()))
+
+        assert len(result["forward_requests"]) == 2
+        assert [r["Question"][0]["name"] for r in result["reverse_requests"]] == [
+            "1.2.0.192.in-addr.arpa"
+        ]
+
+    def test_requests_in_workload_order(self):
+        names = [f"{i}.example.com" for i in range(5)]
+        # the last names complete first
+        handler = DnsHandler(delays={n: 0.01 * (5 - i) for i, n in enumerate(names)})
+
+        async def run(parser: DohParser):
+            parser.doh_requester = MockedDOHRequester(handler)
+
+            async with parser.doh_requester:
+                streamed = [
+                    request.Question[0].name
+                    async for stage, request in parser.stream_requests(
+                        {"A": names}, reverse=False
+                    )
+                ]
+
+                return streamed, await parser.request_and_parse({"A": names})
+
+        streamed, result = asyncio.run(run(DohParser()))
+
+        assert streamed == names[::-1]
+        assert [r["Question"][0]["name"] for r in result["forward_requests"]] == names
+        assert len(result["reverse_requests"]) == 1
+
+    def test_answer_ttl(self):
+        soa = {
+            "name": "example.com",
+            "type": 6,
+            "TTL": 900,
+            "data": "ns.example.com. host.example.com. 1 7200 900 1209600 300",
+        }
+
+        assert answer_ttl({"Status": 0, "Answer": [{"TTL": 60}, {"TTL": 30}]}) == 30
+        # negative answers use the minimum of the SOA record
+        assert answer_ttl({"Status": 3, "Authority": [soa]}) == 300
+        assert answer_ttl({"Status": 0, "Authority": [soa]}) == 300
+        assert answer_ttl({"Status": 3}, default_negative_ttl=5) == 5
+        assert answer_ttl({"Status": 2, "Authority": [soa]}) is None
+
+    def test_cached_requests(self):
+        class Redis:
+            def __init__(self):
+                self.data = {}
+
+            def mget(self, keys):
+                return [self.data.get(key) for key in keys]
+
+            async def set(self, key, value, ex=None):
+                self.data[key] = value
+
+        handler = DnsHandler()
+        now = [1000.0]
+        redis_client = Redis()
+
+        async def run(parser: DohParser, names: list[str]):
+            parser.doh_requester = MockedDOHRequester(handler)
+
+            async with parser.doh_requester:
+                return await parser.make_requests({"A": names})
+
+        parser = DohParser(DnsCache(redis_client=redis_client, clock=lambda: now[0]))
+
+        asyncio.run(run(parser, ["a.example.com", "b.example.com"]))
+        responses = asyncio.run(run(parser, ["A.example.com", "c.example.com"]))
+
+        assert [name for name, _ in handler.queries] == [
+            "a.example.com",
+            "b.example.com",
+            "c.example.com",
+        ]
+        assert responses[0].extensions["from_cache"]
+        assert parser.cache.stats["hit_ratio"] == 0.25
+
+        # a new worker shares the redis tier; entries expire with the TTL of the answer
+        other = DohParser(DnsCache(redis_client=redis_client, clock=lambda: now[0]))
+        asyncio.run(run(other, ["b.example.com"]))
+        assert other.cache.stats["redis_hits"] == 1
+
+        # cached answers count down their TTL, in memory and from redis
+        now[0] += 100
+        fresh = DohParser(DnsCache(redis_client=redis_client, clock=lambda: now[0]))
+
+        for cached in (parser, fresh):
+            (response,) = asyncio.run(run(cached, ["a.example.com"]))
+            assert response.extensions["from_cache"]
+            assert response.json()["Answer"][0]["TTL"] == 200
+
+        now[0] += 200
+        asyncio.run(run(parser, ["a.example.com"]))
+        assert handler.queries[-1] == ("a.example.com", q_types.A)
+
+        # with a floor of 0
+        aged = age_ttls(
+            b'{"Answer": [{"TTL": 60}, {"TTL": 600}], "Authority": [{"TTL": 900}]}', 100
+        )
+        assert json.loads(aged) == {
+            "Answer": [{"TTL": 0}, {"TTL": 500}],
+            "Authority": [{"TTL": 800}],
+        }
+        assert age_ttls(b"not json", 100) == b"not json"
+
+    def test_wire_format(self):
+        query = encode_query("example.com", q_types.A)
+
+        assert query == (
+            b"\x00\x00\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+            b"\x07example\x03com\x00\x00\x01\x00\x01"
+        )
+
+        message = decode_message(wire_response(query))
+
+        assert message["Status"] == 0 and message["RA"] and not message["TC"]
+        assert message["Question"] == [{"name": "example.com", "type": 1}]
+        assert [(a["type"], a["TTL"], a["data"]) for a in message["Answer"]] == [
+            (1, 300, "192.0.2.1"),
+            (28, 60, "2001:db8::1"),
+            (16, 60, '"hello"'),
+        ]
+
+        message = decode_message(wire_response(query, status=3))
+
+        assert message["Authority"][0]["data"] == (
+            "ns.example.com. host.example.com. 1 7200 900 1209600 300"
+        )
+        assert answer_ttl(message) == 300
+
+    def test_wire_format_requests(self):
+        def handler(request: httpx.Request):
+            assert request.method == "POST"
+            assert request.headers["content-type"] == DNS_MESSAGE
+
+            name = decode_message(request.content)["Question"][0]["name"]
+
+            return httpx.Response(
+                200,
+                content=wire_response(
+                    request.content, 3 if name.startswith("nx") else 0
+                ),
+                headers={"content-type": DNS_MESSAGE},
+            )
+
+        async def run(parser: DohParser):
+            parser.doh_requester = MockedDOHRequester(handler, wire_format=True)
+
+            async with parser.doh_requester:
+                return parser.parse_responses(
+                    await parser.make_requests(
+                        {"A": ["a.example.com", "nx.example.com"]}
+                    )
+                )
+
+        parser = DohParser(DnsCache())
+        requests = asyncio.run(run(parser))
+
+        assert [r.reverse_data_lookups for r in requests] == [
+            ["192.0.2.1", "2001:db8::1"],
+            [],
+        ]
+        assert requests[1].s_status == "NXDOMAIN"
+
+        # served from the cache, which stores wire responses as dns-json
+        assert [r.to_dict() for r in asyncio.run(run(parser))] == [
+            r.to_dict() for r in requests
+        ]
+        assert parser.cache.stats["memory_hits"] == 2
+
+    def test_resolver_pool_failover_and_hedging(self):
+        healthy = DnsHandler()
+        slow = DnsHandler(delay=0.5)
+
+        def failing(request: httpx.Request):
+            return httpx.Response(503)
+
+        async def run(pool: ResolverPool, names: list[str]):
+            async with pool:
+                return await pool.get_queries([DnsQuery(n, q_types.A) for n in names])
+
+        pool = ResolverPool(
+            [
+                (MockedDOHRequester(failing, "https://failing"), 10),
+                MockedDOHRequester(healthy, "https://healthy"),
+            ],
+            hedge_after=None,
+        )
+        responses = asyncio.run(run(pool, [f"{i}.example.com" for i in range(20)]))
+
+        assert all(r.status_code == 200 for r in responses)
+        assert len(healthy.queries) == 20
+
+        stats = pool.stats
+        # taken out of rotation after 3 consecutive failures
+        assert stats["https://failing"]["errors"] >= 3
+        assert not stats["https://failing"]["healthy"]
+
+        pool = ResolverPool(
+            [
+                (MockedDOHRequester(slow, "https://slow"), 1e9),
+                MockedDOHRequester(healthy, "https://healthy"),
+            ],
+            hedge_after=0.01,
+        )
+        responses = asyncio.run(run(pool, ["hedged.example.com"]))
+
+        assert responses[0].status_code == 200
+        assert pool.stats["https://healthy"]["hedge_wins"] == 1
+
+    def test_resolver_pool_from_env(self, monkeypatch):
+        monkeypatch.setenv(
+            "DOH_RESOLVERS",
+            '["https://1.1.1.1", {"url": "https://dns.google", "weight": 2, "wire_format": true}]',
+        )
+        monkeypatch.setenv("DOH_HEDGE_AFTER", "0")
+
+        dp = DohParser()
+
+        assert isinstance(dp.doh_requester, ResolverPool)
+        assert dp.doh_requester.hedge_after is None
+        assert [
+            (r.name, r.weight, r.requester.wire_format)
+            for r in dp.doh_requester.resolvers
+        ] == [
+            ("https://1.1.1.1", 1, False),
+            ("https://dns.google", 2, True),
+        ]
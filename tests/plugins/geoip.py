@@ -1,4 +1,9 @@
+import asyncio
 import os
+import threading
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 
 from nldcsc.plugins.geoip.api import GeoIp
 
@@ -12,6 +17,78 @@ class GeoIpTest:
         assert all(gi.is_valid_ip(ip) for ip in valid_ips) == True
         assert all(not gi.is_valid_ip(ip) for ip in invalid_ips) == True
 
+    def test_retry_delay(self):
+        os.environ["IPGEOLOCATION_ENABLE"] = "True"
+        os.environ["IPGEOLOCATION_API_KEY"] = "tests"
+        gi = GeoIp()
+
+        assert gi._retry_delay("5", 0) == 5
+        # clamped like the backoff
+        assert gi._retry_delay("3600", 0) == 60
+        assert 30 <= gi._retry_delay(None, 10) <= 60
+
+    def test_bulk_lookups(self):
+        os.environ["IPGEOLOCATION_ENABLE"] = "True"
+        os.environ["IPGEOLOCATION_API_KEY"] = "tests"
+
+        state = {"in_flight": 0, "max_in_flight": 0, "limited": set()}
+
+        async def handler(request: web.Request):
+            ip = request.query["ip"]
+
+            # every ip is rate limited once
+            if ip not in state["limited"]:
+                state["limited"].add(ip)
+                return web.json_response(
+                    {"message": "slow down"}, status=429, headers={"Retry-After": "0"}
+                )
+
+            state["in_flight"] += 1
+            state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+
+            try:
+                await asyncio.sleep(0.005)
+            finally:
+                state["in_flight"] -= 1
+
+            return web.json_response({"ip": ip, "country_code2": "NL"})
+
+        ips = [f"192.0.2.{i}" for i in range(20)] + ["no ip"]
+
+        # the server runs on its own loop, as a blocking call from a running loop would stall it
+        loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_get("/ipgeo/", handler)
+        server = TestServer(app, loop=loop)
+        loop.run_until_complete(server.start_server())
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+
+        async def from_running_loop(gi: GeoIp):
+            return gi.get_geo_for_ip_list(ips)
+
+        async def stream(gi: GeoIp):
+            return [r async for r in gi.iter_geo_for_ip_list(iter(ips))]
+
+        try:
+            gi = GeoIp(baseurl=str(server.make_url("")).rstrip("/"), max_concurrency=4)
+
+            streamed = asyncio.run(stream(gi))
+            state["limited"].clear()
+            listed = gi.get_geo_for_ip_list(ips)
+            state["limited"].clear()
+            from_loop = asyncio.run(from_running_loop(gi))
+        finally:
+            asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+        assert sorted(ip for r in streamed for ip in r) == sorted(ips[:-1])
+        assert [next(iter(r)) for r in listed] == ips[:-1]
+        assert from_loop == listed
+        assert state["max_in_flight"] <= 4
+
 
 # TEST DATA
 
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import re
 from collections import namedtuple
@@ -6,6 +7,7 @@ from json import JSONDecodeError
 
 import pytest
 
+from nldcsc.generic.tasks import iter_completed
 from nldcsc.generic.times import (
     timestampTOcalendarattrs,
     timestampTOdatestring,
@@ -25,6 +27,7 @@ from nldcsc.generic.utils import (
     getenv_choice,
     getenv_str,
     reverse_from_named_tuple,
+    reverse_index,
     _true_set,
     _false_set,
     __MANDATORY_VALUE__,
@@ -216,6 +219,17 @@ class TestGenericUtils:
         assert reverse_from_named_tuple(test_tuple, "2") == "C"
         assert reverse_from_named_tuple(test_tuple, "3") == "D"
 
+    def test_reverse_index(self):
+        test_tuple = namedtuple("test_tuple", ("A", "B"))(0, 1)
+        other_tuple = namedtuple("other_tuple", ("C", "D"))(0, 1)
+
+        assert reverse_index(test_tuple) == {0: "A", 1: "B"}
+        assert reverse_index(test_tuple, lowercase_output=True) == {0: "a", 1: "b"}
+        # built once per namedtuple; equal values of another namedtuple don't share it
+        assert reverse_index(test_tuple) is reverse_index(test_tuple)
+        assert reverse_index(other_tuple) == {0: "C", 1: "D"}
+        assert reverse_from_named_tuple(other_tuple, 1, lowercase_output=True) == "d"
+
     def test_reverse_from_named_tuple_missing(self):
         test_tuple = namedtuple("test_tuple", ("A", "B"))(0, 1)
 
@@ -226,6 +240,84 @@ class TestGenericUtils:
             reverse_from_named_tuple(test_tuple, 3)
 
 
+class TestGenericTasks:
+    def test_iter_completed(self):
+        active = 0
+        peak = 0
+
+        async def work(item: int) -> int:
+            nonlocal active, peak
+
+            active += 1
+            peak = max(peak, active)
+
+            try:
+                await asyncio.sleep(0.001 * (10 - item))
+
+                if item == 3:
+                    raise ValueError(item)
+
+                return item * 2
+            finally:
+                active -= 1
+
+        async def run():
+            return [r async for r in iter_completed(range(10), work, concurrency=4)]
+
+        results = dict(asyncio.run(run()))
+
+        assert peak == 4
+        assert isinstance(results.pop(3), ValueError)
+        assert results == {i: i * 2 for i in range(10) if i != 3}
+
+    def test_iter_completed_fed_from_results(self):
+        async def work(item: int) -> int:
+            await asyncio.sleep(0)
+            return item
+
+        async def run():
+            queue = asyncio.Queue()
+            queue.put_nowait(0)
+
+            async def feed():
+                while (item := await queue.get()) is not None:
+                    yield item
+
+            seen = []
+
+            # the source waits for the results, which are yielded meanwhile
+            async for item, _ in iter_completed(feed(), work, concurrency=2):
+                seen.append(item)
+                queue.put_nowait(item + 1 if item < 5 else None)
+
+            return seen
+
+        assert asyncio.run(run()) == list(range(6))
+
+    def test_iter_completed_close(self):
+        cancelled = []
+
+        async def work(item: float) -> float:
+            try:
+                await asyncio.sleep(item)
+            except asyncio.CancelledError:
+                cancelled.append(item)
+                raise
+
+            return item
+
+        async def run():
+            results = iter_completed([0.01, 10, 10], work, concurrency=3)
+
+            assert await anext(results) == (0.01, 0.01)
+
+            await results.aclose()
+
+        asyncio.run(run())
+
+        assert cancelled == [10, 10]
+
+
 class TestGenericTimes:
     def test_timestringTOtimestamp(self):
         times = (
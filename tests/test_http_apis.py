@@ -1,8 +1,25 @@
+import asyncio
+import hashlib
+import io
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
 import pytest
 import requests
 import requests_mock
+from requests_cache import DO_NOT_CACHE
 
-from nldcsc.http_apis.base_class.api_base_class import ApiBaseClass
+from nldcsc.http_apis.base_class.api_base_class import ApiBaseClass, HostSlots
+from nldcsc.http_apis.base_class.cached_base_class import CachedAPI
+from nldcsc.http_apis.base_class.json_stream import iter_json_array
+from nldcsc.http_apis.base_class.rate_limit import MemoryRateLimiter, RateLimiter
+from nldcsc.http_apis.confluence.client import ConfluenceClient
+from nldcsc.http_apis.nexpose.async_client import AsyncNexposeClient
+from nldcsc.http_apis.nexpose.client import NexposeClient
 
 
 class HttpApi(ApiBaseClass):
@@ -242,3 +259,586 @@ class TestHttpApis:
 
             with pytest.raises(TypeError):
                 http_api.post_unserializable_data_dummy()
+
+    def test_session_reuse(self):
+        with HttpApi(baseurl="http://localhost:8000", pool_maxsize=4) as api:
+            with requests_mock.Mocker() as m:
+                m.get("http://localhost:8000/dummy", json={"data": "data"})
+
+                api.get_dummy_endpoint()
+                session = api.session
+                api.get_dummy_endpoint()
+
+                assert api.session is session
+                assert (
+                    session.get_adapter("http://").poolmanager.connection_pool_kw[
+                        "maxsize"
+                    ]
+                    == 4
+                )
+                assert "pool_maxsize" not in api.kwargs
+
+        assert api._sessions == []
+
+    def test_session_per_thread(self):
+        with HttpApi(baseurl="http://localhost:8000") as api:
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                barrier = threading.Barrier(2)
+
+                def session():
+                    # both threads hold their session at the same time
+                    barrier.wait()
+                    return api.session
+
+                sessions = list(pool.map(lambda _: session(), range(2)))
+
+            assert sessions[0] is not sessions[1]
+            assert api.session not in sessions
+            assert len(api._sessions) == 3
+            # one adapter, so one set of connection pools
+            assert {id(s.get_adapter("http://")) for s in api._sessions} == {
+                id(api.session.get_adapter("http://"))
+            }
+
+        assert api._sessions == []
+        # a partially initialised instance is collected without errors
+        HttpApi.__new__(HttpApi).__del__()
+
+    def test_rate_limiter(self):
+        with pytest.raises(TypeError):
+            RateLimiter(1)
+
+        now = [0.0]
+        limiter = MemoryRateLimiter(rate=2, capacity=2, clock=lambda: now[0])
+
+        assert limiter.acquire("host", sleep=lambda s: None) == 0
+        assert limiter.acquire("host", sleep=lambda s: None) == 0
+        assert limiter.acquire("host", sleep=lambda s: None) == 0.5
+
+        now[0] = 10.0
+        limiter.block("host", 5)
+
+        assert limiter.acquire("host", sleep=lambda s: None) == 5.5
+        assert limiter.acquire("other", sleep=lambda s: None) == 0
+
+        with HttpApi(
+            baseurl="http://localhost:8000", rate_limiter=MemoryRateLimiter(1000)
+        ) as api:
+            with requests_mock.Mocker() as m:
+                m.get(
+                    "http://localhost:8000/dummy",
+                    [
+                        {"status_code": 429, "headers": {"Retry-After": "0"}},
+                        {
+                            "json": {"data": "data"},
+                            "headers": {
+                                "X-RateLimit-Remaining": "10",
+                                "X-RateLimit-Reset": "20",
+                            },
+                        },
+                    ],
+                )
+
+                assert api.get_dummy_endpoint() == {"data": "data"}
+                assert m.call_count == 2
+                assert api.rate_limiter.buckets["localhost:8000"].rate == 0.5
+
+    def test_transfers(self, http_api, tmp_path):
+        content = b"x" * 150000
+
+        with requests_mock.Mocker() as m:
+            m.get(
+                "http://localhost:8000/file",
+                content=content,
+                headers={"Content-Length": str(len(content))},
+            )
+
+            progress = []
+            result = http_api.download_to(
+                "file",
+                tmp_path / "file",
+                chunk_size=65536,
+                progress=lambda done, total: progress.append((done, total)),
+            )
+
+            assert (tmp_path / "file").read_bytes() == content
+            assert result.digests["sha256"] == hashlib.sha256(content).hexdigest()
+            assert progress[-1] == (150000, 150000) and len(progress) == 3
+
+            def echo(request, context):
+                body = request.body
+                if hasattr(body, "read"):
+                    body = body.read()
+                elif not isinstance(body, bytes):
+                    body = b"".join(body)
+
+                return json.dumps(
+                    {"size": len(body), "type": request.headers["Content-Type"]}
+                )
+
+            m.post("http://localhost:8000/upload", text=echo)
+
+            result = http_api.upload_stream("upload", tmp_path / "file")
+
+            # paths and file objects are both sent as raw body without a filename
+            assert result.result == {"size": 150000, "type": "application/octet-stream"}
+            assert result.digests["sha256"] == hashlib.sha256(content).hexdigest()
+
+            result = http_api.upload_stream("upload", io.BytesIO(b"data"))
+
+            assert result.result == {"size": 4, "type": "application/octet-stream"}
+
+            with open(tmp_path / "file", "rb") as f:
+                for body in (tmp_path / "file", f):
+                    result = http_api.upload_stream("upload", body, filename="file")
+
+                    assert result.size == 150000
+                    assert result.result["type"].startswith("multipart/form-data")
+
+            result = http_api.upload_stream("upload", iter([b"da", b"ta"]))
+
+            assert result.size == result.result["size"] == 4
+
+            with pytest.raises(TypeError):
+                http_api.upload_stream("upload", iter([b"data"]), filename="data")
+
+            http_api.call(
+                http_api.methods.POST,
+                "upload",
+                data={"field": "value"},
+                files={"file": ("name", b"data")},
+            )
+
+            assert b'name="field"' in m.last_request.body
+            assert m.last_request.headers["Content-Type"].startswith(
+                "multipart/form-data"
+            )
+
+    def test_call_batch(self, http_api):
+        def handler(request, context):
+            if request.qs["id"] == ["3"]:
+                context.status_code = 404
+
+            return json.dumps({"id": int(request.qs["id"][0])})
+
+        with requests_mock.Mocker() as m:
+            m.get("http://localhost:8000/dummy", text=handler)
+
+            results = http_api.call_batch(
+                [
+                    {"method": "GET", "resource": "dummy", "data": {"id": i}}
+                    for i in range(6)
+                ]
+                + [lambda: http_api.get_dummy_endpoint_url_param({"id": 6})],
+                concurrency=4,
+                per_host=2,
+            )
+
+            assert [r["id"] for r in results if isinstance(r, dict)] == [
+                0,
+                1,
+                2,
+                4,
+                5,
+                6,
+            ]
+            assert isinstance(results[3], requests.ConnectionError)
+
+            with pytest.raises(requests.ConnectionError):
+                http_api.call_batch(
+                    [("GET", "dummy", {"id": 3})], return_exceptions=False
+                )
+
+        slots = HostSlots({"localhost:8000": 2})
+
+        assert slots("localhost:8000") is slots("localhost:8000")
+        assert slots("localhost:8000").acquire(blocking=False)
+        assert slots("localhost:8000").acquire(blocking=False)
+        assert not slots("localhost:8000").acquire(blocking=False)
+        assert not isinstance(slots("other"), threading.BoundedSemaphore)
+
+    def test_iter_json_array(self):
+        document = {
+            "links": [{"href": "http://localhost:8000"}],
+            "resources": [{"id": i, "name": "é" * i} for i in range(20)]
+            + [12345, None],
+            "page": {"totalPages": 1},
+        }
+        raw = json.dumps(document).encode()
+
+        for chunk_size in (1, 7, len(raw)):
+            meta = {}
+            chunks = (raw[i : i + chunk_size] for i in range(0, len(raw), chunk_size))
+
+            assert (
+                list(iter_json_array(chunks, "resources", meta))
+                == document["resources"]
+            )
+            assert meta == {"links": document["links"], "page": document["page"]}
+
+        assert list(iter_json_array([b'{"resources": []}'], "resources")) == []
+        assert list(iter_json_array([b"{}"], "resources")) == []
+
+        with pytest.raises(json.JSONDecodeError):
+            list(iter_json_array([b"[1, 2]"], "resources"))
+
+
+class NexposeServer:
+    def __init__(self, assets: dict[int, list[str]], solutions: list[str]):
+        self.assets = assets
+        self.solutions = solutions
+        self.requests: list[str] = []
+        self.fail: dict[str, int] = {}
+        self.failed = threading.Event()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def page(resources: list, page: int, size: int) -> dict:
+        return {
+            "links": [],
+            "page": {
+                "number": page,
+                "size": size,
+                "totalPages": -(-len(resources) // size),
+                "totalResources": len(resources),
+            },
+            "resources": resources[page * size : (page + 1) * size],
+        }
+
+    def __call__(self, request, context):
+        path = request.path.removeprefix("/api/3/")
+
+        with self.lock:
+            self.requests.append(path)
+
+            if self.fail.get(path):
+                self.fail[path] -= 1
+                self.failed.set()
+                context.status_code = 500
+                return {}
+
+        page, size = int(request.qs.get("page", [0])[0]), int(
+            request.qs.get("size", [0])[0]
+        )
+
+        if path == "assets":
+            return self.page([{"id": i} for i in self.assets], page, size)
+
+        parts = path.split("/")
+
+        if parts[0] == "assets":
+            return self.page(
+                [{"id": v} for v in self.assets[int(parts[1])]], page, size
+            )
+
+        if parts[0] == "vulnerabilities" and len(parts) == 3:
+            return {"links": [], "resources": self.solutions}
+
+        return {"id": parts[1]}
+
+    def count(self, path: str) -> int:
+        return self.requests.count(path)
+
+
+@pytest.fixture
+def nexpose():
+    server = NexposeServer({1: ["v1", "v2"], 2: ["v1"], 3: ["v2", "v3"]}, ["s1"])
+    client = NexposeClient("http://nexpose.local", "api/3", default_expiry=DO_NOT_CACHE)
+
+    with requests_mock.Mocker() as m:
+        m.register_uri(
+            requests_mock.ANY, re.compile("http://nexpose.local/"), json=server
+        )
+
+        yield client, server
+
+    client.close()
+
+
+class TestNexpose:
+    def test_enriched_vulnerabilities(self, nexpose):
+        client, server = nexpose
+
+        records = list(
+            client.iter_enriched_vulnerabilities(asset_concurrency=1, batch_size=2)
+        )
+
+        assert [(r.asset.id, r.finding.id, r.vulnerability.id) for r in records] == [
+            (1, "v1", "v1"),
+            (1, "v2", "v2"),
+            (2, "v1", "v1"),
+            (3, "v2", "v2"),
+            (3, "v3", "v3"),
+        ]
+        assert all([s.id for s in r.solutions] == ["s1"] for r in records)
+        # every detail is requested once for the whole run
+        for path in (
+            "vulnerabilities/v1",
+            "vulnerabilities/v1/solutions",
+            "solutions/s1",
+        ):
+            assert server.count(path) == 1
+
+    def test_enriched_vulnerabilities_transient_failure(self, nexpose):
+        client, server = nexpose
+
+        # the solutions of v1 fail once; the failed request is not memoized and requested again
+        server.fail["vulnerabilities/v1/solutions"] = 1
+        get_vulnerability = client.get_vulnerability
+
+        def get_vulnerability_after_failure(vulnerability_id: str):
+            # resolve v1 once its solutions failed, so they are looked up again
+            if vulnerability_id == "v1":
+                server.failed.wait(5)
+                time.sleep(0.05)
+
+            return get_vulnerability(vulnerability_id)
+
+        client.get_vulnerability = get_vulnerability_after_failure
+
+        records = list(
+            client.iter_enriched_vulnerabilities(
+                client.iter_assets(batch_size=2), asset_concurrency=1
+            )
+        )
+
+        assert len(records) == 5
+        assert server.count("vulnerabilities/v1/solutions") == 2
+
+        # a request failing again fails the assets waiting for it
+        server.fail["vulnerabilities/v3"] = 10
+
+        with pytest.raises(requests.HTTPError):
+            list(client.iter_enriched_vulnerabilities(asset_concurrency=1))
+
+
+class PageSource:
+    def __init__(self, total_pages: int, size: int = 2):
+        self.total_pages = total_pages
+        self.size = size
+        self.requested: list[int] = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def response(self, page: int):
+        return SimpleNamespace(
+            page=SimpleNamespace(total_pages=self.total_pages),
+            resources=[page * self.size + i for i in range(self.size)],
+        )
+
+    def delay(self, page: int) -> float:
+        # later pages complete first
+        return 0.01 * (self.total_pages - page) if page else 0
+
+    def __call__(self, page: int):
+        with self.lock:
+            self.requested.append(page)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+        try:
+            time.sleep(self.delay(page))
+            return self.response(page)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    async def aget(self, page: int):
+        self.requested.append(page)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+
+        try:
+            await asyncio.sleep(self.delay(page))
+            return self.response(page)
+        finally:
+            self.active -= 1
+
+
+class TestNexposePages:
+    def test_iter_pages_order(self):
+        source = PageSource(6)
+        client = NexposeClient("http://nexpose.local", "api/3")
+
+        assert list(
+            client._iter_pages(source, 1, 2, prefetch=4, concurrency=3)
+        ) == list(range(1, 12))
+        assert sorted(source.requested) == list(range(6))
+        assert source.max_active <= 3
+
+    def test_iter_pages_early_close(self):
+        source = PageSource(20)
+        client = NexposeClient("http://nexpose.local", "api/3")
+
+        pages = client._iter_pages(source, 0, 2, prefetch=3, concurrency=2)
+
+        assert [next(pages) for _ in range(3)] == [0, 1, 2]
+
+        pages.close()
+        time.sleep(0.3)
+
+        # the first page and the window after the page being consumed, nothing more
+        assert len(source.requested) <= 1 + 3 + 1
+
+    def test_async_iter_pages_order(self):
+        source = PageSource(6)
+
+        async def run():
+            client = AsyncNexposeClient("http://nexpose.local", "api/3")
+
+            return [
+                resource
+                async for resource in client._iter_pages(
+                    source.aget, 1, 2, prefetch=4, concurrency=2
+                )
+            ]
+
+        assert asyncio.run(run()) == list(range(1, 12))
+        assert sorted(source.requested) == list(range(6))
+        # concurrency limits the requests in flight, prefetch only how far ahead they are queued
+        assert source.max_active == 2
+
+    def test_async_iter_pages_early_close(self):
+        source = PageSource(20)
+
+        async def run():
+            client = AsyncNexposeClient("http://nexpose.local", "api/3")
+            pages = client._iter_pages(source.aget, 0, 2, prefetch=3, concurrency=3)
+
+            assert [await anext(pages) for _ in range(3)] == [0, 1, 2]
+
+            await pages.aclose()
+            await asyncio.sleep(0.3)
+
+            # pending pages are cancelled, so nothing is in flight after closing
+            assert source.active == 0
+
+        asyncio.run(run())
+
+        assert len(source.requested) <= 1 + 3 + 1
+
+
+class ChunkedBody(io.RawIOBase):
+    def __init__(self, document, chunk_size: int = 7):
+        self.raw = json.dumps(document).encode()
+        self.chunk_size = chunk_size
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        # never more than chunk_size bytes per read, like a chunked response
+        chunk = self.raw[
+            self.position : self.position + min(len(buffer), self.chunk_size)
+        ]
+        buffer[: len(chunk)] = chunk
+        self.position += len(chunk)
+
+        return len(chunk)
+
+
+def paged_body(resources: list, bodies: list):
+    def body(request, context):
+        page, size = int(request.qs["page"][0]), int(request.qs["size"][0])
+        bodies.append(
+            ChunkedBody(NexposeServer.page([{"id": i} for i in resources], page, size))
+        )
+
+        return bodies[-1]
+
+    return body
+
+
+class TestStreamedJson:
+    def test_stream_items(self):
+        document = {
+            "links": [{"href": "http://localhost:8000"}],
+            "resources": [{"id": i, "name": "x" * i} for i in range(20)],
+            "page": {"totalPages": 1},
+        }
+        body = ChunkedBody(document)
+        api = CachedAPI("http://localhost:8000", "api", default_expiry=DO_NOT_CACHE)
+
+        with requests_mock.Mocker() as m:
+            m.get("http://localhost:8000/api/items", body=body)
+
+            meta = {}
+            items = api.stream_items(api.methods.GET, "items", meta=meta, chunk_size=16)
+
+            assert next(items) == {"id": 0, "name": ""}
+            # the first item is decoded before the body is read completely
+            assert body.position < len(body.raw)
+
+            assert [item["id"] for item in items] == list(range(1, 20))
+            assert body.position == len(body.raw)
+            assert meta == {"links": document["links"], "page": document["page"]}
+
+        api.close()
+
+    def test_session_store_lru(self):
+        api = CachedAPI("http://localhost:8000", "api", max_sessions=1)
+        first = api.get_session()
+
+        with api.override_session_options(expire_after=60):
+            second = api.get_session()
+
+        assert list(api.sessions.values()) == [second]
+        assert api.get_session() is not first
+        assert list(api.sessions.values()) != [second]
+
+        api.close()
+
+    def test_nexpose_stream(self, nexpose):
+        client, _ = nexpose
+        bodies = []
+
+        with requests_mock.Mocker() as m:
+            m.get(
+                "http://nexpose.local/api/3/assets",
+                body=paged_body(list(range(5)), bodies),
+            )
+
+            assets = client.iter_assets(offset=1, batch_size=2, stream=True)
+
+            assert next(assets).id == 1
+            # the next page is only requested once the current one is consumed
+            assert len(bodies) == 1
+            assert [asset.id for asset in assets] == [2, 3, 4]
+
+        assert len(bodies) == 3
+        assert all(b.position == len(b.raw) for b in bodies)
+
+        with pytest.raises(ValueError):
+            next(client.iter_assets(stream=True, prefetch=1))
+
+    def test_confluence_iter_search(self):
+        results = [{"id": str(i), "title": f"page {i}"} for i in range(5)]
+        bodies = []
+
+        def body(request, context):
+            start, limit = int(request.qs["start"][0]), int(request.qs["limit"][0])
+            page = results[start : start + limit]
+            bodies.append(
+                ChunkedBody(
+                    {"results": page, "start": start, "limit": limit, "size": len(page)}
+                )
+            )
+
+            return bodies[-1]
+
+        client = ConfluenceClient(
+            "http://confluence.local", token="token", default_expiry=DO_NOT_CACHE
+        )
+
+        with requests_mock.Mocker() as m:
+            m.get("http://confluence.local/rest/api/search", body=body)
+
+            assert list(client.iter_search("type=page", limit=2)) == results
+            assert m.last_request.headers["Authorization"] == "Bearer token"
+
+        assert len(bodies) == 3
+        assert all(b.position == len(b.raw) for b in bodies)
+
+        client.close()
@@ -0,0 +1,1090 @@
+import asyncio
+import dataclasses
+import json
+import re
+import threading
+import hashlib
+import io
+import os
+
+import httpx
+import pytest
+
+from nldcsc.httpx_apis.base_class.cached_base_class import (
+    AsyncCachedAPI,
+    AsyncCacheTransport,
+    BaseCacheStorage,
+    MemoryCacheStorage,
+    parse_cache_control,
+)
+from nldcsc.httpx_apis.base_class import decoding
+from nldcsc.httpx_apis.base_class.httpx_base_class import HttpxBaseClass
+from nldcsc.http_apis.viper.async_client import AsyncViperClient
+from nldcsc.httpx_apis.dcsctransfer.api import DCSCTransferAPI, hash_page_type
+from nldcsc.httpx_apis.dcsctransfer.hash_cache import (
+    MISSING,
+    BloomFilter,
+    HashCache,
+    ScalableBloomFilter,
+)
+from nldcsc.httpx_apis.dcsctransfer.listing import HashIndex
+from nldcsc.httpx_apis.dcsctransfer.upload import MultipartChunk
+from nldcsc.httpx_apis.base_class.retry import (
+    AsyncRetryTransport,
+    RetryBudget,
+    RetryPolicy,
+    RetryTransport,
+)
+
+
+class CountingHandler:
+    def __init__(self, headers: dict = None, status_code: int = 200):
+        self.headers = headers or {}
+        self.status_code = status_code
+        self.requests: list[httpx.Request] = []
+
+    def __call__(self, request: httpx.Request):
+        self.requests.append(request)
+
+        etag = self.headers.get("ETag")
+
+        if etag and request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304, headers=self.headers)
+
+        return httpx.Response(
+            self.status_code, json={"data": "data"}, headers=self.headers
+        )
+
+
+class MockedCachedApi(AsyncCachedAPI):
+    def __init__(self, handler, **kwargs):
+        super().__init__("http://localhost:8000", api_path="api", **kwargs)
+        self.handler = handler
+
+    def create_transport(self):
+        return httpx.MockTransport(self.handler)
+
+
+class MockedHttpxApi(HttpxBaseClass):
+    def __init__(self, handler, **kwargs):
+        super().__init__("http://localhost:8000", **kwargs)
+        self.handler = handler
+        self.created = 0
+
+    def create_sync_client(self, **kwargs):
+        self.created += 1
+        return httpx.Client(transport=httpx.MockTransport(self.handler), **kwargs)
+
+    def create_async_client(self, **kwargs):
+        self.created += 1
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler), **kwargs)
+
+
+class TestHttpxBaseClass:
+    def test_persistent_client(self):
+        handler = CountingHandler()
+
+        with MockedHttpxApi(handler, use_async_client=False) as api:
+            responses = api.call(api.methods.GET, ["a", "b"])
+            api.call(api.methods.GET, "c")
+
+            assert [r.json() for r in responses] == [{"data": "data"}] * 2
+            assert api.created == 1
+
+            client = api.client
+
+        assert client.is_closed and api._client is None
+        assert len(handler.requests) == 3
+
+    def test_persistent_async_client(self):
+        api = MockedHttpxApi(CountingHandler())
+
+        async def run():
+            async with api:
+                await api.a_call(api.methods.GET, "a")
+                await api.a_call(api.methods.GET, "b")
+
+                assert api.created == 1
+
+                return api.async_client
+
+        client = asyncio.run(run())
+
+        assert client.is_closed
+
+        async def other_loop():
+            async with api:
+                await api.a_call(api.methods.GET, "a")
+                await api.a_call(api.methods.GET, "a")
+
+        asyncio.run(other_loop())
+
+        assert api.created == 2
+
+    def test_concurrent_list_resources(self):
+        active = {"now": 0, "max": 0}
+
+        async def handler(request: httpx.Request):
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+
+            await asyncio.sleep(0.01)
+
+            active["now"] -= 1
+
+            if request.url.path == "/3":
+                raise httpx.ConnectError("refused", request=request)
+
+            return httpx.Response(200, json={"path": request.url.path})
+
+        api = MockedHttpxApi(handler, max_concurrency=3)
+
+        async def run():
+            async with api:
+                return await api.a_call(
+                    api.methods.GET,
+                    [str(i) for i in range(8)],
+                    return_exceptions=True,
+                )
+
+        responses = asyncio.run(run())
+
+        assert active["max"] == 3
+        assert isinstance(responses[3], httpx.ConnectError)
+        assert [
+            r.json()["path"] for r in responses if isinstance(r, httpx.Response)
+        ] == [f"/{i}" for i in range(8) if i != 3]
+
+        sync_api = MockedHttpxApi(
+            lambda request: httpx.Response(200, text=request.url.path),
+            use_async_client=False,
+        )
+
+        with sync_api:
+            responses = sync_api.call(
+                sync_api.methods.GET, [str(i) for i in range(8)], max_concurrency=4
+            )
+
+        assert [r.text for r in responses] == [f"/{i}" for i in range(8)]
+
+    def test_streaming(self, tmp_path):
+        content = b"x" * 100000
+
+        def handler(request: httpx.Request):
+            if request.url.path != "/archive":
+                return httpx.Response(404)
+
+            return httpx.Response(200, content=content)
+
+        sync_api = MockedHttpxApi(handler, use_async_client=False)
+        progress = []
+
+        with sync_api:
+            chunks = list(sync_api.iter_bytes("GET", "archive", chunk_size=40000))
+
+            assert [len(c) for c in chunks] == [40000, 40000, 20000]
+            assert sync_api.call("GET", "archive", stream=True) == content
+
+            result = sync_api.download_to(
+                "archive",
+                tmp_path / "archive",
+                progress=lambda done, total: progress.append((done, total)),
+            )
+
+            assert (tmp_path / "archive").read_bytes() == content
+            assert result.digests["sha256"] == hashlib.sha256(content).hexdigest()
+            assert progress[-1] == (100000, 100000)
+
+            with pytest.raises(httpx.HTTPStatusError):
+                sync_api.download_to("missing", tmp_path / "missing")
+
+            assert not (tmp_path / "missing.part").exists()
+
+        api = MockedHttpxApi(handler)
+
+        async def run():
+            async with api:
+                buffer = io.BytesIO()
+                result = await api.a_download_to("archive", buffer, algorithms=["md5"])
+
+                assert await api.a_call("GET", "archive", stream=True) == content
+                assert buffer.getvalue() == content
+
+                return result
+
+        assert asyncio.run(run()).digests == {"md5": hashlib.md5(content).hexdigest()}
+
+
+@dataclasses.dataclass
+class HashItem:
+    sha256: str
+    size: int = 0
+
+
+class MockedTransferApi(DCSCTransferAPI):
+    def __init__(self, handler):
+        super().__init__("http://localhost:8000", "token", use_async_client=False)
+        self.handler = handler
+
+    def create_sync_client(self, **kwargs):
+        return httpx.Client(transport=httpx.MockTransport(self.handler), **kwargs)
+
+
+class PlainItem:
+    # not a dataclass, so msgspec leaves it to the decode hook
+    def __init__(self, sha256: str, size: int = 0):
+        self.sha256 = sha256
+        self.size = size
+
+
+@pytest.fixture(params=["msgspec", "fallback"])
+def msgspec(request, monkeypatch):
+    """
+    The msgspec module the decoders use; None for the fallback.
+    """
+    if request.param == "msgspec":
+        pytest.importorskip("msgspec")
+    else:
+        monkeypatch.setattr(decoding, "msgspec", None)
+
+    decoding.get_decoder.cache_clear()
+    yield decoding.msgspec
+    monkeypatch.undo()
+    decoding.get_decoder.cache_clear()
+
+
+class TestDecoding:
+    document = b'{"files": [{"sha256": "a", "size": 1, "other": 2}], "start": 0}'
+
+    def test_decode(self, msgspec):
+        page_type = hash_page_type(HashItem)
+
+        assert decoding.decode(self.document)["files"][0]["other"] == 2
+        assert decoding.decode(b'[{"sha256": "a", "size": 1}]', list[HashItem]) == [
+            HashItem("a", 1)
+        ]
+        # unknown keys are ignored
+        assert decoding.decode(self.document, page_type).files == [HashItem("a", 1)]
+        assert decoding.decode(b'{"sha256": "a"}', PlainItem).sha256 == "a"
+
+    def test_decode_errors(self, msgspec):
+        # msgspec validates while decoding, the fallback fails in the constructor
+        error = TypeError if msgspec is None else msgspec.ValidationError
+
+        with pytest.raises(error):
+            decoding.decode(b'[{"size": 1}]', list[HashItem])
+
+        with pytest.raises(ValueError):
+            decoding.decode(b'[{"sha256": "a"', list[HashItem])
+
+    def test_msgspec_decoder(self):
+        msgspec = pytest.importorskip("msgspec")
+
+        class Item(msgspec.Struct):
+            sha256: str
+            size: int = 0
+
+        decoder = decoding.get_decoder(list[HashItem])
+
+        assert isinstance(decoder.__self__, msgspec.json.Decoder)
+        assert decoding.decode(b'[{"sha256": "a"}]', list[Item]) == [Item("a")]
+
+        with pytest.raises(msgspec.ValidationError):
+            decoding.decode(b'[{"sha256": 1}]', list[Item])
+
+        # other classes are built from their decoded value
+        items = decoding.decode(b'[{"sha256": "a", "size": 1}]', list[PlainItem])
+        assert [(i.sha256, i.size) for i in items] == [("a", 1)]
+
+    def test_typed_iter_hashes(self):
+        def handler(request: httpx.Request):
+            start = int(request.url.params["start"])
+            files = [
+                {"sha256": str(i), "size": i} for i in range(start, min(start + 2, 5))
+            ]
+
+            return httpx.Response(200, json={"files": files, "start": start, "size": 2})
+
+        with MockedTransferApi(handler) as api:
+            assert [f["sha256"] for f in api.iter_hashes(2)] == list("01234")
+            assert list(api.iter_hashes(2, item_type=HashItem))[-1] == HashItem("4", 4)
+
+            # typed pages go through the same client mode guard as list_hashes
+            api.use_async_client = True
+
+            with pytest.raises(AttributeError):
+                list(api.iter_hashes(2, item_type=HashItem))
+
+            api.use_async_client = False
+
+            async def a_iter_typed():
+                return [f async for f in api.a_iter_hashes(2, item_type=HashItem)]
+
+            with pytest.raises(AttributeError):
+                asyncio.run(a_iter_typed())
+
+            api.register_response_type("list_hashes", hash_page_type(HashItem))
+
+            assert api.list_hashes(0, 2).files == [HashItem("0", 0), HashItem("1", 1)]
+
+
+class UploadServer:
+    def __init__(
+        self,
+        fail_chunk: tuple[str, int] = None,
+        fail_status: int = None,
+        fail_times: int = None,
+    ):
+        self.fail_chunk = fail_chunk
+        self.fail_status = fail_status
+        self.fail_times = fail_times
+        self.batches = 0
+        self.puts = 0
+        self.chunks: dict[tuple[str, int], bytes] = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, request: httpx.Request):
+        if request.url.path == "/api/uploads/info":
+            return httpx.Response(200, json={"max_chunk_size": 4})
+
+        if request.method == "POST":
+            self.batches += 1
+            files = json.loads(request.content)["files"]
+
+            return httpx.Response(
+                200,
+                json={
+                    "batch_id": "batch",
+                    "expected": [{"file": f, "chunk_id": f"id-{f}"} for f in files],
+                },
+            )
+
+        body = request.read()
+        chunk_id = re.search(rb'name="chunk_id"\r\n\r\n(.*?)\r\n', body)[1].decode()
+        chunk_idx = int(re.search(rb'name="chunk_idx"\r\n\r\n(\d+)', body)[1])
+        content = re.search(rb"octet-stream\r\n\r\n(.*?)\r\n--", body, re.DOTALL)[1]
+
+        if (chunk_id, chunk_idx) == self.fail_chunk and self.fail_times != 0:
+            if self.fail_times is not None:
+                self.fail_times -= 1
+
+            if self.fail_status is not None:
+                return httpx.Response(self.fail_status, json={"detail": "failed"})
+
+            raise httpx.ConnectError("refused", request=request)
+
+        with self.lock:
+            self.puts += 1
+            self.chunks[(chunk_id, chunk_idx)] = content
+
+        return httpx.Response(200, json={"chunk_idx": chunk_idx})
+
+    def file(self, chunk_id: str) -> bytes:
+        return b"".join(
+            content
+            for (cid, _), content in sorted(self.chunks.items())
+            if cid == chunk_id
+        )
+
+
+class TestUpload:
+    def test_parallel_upload_with_resume(self, tmp_path):
+        (tmp_path / "a.bin").write_bytes(b"0123456789abcdefghij")
+        (tmp_path / "b.bin").write_bytes(b"")
+        journal = tmp_path / "journal"
+
+        server = UploadServer(fail_chunk=("id-a.bin", 3))
+
+        with open(tmp_path / "a.bin", "rb") as a, open(tmp_path / "b.bin", "rb") as b:
+            with MockedTransferApi(server) as api:
+                with pytest.raises(httpx.ConnectError):
+                    api.upload_files(a, b, concurrency=3, retries=0, journal=journal)
+
+                assert journal.exists()
+                assert ("id-a.bin", 3) not in server.chunks
+
+                server.fail_chunk = None
+
+                results = api.upload_files(a, b, concurrency=3, journal=journal)
+
+        assert server.batches == 1
+        # uploaded chunks are not sent again when resuming
+        assert server.puts == len(server.chunks) == 6
+        assert server.file("id-a.bin") == b"0123456789abcdefghij"
+        assert server.file("id-b.bin") == b""
+        assert {r["file"] for r in results} == {"a.bin", "b.bin"}
+        # digests cover the chunks uploaded before resuming as well
+        assert {r["file"]: r["digests"]["sha256"] for r in results} == {
+            "a.bin": hashlib.sha256(b"0123456789abcdefghij").hexdigest(),
+            "b.bin": hashlib.sha256(b"").hexdigest(),
+        }
+        assert not journal.exists()
+
+    def test_resume_of_changed_file(self, tmp_path):
+        path = tmp_path / "a.bin"
+        path.write_bytes(b"0123456789abcdefghij")
+        journal = tmp_path / "journal"
+
+        server = UploadServer(fail_chunk=("id-a.bin", 3))
+
+        with open(path, "rb") as a:
+            with MockedTransferApi(server) as api:
+                with pytest.raises(httpx.ConnectError):
+                    api.upload_files(a, concurrency=1, retries=0, journal=journal)
+
+                # edited in place, same size
+                mtime_ns = path.stat().st_mtime_ns
+                with open(path, "r+b") as f:
+                    f.write(b"ABCDEFGHIJ")
+                os.utime(path, ns=(mtime_ns + 10**9, mtime_ns + 10**9))
+
+                server.fail_chunk = None
+                server.chunks.clear()
+                results = api.upload_files(a, concurrency=1, journal=journal)
+
+        # a new batch with every chunk sent again, not the stale ones
+        assert server.batches == 2
+        assert len(server.chunks) == 5
+        assert server.file("id-a.bin") == b"ABCDEFGHIJabcdefghij"
+        assert results[0]["digests"]["sha256"] == (
+            hashlib.sha256(b"ABCDEFGHIJabcdefghij").hexdigest()
+        )
+        assert not journal.exists()
+
+    def test_chunk_error_status(self, tmp_path):
+        (tmp_path / "a.bin").write_bytes(b"0123456789")
+        journal = tmp_path / "journal"
+
+        server = UploadServer(fail_chunk=("id-a.bin", 1), fail_status=503)
+
+        with open(tmp_path / "a.bin", "rb") as a:
+            with MockedTransferApi(server) as api:
+                with pytest.raises(httpx.HTTPStatusError):
+                    api.upload_files(a, retries=1, journal=journal)
+
+                # the failed chunk is not recorded, so the journal is kept to resume from
+                assert journal.exists()
+                assert "id-a.bin" in journal.read_text()
+                assert ("id-a.bin", 1) not in server.chunks
+
+                # a 5xx is retried within the budget of the chunk
+                server.fail_times = 1
+                results = api.upload_files(a, retries=1, journal=journal)
+
+        assert server.file("id-a.bin") == b"0123456789"
+        assert results[0]["digests"]["md5"] == hashlib.md5(b"0123456789").hexdigest()
+        assert not journal.exists()
+
+    def test_digests_of_unmapped_files(self):
+        content = bytes(range(256))
+        handle = io.BytesIO(content)
+        handle.name = "d.bin"
+        server = UploadServer()
+
+        with MockedTransferApi(server) as api:
+            results = api.upload_files(handle, concurrency=8, digests=["sha1"])
+
+        assert server.file("id-d.bin") == content
+        # whole file digests, whatever the order the chunks completed in
+        assert results[0]["digests"] == {"sha1": hashlib.sha1(content).hexdigest()}
+
+    def test_async_parallel_upload(self, tmp_path):
+        import aiofiles
+
+        content = bytes(range(256)) * 4
+        (tmp_path / "c.bin").write_bytes(content)
+        server = UploadServer()
+
+        class AsyncMockedTransferApi(DCSCTransferAPI):
+            def create_async_client(self, **kwargs):
+                return httpx.AsyncClient(
+                    transport=httpx.MockTransport(server), **kwargs
+                )
+
+        async def run():
+            async with AsyncMockedTransferApi("http://localhost:8000", "token") as api:
+                async with aiofiles.open(tmp_path / "c.bin", "rb") as c:
+                    return await api.a_upload_files(c, concurrency=8)
+
+        results = asyncio.run(run())
+
+        assert server.file("id-c.bin") == content
+        assert results == [
+            {
+                "chunk_idx": results[0]["chunk_idx"],
+                "file": "c.bin",
+                "digests": {
+                    "md5": hashlib.md5(content).hexdigest(),
+                    "sha256": hashlib.sha256(content).hexdigest(),
+                },
+            }
+        ]
+
+    def test_multipart_chunk(self):
+        payload = memoryview(b"x" * 10)
+        body = MultipartChunk(
+            {"chunk_idx": 1}, 'a"b.bin', payload, algorithms=["md5"], block_size=3
+        )
+
+        request = httpx.Request(
+            "PUT", "http://localhost:8000/", content=body, headers=body.headers
+        )
+        # generated in blocks, with a known length and replayable
+        content = b"".join(request.stream)
+
+        assert content == b"".join(request.stream)
+        assert len(content) == len(body) == int(request.headers["Content-Length"])
+        assert "Transfer-Encoding" not in request.headers
+        assert body.digests == {"md5": hashlib.md5(b"x" * 10).hexdigest()}
+        assert b'filename="a%22b.bin"' in content
+        assert content.endswith(b"x" * 10 + body.tail)
+
+
+class TestHashCache:
+    def test_search_hashes(self):
+        known = {"a" * 64: {"sha256": "a" * 64}, "b" * 64: {"sha256": "b" * 64}}
+        lookups = []
+
+        def handler(request: httpx.Request):
+            if request.url.path == "/api/hashes/list":
+                start = int(request.url.params["start"])
+                files = list(known.values())[start : start + 2]
+
+                return httpx.Response(
+                    200, json={"files": files, "start": start, "size": 2}
+                )
+
+            value = request.url.path.rsplit("/", 1)[-1]
+            lookups.append(value)
+
+            if value in known:
+                return httpx.Response(200, json=known[value])
+
+            return httpx.Response(404)
+
+        with MockedTransferApi(handler) as api:
+            results = api.search_hashes(["A" * 64, "c" * 64, "a" * 64])
+
+            assert results == {
+                "A" * 64: known["a" * 64],
+                "c" * 64: None,
+                "a" * 64: known["a" * 64],
+            }
+            assert sorted(lookups) == ["a" * 64, "c" * 64]
+
+            # positive and negative results are cached
+            api.search_hashes(["a" * 64, "c" * 64])
+            assert len(lookups) == 2
+
+            bloom = api.preload_hash_filter(fetch_size=2, capacity=1)
+            # grown past the expected capacity while the pages were added
+            assert len(bloom.filters) > 1
+            # certainly unknown according to the filter; a known hash is still looked up
+            results = api.search_hashes(["d" * 64, "b" * 64])
+
+        assert results == {"d" * 64: None, "b" * 64: known["b" * 64]}
+        assert lookups[2:] == ["b" * 64]
+        assert api.hash_cache.stats["bloom_hits"] == 1
+
+    def test_cache_expiry_and_lru(self):
+        now = [0]
+        cache = HashCache(max_entries=2, ttl=10, negative_ttl=1, clock=lambda: now[0])
+
+        cache.set("md5", "a", {"md5": "a"})
+        cache.set("md5", "b", None)
+
+        assert cache.get("md5", "A") == {"md5": "a"}
+        assert cache.get("md5", "b") is None
+
+        now[0] = 5
+        assert cache.get("md5", "b") is MISSING
+
+        cache.set("md5", "c", {})
+        cache.set("md5", "d", {})
+        assert cache.get("md5", "a") is MISSING
+
+        bloom = BloomFilter(1000, 0.01)
+        bloom.update(str(i) for i in range(1000))
+
+        assert all(str(i) in bloom for i in range(1000))
+        assert sum(str(i) in bloom for i in range(1000, 11000)) < 300
+
+        bloom = ScalableBloomFilter(100, 0.01)
+        bloom.update(str(i) for i in range(1000))
+
+        assert len(bloom) == 1000 and len(bloom.filters) == 4
+        assert all(str(i) in bloom for i in range(1000))
+        assert sum(str(i) in bloom for i in range(1000, 11000)) < 300
+
+
+class ListingServer:
+    def __init__(self, count: int, cap: int = None):
+        self.hashes = [
+            hashlib.sha256(str(i).encode()).hexdigest() for i in range(count)
+        ]
+        self.cap = cap
+        self.requests: list[tuple[int, int]] = []
+
+    def __call__(self, request: httpx.Request):
+        start = int(request.url.params["start"])
+        size = int(request.url.params["size"])
+        self.requests.append((start, size))
+
+        if self.cap:
+            size = min(size, self.cap)
+
+        files = [{"sha256": h} for h in self.hashes[start : start + size]]
+
+        return httpx.Response(200, json={"files": files, "start": start, "size": size})
+
+
+class TestHashListing:
+    def test_prefetch_and_adaptive_page_size(self):
+        server = ListingServer(1000, cap=200)
+
+        with MockedTransferApi(server) as api:
+            listed = [f["sha256"] for f in api.iter_hashes(fetch_size=10, prefetch=4)]
+
+        assert listed == server.hashes
+        # the page size grows up to the cap of the server
+        assert max(size for _, size in server.requests) > 200
+        assert len(server.requests) < 1000 / 10
+
+    def test_checkpoint_resume(self, tmp_path):
+        server = ListingServer(50)
+        checkpoint = tmp_path / "checkpoint"
+
+        with MockedTransferApi(server) as api:
+            hashes = api.iter_hashes(
+                fetch_size=10, max_fetch_size=10, checkpoint=checkpoint
+            )
+            first = [next(hashes)["sha256"] for _ in range(15)]
+            hashes.close()
+
+            assert json.loads(checkpoint.read_text()) == {"offset": 10}
+
+            rest = [
+                f["sha256"]
+                for f in api.iter_hashes(fetch_size=10, checkpoint=checkpoint)
+            ]
+
+        assert first[:10] + rest == server.hashes
+        assert not checkpoint.exists()
+
+    def test_async_listing_and_index(self, tmp_path):
+        server = ListingServer(300, cap=64)
+
+        class AsyncMockedTransferApi(DCSCTransferAPI):
+            def create_async_client(self, **kwargs):
+                return httpx.AsyncClient(
+                    transport=httpx.MockTransport(server), **kwargs
+                )
+
+        async def run():
+            async with AsyncMockedTransferApi("http://localhost:8000", "token") as api:
+                return await api.a_write_hash_index(tmp_path / "index", fetch_size=16)
+
+        with asyncio.run(run()) as index:
+            assert len(index) == 300
+            assert all(h in index for h in server.hashes)
+            assert hashlib.sha256(b"x").hexdigest() not in index
+            assert "not a hash" not in index
+
+        assert (tmp_path / "index").stat().st_size == 5 + 300 * 32
+
+        with HashIndex.write(tmp_path / "empty", []) as index:
+            assert len(index) == 0 and server.hashes[0] not in index
+
+
+class TestRetryTransport:
+    def test_retry_statuses(self):
+        statuses = [503, 502, 200, 503]
+
+        def handler(request: httpx.Request):
+            return httpx.Response(statuses.pop(0))
+
+        policy = RetryPolicy(backoff_factor=0)
+        transport = RetryTransport(httpx.MockTransport(handler), policy)
+
+        with httpx.Client(transport=transport) as client:
+            assert client.get("http://localhost:8000/").status_code == 200
+            # POST is not idempotent and not retried
+            assert client.post("http://localhost:8000/").status_code == 503
+
+        stats = policy.stats.snapshot()
+
+        assert stats["requests"] == 2
+        assert stats["retries"] == 2
+        assert stats["reasons"] == {"503": 1, "502": 1}
+
+        policy = RetryPolicy(total=1)
+        transport = AsyncRetryTransport(
+            httpx.MockTransport(
+                lambda request: httpx.Response(429, headers={"Retry-After": "0"})
+            ),
+            policy,
+        )
+
+        async def run():
+            async with httpx.AsyncClient(transport=transport) as client:
+                return await client.get("http://localhost:8000/")
+
+        assert asyncio.run(run()).status_code == 429
+        assert policy.stats.snapshot() == {
+            "requests": 1,
+            "retries": 1,
+            "reasons": {"429": 1},
+            "exhausted": 1,
+            "budget_exhausted": 0,
+        }
+
+    def test_connect_errors_and_budget(self):
+        calls = []
+
+        def handler(request: httpx.Request):
+            calls.append(request)
+            raise httpx.ConnectError("refused", request=request)
+
+        policy = RetryPolicy(
+            total=5,
+            backoff_factor=0,
+            budget=RetryBudget(ratio=0, min_retries_per_second=0.2, ttl=10),
+        )
+
+        with httpx.Client(
+            transport=RetryTransport(httpx.MockTransport(handler), policy)
+        ) as client:
+            with pytest.raises(httpx.ConnectError):
+                client.post("http://localhost:8000/", content=b"data")
+
+        # connect errors are retried for any method, until the budget of 2 retries is spent
+        assert len(calls) == 3
+        assert policy.stats.snapshot()["budget_exhausted"] == 1
+
+    def test_retry_after_too_long(self):
+        policy = RetryPolicy(max_retry_after=10)
+        transport = RetryTransport(
+            httpx.MockTransport(
+                lambda request: httpx.Response(429, headers={"Retry-After": "60"})
+            ),
+            policy,
+        )
+
+        with httpx.Client(transport=transport) as client:
+            assert client.get("http://localhost:8000/").status_code == 429
+
+        assert policy.stats.snapshot()["exhausted"] == 1
+
+    def test_wrapped_transport_does_not_retry(self):
+        api = HttpxBaseClass("http://localhost:8000", retry_policy=RetryPolicy())
+
+        with api.create_sync_client() as client:
+            assert isinstance(client._transport, RetryTransport)
+            assert client._transport.transport._pool._retries == 0
+
+        async def run():
+            async with api.create_async_client() as client:
+                assert isinstance(client._transport, AsyncRetryTransport)
+                assert client._transport.transport._pool._retries == 0
+
+        asyncio.run(run())
+
+        # retries are opt-in
+        api = HttpxBaseClass("http://localhost:8000")
+
+        with api.create_sync_client() as client:
+            assert not isinstance(client._transport, RetryTransport)
+            assert client._transport._pool._retries == 3
+
+        assert api.retry_stats == {}
+
+
+VIPER_ITEMS = {
+    "/v1/admin/audit_log": lambda i: {
+        "id": str(i),
+        "timestamp": i,
+        "username": "user",
+        "user_action": 2,
+        "origin": "test",
+        "affected_resources": {},
+        "description": "request",
+        "tags": [],
+        "request_id": f"request-{i}",
+    },
+    "/v1/admin/async_searches": lambda i: {
+        "id": str(i),
+        "user_id": "user",
+        "created": i,
+        "search_query": {},
+        "task_id": f"task-{i}",
+    },
+    "/v1/oracle_db/search": lambda i: {
+        "db_id": i,
+        "hostname": f"db{i}.example.com",
+        "maintainer": "team",
+        "db_name": f"db{i}",
+        "otap": "P",
+    },
+    "/v1/kpi/async_search/search-id": lambda i: {
+        "name": f"kpi-{i}",
+        "value": str(i),
+        "kpi_type": "int",
+        "timestamp": i,
+        "description": "kpi",
+        "unit": "count",
+    },
+}
+VIPER_ITEMS["/v1/user/async_searches"] = VIPER_ITEMS["/v1/admin/async_searches"]
+
+
+class ViperServer:
+    def __init__(self, total: int = 5):
+        self.total = total
+        self.requests: list[httpx.Request] = []
+
+    def __call__(self, request: httpx.Request):
+        self.requests.append(request)
+
+        if request.url.path == "/v1/auth/login":
+            return httpx.Response(
+                200,
+                json={
+                    "access_token": "token",
+                    "expires_in": 300,
+                    "refresh_token": "refresh",
+                    "refresh_expires_in": 1800,
+                    "token_type": "Bearer",
+                    "id_token": "id",
+                    "scope": "openid",
+                    "session_state": "state",
+                },
+            )
+
+        page = int(request.url.params["page"])
+        size = int(request.url.params["size"])
+        items = range(page * size, min((page + 1) * size, self.total))
+
+        return httpx.Response(
+            200,
+            json={
+                "total": self.total,
+                "page": page,
+                "size": size,
+                # index of the last page
+                "pages": (self.total - 1) // size,
+                "items": [VIPER_ITEMS[request.url.path](i) for i in items],
+            },
+        )
+
+
+class MockedViperClient(AsyncViperClient):
+    def __init__(self, handler):
+        super().__init__("http://localhost:8000", auth=("user", "password"))
+        self.handler = handler
+
+    def create_transport(self):
+        return httpx.MockTransport(self.handler)
+
+
+class TestAsyncViper:
+    @pytest.mark.parametrize(
+        "collection, endpoint, args, attribute",
+        [
+            ("admin", "aiter_audit_log", (), "request_id"),
+            ("admin", "aiter_async_searches", (), "task_id"),
+            ("user", "aiter_async_searches", (), "task_id"),
+            ("oracle_db", "aiter_search", (), "db_name"),
+            ("kpi", "aiter_async_search", ("search-id",), "name"),
+        ],
+    )
+    def test_aiter_collections(self, collection, endpoint, args, attribute):
+        server = ViperServer()
+
+        async def run():
+            async with MockedViperClient(server) as client:
+                aiter = getattr(getattr(client.v1, collection), endpoint)
+
+                return [item async for item in aiter(*args, size=2)]
+
+        items = asyncio.run(run())
+
+        assert len(items) == 5
+        # the items of the generic PaginatedResponse are left as dicts
+        assert len({item[attribute] for item in items}) == 5
+
+        login, *pages = server.requests
+
+        assert login.url.path == "/v1/auth/login"
+        assert [int(r.url.params["page"]) for r in pages] == [0, 1, 2]
+        assert all(r.headers["Authorization"] == "Bearer token" for r in pages)
+
+    def test_iter_needs_sync_client(self):
+        async def run():
+            async with MockedViperClient(ViperServer()) as client:
+                with pytest.raises(TypeError):
+                    next(client.v1.oracle_db.iter_search())
+
+        asyncio.run(run())
+
+
+class TestAsyncCachedApi:
+    def test_parse_cache_control(self):
+        assert parse_cache_control('max-age=60, no-cache, private="x"') == {
+            "max-age": "60",
+            "no-cache": None,
+            "private": "x",
+        }
+        assert parse_cache_control(None) == {}
+
+    def test_build_url(self):
+        api = AsyncCachedAPI("http://localhost:8000/", api_path="/api/")
+
+        assert api.build_url("/resource") == "http://localhost:8000/api/resource"
+        assert (
+            api.build_url("resource", ignore_api_path=True)
+            == "http://localhost:8000/resource"
+        )
+        assert api.build_url(None) == "http://localhost:8000/api"
+
+    def test_cached_call(self):
+        handler = CountingHandler({"Cache-Control": "max-age=60"})
+
+        async def run():
+            async with MockedCachedApi(handler) as api:
+                first = await api.call(api.methods.GET, "dummy")
+                second = await api.call(api.methods.GET, "dummy")
+                response = await api.call(
+                    api.methods.GET, "dummy", unpack_response=False
+                )
+
+                assert first == second == {"data": "data"}
+                assert response.extensions["from_cache"] is True
+                assert len(api.sessions) == 1
+
+        asyncio.run(run())
+
+        assert len(handler.requests) == 1
+        assert handler.requests[0].headers["User-Agent"] == "AsyncCachedApi"
+
+    def test_revalidate_with_etag(self):
+        handler = CountingHandler({"Cache-Control": "no-cache", "ETag": '"v1"'})
+
+        async def run():
+            async with MockedCachedApi(handler) as api:
+                assert await api.call(api.methods.GET, "dummy") == {"data": "data"}
+                assert await api.call(api.methods.GET, "dummy") == {"data": "data"}
+
+        asyncio.run(run())
+
+        assert len(handler.requests) == 2
+        assert handler.requests[1].headers["If-None-Match"] == '"v1"'
+
+    def test_bypass_cache_and_no_store(self):
+        handler = CountingHandler({"Cache-Control": "no-store"})
+
+        async def run():
+            async with MockedCachedApi(handler) as api:
+                await api.call(api.methods.GET, "dummy")
+                await api.call(api.methods.GET, "dummy")
+
+                handler.headers = {"Cache-Control": "max-age=60"}
+
+                await api.call(api.methods.GET, "dummy")
+
+                with api.bypass_cache():
+                    await api.call(api.methods.GET, "dummy")
+
+                await api.call(api.methods.GET, "dummy")
+
+        asyncio.run(run())
+
+        assert len(handler.requests) == 4
+
+    def test_errors_are_raised(self):
+        handler = CountingHandler(status_code=404)
+
+        async def run():
+            async with MockedCachedApi(handler) as api:
+                with pytest.raises(httpx.HTTPStatusError):
+                    await api.call(api.methods.GET, "dummy")
+
+                with pytest.raises(ValueError):
+                    await api.call("options", "dummy")
+
+        asyncio.run(run())
+
+    def test_session_store_lru(self):
+        handler = CountingHandler()
+
+        async def run():
+            async with MockedCachedApi(handler, max_sessions=1) as api:
+                first = await api.get_session()
+
+                with api.override_session_options(expire_after=60):
+                    second = await api.get_session()
+
+                assert first.is_closed and not second.is_closed
+                assert list(api.sessions.values()) == [second]
+
+                with api.override_request_options(headers={"X-Test": "1"}):
+                    options = api.request_options({"timeout": 5}, {"timeout": 1})
+
+                assert options == {
+                    "timeout": 1,
+                    "headers": {"User-Agent": "AsyncCachedApi", "X-Test": "1"},
+                }
+
+        asyncio.run(run())
+
+    def test_memory_storage_lru(self):
+        transport = AsyncCacheTransport(
+            httpx.MockTransport(CountingHandler()),
+            MemoryCacheStorage(max_entries=2),
+            expire_after=-1,
+        )
+
+        async def run():
+            async with httpx.AsyncClient(transport=transport) as client:
+                for resource in ("a", "b", "c"):
+                    await client.get(f"http://localhost:8000/{resource}")
+
+        asyncio.run(run())
+
+        assert len(transport.storage.entries) == 2
+        assert all(
+            entry.expires is None for entry in transport.storage.entries.values()
+        )
+
+    def test_key_separates_credentials_and_variants(self):
+        handler = CountingHandler({"Cache-Control": "max-age=60", "Vary": "Accept"})
+        transport = AsyncCacheTransport(
+            httpx.MockTransport(handler), MemoryCacheStorage()
+        )
+
+        async def run():
+            async with httpx.AsyncClient(transport=transport) as client:
+                url = "http://localhost:8000/resource"
+
+                await client.get(url, headers={"Authorization": "a"})
+                await client.get(url, headers={"Authorization": "a"})
+                await client.get(url, headers={"Authorization": "b"})
+
+                await client.get(url, headers={"Accept": "text/plain"})
+                response = await client.get(url, headers={"Accept": "text/plain"})
+                assert response.extensions["from_cache"] is True
+
+                response = await client.get(url, headers={"Accept": "text/html"})
+                assert response.extensions.get("from_cache") is not True
+
+                handler.headers = {"Cache-Control": "max-age=60", "Vary": "*"}
+
+                await client.get(f"{url}/any")
+                await client.get(f"{url}/any")
+
+        asyncio.run(run())
+
+        assert len(handler.requests) == 6
+
+    def test_storage_is_abstract(self):
+        with pytest.raises(TypeError):
+            BaseCacheStorage()